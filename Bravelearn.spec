@@ -5,7 +5,7 @@ a = Analysis(
     ['app.py'],
     pathex=[],
     binaries=[],
-    datas=[('index.html', '.'), ('catalog.html', '.'), ('course.html', '.'), ('profile.html', '.'), ('static', 'static'), ('styles', 'styles')],
+    datas=[('index.html', '.'), ('content', 'content'), ('catalog.html', '.'), ('course.html', '.'), ('profile.html', '.'), ('static', 'static'), ('styles', 'styles')],
     hiddenimports=[],
     hookspath=[],
     hooksconfig={},
@@ -26,7 +26,7 @@ exe = EXE(
     debug=False,
     bootloader_ignore_signals=False,
     strip=False,
-    upx=True,
+    upx=False,
     upx_exclude=[],
     runtime_tmpdir=None,
     console=False,
@@ -1,404 +1,150 @@
-import eel
-from pathlib import Path
 import sys
-import subprocess
-import textwrap
-from tempfile import NamedTemporaryFile
-from datetime import datetime
 
-from db import get_session, engine
-from models import (
-    Base,
-    User,
-    Course,
-    FavoriteCourse,
-    CourseModule,
-    Lesson,
-    LessonProgress,
-    Task,
-    TaskAttempt,
-)
+# Собранное приложение запускается и как воркер runner.py (runner._worker_command):
+# тогда оно не открывает окно и не загружает остальные модули
+if getattr(sys, "frozen", False):
+    import runner_worker
+
+    if sys.argv[1:2] == [runner_worker.WORKER_FLAG]:
+        del sys.argv[1]
+        runner_worker.main()
+        sys.exit(0)
+
+import startup
+
+with startup.phase("import eel"):
+    import eel
+    import gevent
+    import gevent.queue
+from contextvars import ContextVar
+from functools import wraps
+from pathlib import Path
+import threading
+import traceback
+from datetime import datetime
 
-CURRENT_USER_ID = None
+import metrics
+from config import RUNNER_TIMEOUT
+from jobs import JobQueue, QueueFullError, STATUS_DONE, STATUS_QUEUED, current_job_id
+from runner import check_passed, check_syntax, checker_hash, format_exception_only, get_runner_pool, run_user_code
+
+# SQLAlchemy, модели и всё, что от них зависит, импортируются внутри
+# функций: при запуске они загружаются в фоне (init_backend), пока
+# открывается окно, а эндпоинты ждут готовности БД (_backend_ready).
+
+_job_queue = None
+_EEL_HUB = None
+_window_pushes = gevent.queue.Queue()
+_backend_ready = threading.Event()
+_backend_lock = threading.Lock()
+_backend_error = None
+_backend_thread = None
 if getattr(sys, "frozen", False):
     BASE_DIR = Path(getattr(sys, "_MEIPASS"))
 else:
     BASE_DIR = Path(__file__).resolve().parent
 WEB_DIR = BASE_DIR
+CONTENT_DIR = BASE_DIR / "content"
 
 
-def init_db():
-    Base.metadata.create_all(bind=engine)
-    session = get_session()
+class RequestUser:
+    def __init__(self, user_id=None):
+        self.user_id = user_id
+
+
+# Ученик, от имени которого выполняется вызов. В окне он один на процесс
+# (_desktop_user); server.py выполняет каждый HTTP-запрос со своим
+# RequestUser, восстановленным по токену сессии.
+_desktop_user = RequestUser()
+_request_user = ContextVar("bravelearn_request_user", default=_desktop_user)
+
+
+def current_user_id():
+    return _request_user.get().user_id
+
+
+def call_as(user: RequestUser, function, *args):
+    # Вызов эндпоинта от имени ученика HTTP-запроса (server.py); api_login
+    # внутри вызова меняет user.user_id
+    token = _request_user.set(user)
     try:
-        if not session.query(Course).first():
-            seed_courses(session)
-            session.commit()
+        return function(*args)
     finally:
-        session.close()
+        _request_user.reset(token)
+
+
+# Реестр эндпоинтов: всё, что доступно из static/app.js, в том числе
+# через api_batch
+API = {}
+# Эндпоинты, которые пишут в БД: api_batch берёт блокировку записи, только
+# если в пакете есть один из них
+WRITE_API = frozenset(
+    {
+        "api_login",
+        "api_toggle_favorite",
+        "api_mark_lesson_completed",
+        "api_mark_lessons_completed",
+        "api_import_progress",
+        "api_run_python",
+    }
+)
 
 
-def seed_courses(session):
-    courses = [
-        Course(
-            id=1,
-            title="Frontend‑разработчик с нуля",
-            description="HTML, CSS, JavaScript и адаптивная вёрстка.",
-            long_description="Подробная программа по основам веб‑разработки: семантическая вёрстка, адаптивный дизайн, работа с макетами, базовый JavaScript и подготовка портфолио‑проекта.",
-            category="Программирование",
-            duration="4,5 месяца",
-            level="Начинающий",
-            image_path="./static/photo1.jpg",
-            materials_path="./static/materials/Course1.zip",
-            is_popular=True,
-        ),
-        Course(
-            id=2,
-            title="UX/UI‑дизайн цифровых продуктов",
-            description="Исследование пользователей, прототипирование и Figma.",
-            long_description="Курс по созданию удобных интерфейсов: исследование аудитории, CJM, прототипы, дизайн‑системы и подготовка кейса в портфолио в Figma.",
-            category="Дизайн",
-            duration="3 месяца",
-            level="Продолжающий",
-            image_path="./static/photo3.jpg",
-            materials_path="./static/materials/Course1.zip",
-            is_popular=True,
-        ),
-        Course(
-            id=3,
-            title="Аналитик данных",
-            description="SQL, BI‑инструменты и построение дашбордов для бизнеса.",
-            long_description="Практический курс по аналитике данных: SQL, основы статистики, построение отчётов и дашбордов в BI‑инструментах и аналитический проект.",
-            category="Аналитика",
-            duration="4 месяца",
-            level="Начинающий",
-            image_path="./static/photo4.jpg",
-            materials_path="./static/materials/Course1.zip",
-            is_popular=True,
-        ),
-        Course(
-            id=4,
-            title="Backend на Python",
-            description="Django, REST API и базы данных.",
-            long_description="Практический курс по серверной разработке: Django, DRF, ORM, аутентификация, деплой и работа с БД.",
-            category="Программирование",
-            duration="5 месяцев",
-            level="Продолжающий",
-            image_path="./static/photo2.jpg",
-            materials_path="./static/materials/Course1.zip",
-            is_popular=False,
-        ),
-        Course(
-            id=5,
-            title="Digital‑маркетолог",
-            description="Стратегия продвижения и аналитика кампаний.",
-            long_description="Онлайн‑маркетинг от стратегии до аналитики: работа с каналами трафика, креативами, воронками и метриками эффективности.",
-            category="Маркетинг",
-            duration="3,5 месяца",
-            level="Продолжающий",
-            image_path="./static/photo5.jpg",
-            materials_path="./static/materials/Course1.zip",
-            is_popular=False,
-        ),
-        Course(
-            id=6,
-            title="Fullstack‑разработчик",
-            description="Frontend + backend для комплексных веб‑приложений.",
-            long_description="Комплексная программа: современный frontend и backend, работа с API, БД и деплоем боевого приложения.",
-            category="Программирование",
-            duration="6 месяцев",
-            level="Интенсив",
-            image_path="./static/photo6.jpg",
-            materials_path="./static/materials/Course1.zip",
-            is_popular=False,
-        ),
-    ]
-    session.add_all(courses)
-
-    # Модули для всех курсов
-    modules = [
-        # Frontend‑разработчик с нуля (course_id=1)
-        CourseModule(id=1, course_id=1, title="Основы HTML и верстки", order_index=1),
-        CourseModule(id=2, course_id=1, title="Современный CSS", order_index=2),
-        CourseModule(id=3, course_id=1, title="Введение в JavaScript", order_index=3),
-
-        # UX/UI‑дизайн цифровых продуктов (course_id=2)
-        CourseModule(id=4, course_id=2, title="Исследование пользователей", order_index=1),
-        CourseModule(id=5, course_id=2, title="Прототипирование и интерфейсы", order_index=2),
-
-        # Аналитик данных (course_id=3)
-        CourseModule(id=6, course_id=3, title="Основы SQL", order_index=1),
-        CourseModule(id=7, course_id=3, title="Отчеты и дашборды", order_index=2),
-
-        # Backend на Python (course_id=4)
-        CourseModule(id=8, course_id=4, title="Введение в Python backend", order_index=1),
-        CourseModule(id=9, course_id=4, title="Работа с веб‑фреймворком", order_index=2),
-
-        # Digital‑маркетолог (course_id=5)
-        CourseModule(id=10, course_id=5, title="Основы digital‑стратегии", order_index=1),
-        CourseModule(id=11, course_id=5, title="Реклама и аналитика", order_index=2),
-
-        # Fullstack‑разработчик (course_id=6)
-        CourseModule(id=12, course_id=6, title="Frontend для fullstack", order_index=1),
-        CourseModule(id=13, course_id=6, title="Backend и API", order_index=2),
-    ]
-    session.add_all(modules)
-
-    # Уроки для всех модулей (минимальная теория по каждому направлению)
-    lessons = [
-        # Frontend: HTML
-        Lesson(
-            id=1,
-            module_id=1,
-            title="Структура HTML‑страницы",
-            order_index=1,
-            content=(
-                "<p>Разберём базовую структуру HTML‑документа: теги <code>&lt;html&gt;</code>, <code>&lt;head&gt;</code>, <code>&lt;body&gt;</code>.</p>"
-                "<p>Поймём, что такое семантическая верстка и зачем нужны теги <code>&lt;header&gt;</code>, <code>&lt;main&gt;</code>, <code>&lt;footer&gt;</code>.</p>"
-            ),
-        ),
-        Lesson(
-            id=2,
-            module_id=1,
-            title="Текст, списки и ссылки",
-            order_index=2,
-            content=(
-                "<p>Добавляем контент на страницу: параграфы, заголовки, списки и ссылки.</p>"
-                "<pre><code>&lt;h1&gt;Bravelearn&lt;/h1&gt;\n&lt;p&gt;Онлайн‑курсы для развития карьеры&lt;/p&gt;</code></pre>"
-            ),
-        ),
-
-        # Frontend: CSS
-        Lesson(
-            id=3,
-            module_id=2,
-            title="Подключение CSS и каскад",
-            order_index=1,
-            content=(
-                "<p>Подключаем стили к странице: встроенные, внутренние и внешние CSS‑файлы.</p>"
-                "<p>Разбираем базовую терминологию: селекторы, свойства, каскад и специфичность.</p>"
-            ),
-        ),
-        Lesson(
-            id=4,
-            module_id=2,
-            title="Flexbox и сетка", 
-            order_index=2,
-            content=(
-                "<p>Изучаем современный способ раскладки интерфейса через Flexbox.</p>"
-                "<pre><code>.container { display: flex; gap: 16px; }</code></pre>"
-            ),
-        ),
-
-        # Frontend: JavaScript
-        Lesson(
-            id=5,
-            module_id=3,
-            title="Введение в JavaScript", 
-            order_index=1,
-            content=(
-                "<p>Подключаем JavaScript на страницу и пишем первый скрипт.</p>"
-                "<pre><code>console.log('Привет из Bravelearn!');</code></pre>"
-            ),
-        ),
-
-        # UX/UI: исследования
-        Lesson(
-            id=6,
-            module_id=4,
-            title="Целевая аудитория и гипотезы", 
-            order_index=1,
-            content=(
-                "<p>Учимся описывать целевую аудиторию и формулировать продуктовые гипотезы.</p>"
-                "<p>Разбираем примеры пользовательских интервью.</p>"
-            ),
-        ),
-        Lesson(
-            id=7,
-            module_id=4,
-            title="Карта пути пользователя (CJM)", 
-            order_index=2,
-            content=(
-                "<p>Строим карту пути пользователя от первого касания до целевого действия.</p>"
-            ),
-        ),
-
-        # UX/UI: прототипы
-        Lesson(
-            id=8,
-            module_id=5,
-            title="Низкоуровневые прототипы", 
-            order_index=1,
-            content=(
-                "<p>Делаем быстрованные прототипы экранов на бумаге или в Figma.</p>"
-            ),
-        ),
-
-        # Аналитик данных: SQL
-        Lesson(
-            id=9,
-            module_id=6,
-            title="SELECT и фильтрация", 
-            order_index=1,
-            content=(
-                "<p>Учимся выбирать данные из таблиц с помощью оператора <code>SELECT</code>.</p>"
-                "<pre><code>SELECT * FROM users WHERE city = 'Москва';</code></pre>"
-            ),
-        ),
-        Lesson(
-            id=10,
-            module_id=6,
-            title="Группировка и агрегаты", 
-            order_index=2,
-            content=(
-                "<p>Подсчитываем агрегаты с помощью <code>GROUP BY</code>, <code>COUNT</code>, <code>SUM</code>.</p>"
-            ),
-        ),
-
-        # Аналитик данных: дашборды
-        Lesson(
-            id=11,
-            module_id=7,
-            title="Основы BI‑дашбордов", 
-            order_index=1,
-            content=(
-                "<p>Разбираем принципы визуализации данных и типы графиков.</p>"
-            ),
-        ),
-
-        # Backend на Python: основы языка
-        Lesson(
-            id=12,
-            module_id=8,
-            title="Знакомство с Python", 
-            order_index=1,
-            content=(
-                "<p>В этом уроке вы настроите окружение и напишете первую программу на Python.</p>"
-                "<p>Python — интерпретируемый язык программирования, который отлично подходит для backend‑разработки.</p>"
-            ),
-        ),
-        Lesson(
-            id=13,
-            module_id=8,
-            title="Переменные и типы данных", 
-            order_index=2,
-            content=(
-                "<p>Разберём базовые типы данных: числа, строки, списки и словари.</p>"
-                "<pre><code>name = 'Bravelearn'\nprint('Привет,', name)</code></pre>"
-            ),
-        ),
-
-        # Backend на Python: веб‑фреймворк
-        Lesson(
-            id=14,
-            module_id=9,
-            title="Что такое backend и API", 
-            order_index=1,
-            content=(
-                "<p>Объясняем, чем занимается backend‑разработчик и что такое REST API.</p>"
-            ),
-        ),
-
-        # Digital‑маркетолог
-        Lesson(
-            id=15,
-            module_id=10,
-            title="Маркетинговая воронка", 
-            order_index=1,
-            content=(
-                "<p>Разбираем этапы воронки: осведомлённость, интерес, решение и покупка.</p>"
-            ),
-        ),
-        Lesson(
-            id=16,
-            module_id=11,
-            title="Основы веб‑аналитики", 
-            order_index=1,
-            content=(
-                "<p>Какие метрики важно отслеживать: CTR, CPC, CPA, ROI.</p>"
-            ),
-        ),
-
-        # Fullstack‑разработчик
-        Lesson(
-            id=17,
-            module_id=12,
-            title="Архитектура SPA", 
-            order_index=1,
-            content=(
-                "<p>Разбираем, чем одностраничные приложения отличаются от многостраничных.</p>"
-            ),
-        ),
-        Lesson(
-            id=18,
-            module_id=13,
-            title="Связь frontend и backend", 
-            order_index=1,
-            content=(
-                "<p>Понимаем, как фронтенд и бэкенд обмениваются данными по HTTP и через JSON.</p>"
-            ),
-        ),
-    ]
-    session.add_all(lessons)
-
-    # Практические задания для технических курсов
-    tasks = [
-        # Backend: функция приветствия (как и раньше)
-        Task(
-            id=1,
-            lesson_id=13,
-            title="Напишите функцию приветствия",
-            description=(
-                "Напишите функцию <code>greet(name)</code>, которая возвращает строку "
-                "<code>'Привет, {name}!'</code>."
-            ),
-            starter_code=textwrap.dedent(
-                """\
-                def greet(name):
-                    # TODO: реализуйте функцию
-                    pass
-                """
-            ),
-            checker_code=textwrap.dedent(
-                """\
-                assert greet('Мир') == 'Привет, Мир!'
-                assert greet('Bravelearn') == 'Привет, Bravelearn!'
-                print('OK')
-                """
-            ),
-        ),
-        # Fullstack: форматирование имени
-        Task(
-            id=2,
-            lesson_id=18,
-            title="Форматирование имени пользователя",
-            description=(
-                "Реализуйте функцию <code>format_user(full_name)</code>, которая принимает строку "
-                "вида <code>'имя фамилия'</code> и возвращает её в формате <code>'Фамилия, Имя'</code>."
-            ),
-            starter_code=textwrap.dedent(
-                """\
-                def format_user(full_name: str) -> str:
-                    # Разбейте строку по пробелу и верните в формате 'Фамилия, Имя'
-                    pass
-                """
-            ),
-            checker_code=textwrap.dedent(
-                """\
-                assert format_user('Иван Петров') == 'Петров, Иван'
-                assert format_user('Anna Smith') == 'Smith, Anna'
-                print('OK')
-                """
-            ),
-        ),
-    ]
-    session.add_all(tasks)
+def api(function):
+    @wraps(function)
+    def endpoint(*args, **kwargs):
+        if not _backend_ready.is_set():
+            _wait_backend()
+        return function(*args, **kwargs)
 
+    if metrics.ENABLED:
+        endpoint = metrics.timed(function.__name__, endpoint)
+    API[function.__name__] = endpoint
+    return eel.expose(endpoint)
 
-@eel.expose
+
+def _wait_backend():
+    if _backend_thread is None:
+        init_backend()
+    # Вызов пришёл, пока БД готовится: ждём, не блокируя цикл gevent
+    while not _backend_ready.is_set():
+        gevent.sleep(0.01)
+    if _backend_error is not None:
+        raise RuntimeError("Не удалось подготовить базу данных") from _backend_error
+
+
+def init_db():
+    from sqlalchemy import select
+
+    from content_cache import get_content_cache
+    from content_pack import import_pack
+    from db import content_attached, engine
+    from migrations import upgrade
+    from models import Course
+    from search import sync_index
+
+    with startup.phase("migrations"):
+        upgrade(engine)
+    with startup.phase("seed check"):
+        with engine.connect() as conn:
+            has_courses = (
+                content_attached(conn) and conn.execute(select(Course.__table__.c.id).limit(1)).first() is not None
+            )
+    if not has_courses:
+        with startup.phase("seed"):
+            # Пустая БД контента собирается из пакета контента из поставки
+            import_pack(engine, CONTENT_DIR)
+            get_content_cache().invalidate()
+    with startup.phase("search index"):
+        sync_index(engine)
+
+
+@api
 def api_login(username: str, password: str):
-    global CURRENT_USER_ID
-    session = get_session()
+    from db import open_session
+    from models import User
+
+    session = open_session()
     try:
         user = session.query(User).filter_by(username=username).first()
         if user is None:
@@ -407,255 +153,319 @@ def api_login(username: str, password: str):
             session.commit()
         elif user.password != password:
             return {"ok": False, "error": "Неверный пароль"}
-        CURRENT_USER_ID = user.id
+        _request_user.get().user_id = user.id
         return {"ok": True, "user": {"id": user.id, "username": user.username}}
     finally:
         session.close()
 
 
-@eel.expose
+@api
 def api_get_current_user():
-    if CURRENT_USER_ID is None:
+    from db import open_session
+    from models import User
+
+    user_id = current_user_id()
+    if user_id is None:
         return None
-    session = get_session()
+    session = open_session()
     try:
-        user = session.get(User, CURRENT_USER_ID)
+        user = session.get(User, user_id)
         if not user:
             return None
         fav_ids = {f.course_id for f in user.favorites}
         return {
             "id": user.id,
             "username": user.username,
-            "password": user.password,
             "favorite_course_ids": list(fav_ids),
         }
     finally:
         session.close()
 
 
-@eel.expose
+@api
 def api_get_courses():
-    session = get_session()
+    # Каталог берётся из кэша контента; из БД читаются только id избранных
+    # курсов пользователя (по индексу favorite_courses).
+    from content_cache import favorite_course_ids, get_content_cache
+    from db import connect
+
+    user_id = current_user_id()
+    fav_ids = set()
+    if user_id is not None:
+        with connect() as conn:
+            fav_ids = favorite_course_ids(conn, user_id)
+    return get_content_cache().catalog(fav_ids)
+
+
+@api
+def api_query_catalog(params: dict | None = None):
+    # Серверная фильтрация и постраничная выдача каталога (keyset-курсор)
+    from catalog import CatalogQueryError, query_catalog
+    from db import connect
+
+    params = params or {}
     try:
-        courses = session.query(Course).all()
-        result = []
-        fav_ids = set()
-        if CURRENT_USER_ID is not None:
-            user = session.get(User, CURRENT_USER_ID)
-            fav_ids = {f.course_id for f in user.favorites}
-        for c in courses:
-            result.append(
-                {
-                    "id": c.id,
-                    "title": c.title,
-                    "description": c.description,
-                    "category": c.category,
-                    "duration": c.duration,
-                    "level": c.level,
-                    "image_path": c.image_path,
-                    "is_popular": c.is_popular,
-                    "is_favorite": c.id in fav_ids,
-                }
+        with connect() as conn:
+            result = query_catalog(
+                conn,
+                user_id=current_user_id(),
+                category=params.get("category") or None,
+                level=params.get("level") or None,
+                popular=params.get("popular"),
+                favorites_only=params.get("favorites_only"),
+                sort=params.get("sort") or "id",
+                cursor=params.get("cursor") or None,
+                limit=params.get("limit"),
             )
-        return result
-    finally:
-        session.close()
+    except CatalogQueryError as exc:
+        return {"ok": False, "error": str(exc)}
+    return {"ok": True, **result}
 
 
-@eel.expose
+@api
+def api_search(query: str, limit: int = 20):
+    # Полнотекстовый поиск по курсам, модулям и урокам (FTS5, bm25)
+    from content_cache import get_content_cache
+    from db import connect
+    from search import ensure_index, search
+
+    if not ensure_index(get_content_cache().snapshot().version):
+        return {"ok": False, "error": "Поиск недоступен"}
+    with connect() as conn:
+        hits = search(conn, query, limit)
+    return {"ok": True, "hits": hits}
+
+
+@api
 def api_toggle_favorite(course_id: int):
-    if CURRENT_USER_ID is None:
+    from db import unit_of_work
+    from user_state import toggle_favorite
+
+    user_id = current_user_id()
+    if user_id is None:
         return {"ok": False, "error": "Необходима авторизация"}
-    session = get_session()
-    try:
-        fav = (
-            session.query(FavoriteCourse)
-            .filter_by(user_id=CURRENT_USER_ID, course_id=course_id)
-            .first()
-        )
-        if fav:
-            session.delete(fav)
-            session.commit()
-            return {"ok": True, "is_favorite": False}
-        else:
-            session.add(FavoriteCourse(user_id=CURRENT_USER_ID, course_id=course_id))
-            session.commit()
-            return {"ok": True, "is_favorite": True}
-    finally:
-        session.close()
+    with unit_of_work(write=True) as conn:
+        is_favorite = toggle_favorite(conn, user_id, course_id)
+    if is_favorite is None:
+        return {"ok": False, "error": "Курс не найден"}
+    return {"ok": True, "is_favorite": is_favorite}
 
 
-@eel.expose
+@api
 def api_get_course(course_id: int):
-    session = get_session()
-    try:
-        course = session.get(Course, course_id)
-        if not course:
-            return None
-        return {
-            "id": course.id,
-            "title": course.title,
-            "description": course.description,
-            "long_description": course.long_description,
-            "category": course.category,
-            "duration": course.duration,
-            "level": course.level,
-            "image_path": course.image_path,
-            "materials_path": course.materials_path,
-        }
-    finally:
-        session.close()
+    from content_cache import get_content_cache
 
+    return get_content_cache().course(course_id)
 
-@eel.expose
+
+@api
 def api_get_course_structure(course_id: int):
-    session = get_session()
-    try:
-        course = session.get(Course, course_id)
-        if not course:
-            return None
+    # Скелет курса кэшируется; на запрос приходится один индексный запрос
+    # к lesson_progresses за пройденными уроками пользователя.
+    from content_cache import completed_lesson_ids, get_content_cache
+    from db import connect
+
+    cache = get_content_cache()
+    tree = cache.course_tree(course_id)
+    if tree is None:
+        return None
+    user_id = current_user_id()
+    completed_ids = set()
+    if user_id is not None:
+        with connect() as conn:
+            completed_ids = completed_lesson_ids(conn, user_id, tree.lesson_ids)
+    return cache.course_structure(tree, completed_ids)
 
-        modules = (
-            session.query(CourseModule)
-            .filter_by(course_id=course_id)
-            .order_by(CourseModule.order_index, CourseModule.id)
-            .all()
-        )
 
-        module_ids = [m.id for m in modules]
-        lessons = []
-        if module_ids:
-            lessons = (
-                session.query(Lesson)
-                .filter(Lesson.module_id.in_(module_ids))
-                .order_by(Lesson.module_id, Lesson.order_index, Lesson.id)
-                .all()
-            )
+def _lesson_data(session, lesson_id: int):
+    from sqlalchemy.orm import undefer, undefer_group
 
-        progress_map = {}
-        if CURRENT_USER_ID is not None and lessons:
-            lp_rows = (
-                session.query(LessonProgress)
-                .filter(
-                    LessonProgress.user_id == CURRENT_USER_ID,
-                    LessonProgress.lesson_id.in_([l.id for l in lessons]),
-                )
-                .all()
-            )
-            for lp in lp_rows:
-                progress_map[lp.lesson_id] = lp.is_completed
-
-        lessons_by_module = {}
-        for lesson in lessons:
-            lessons_by_module.setdefault(lesson.module_id, []).append(
-                {
-                    "id": lesson.id,
-                    "title": lesson.title,
-                    "order_index": lesson.order_index,
-                    "is_completed": progress_map.get(lesson.id, False),
-                }
-            )
+    from models import Lesson, LessonProgress, Task
 
-        total_lessons = len(lessons)
-        completed = sum(1 for l in lessons if progress_map.get(l.id, False))
-        progress_percent = int((completed / total_lessons) * 100) if total_lessons else 0
+    lesson = session.get(Lesson, lesson_id, options=[undefer(Lesson.content)])
+    if not lesson:
+        return None
 
-        return {
-            "course": {
-                "id": course.id,
-                "title": course.title,
-            },
-            "progress_percent": progress_percent,
-            "modules": [
-                {
-                    "id": m.id,
-                    "title": m.title,
-                    "order_index": m.order_index,
-                    "lessons": lessons_by_module.get(m.id, []),
-                }
-                for m in modules
-            ],
+    task = (
+        session.query(Task)
+        .options(undefer_group("task_text"))
+        .filter_by(lesson_id=lesson_id)
+        .order_by(Task.id)
+        .first()
+    )
+
+    task_data = None
+    if task is not None:
+        task_data = {
+            "id": task.id,
+            "title": task.title,
+            "description": task.description,
+            "starter_code": task.starter_code,
         }
-    finally:
-        session.close()
 
-
-@eel.expose
-def api_get_lesson(lesson_id: int):
-    session = get_session()
-    try:
-        lesson = session.get(Lesson, lesson_id)
-        if not lesson:
-            return None
-
-        task = (
-            session.query(Task)
-            .filter_by(lesson_id=lesson_id)
-            .order_by(Task.id)
+    user_id = current_user_id()
+    is_completed = False
+    if user_id is not None:
+        lp = (
+            session.query(LessonProgress)
+            .filter_by(user_id=user_id, lesson_id=lesson_id)
             .first()
         )
+        if lp:
+            is_completed = lp.is_completed
 
-        task_data = None
-        if task is not None:
-            task_data = {
-                "id": task.id,
-                "title": task.title,
-                "description": task.description,
-                "starter_code": task.starter_code,
-            }
+    return {
+        "id": lesson.id,
+        "title": lesson.title,
+        "content_html": lesson.content or "",
+        "is_completed": is_completed,
+        "task": task_data,
+    }
 
-        is_completed = False
-        if CURRENT_USER_ID is not None:
-            lp = (
-                session.query(LessonProgress)
-                .filter_by(user_id=CURRENT_USER_ID, lesson_id=lesson_id)
-                .first()
-            )
-            if lp:
-                is_completed = lp.is_completed
 
-        return {
-            "id": lesson.id,
-            "title": lesson.title,
-            "content_html": lesson.content or "",
-            "is_completed": is_completed,
-            "task": task_data,
-        }
+@api
+def api_get_lesson(lesson_id: int):
+    from db import open_session
+
+    session = open_session()
+    try:
+        return _lesson_data(session, lesson_id)
     finally:
         session.close()
 
 
-@eel.expose
+@api
+def api_get_course_page(course_id: int, lesson_id: int | None = None):
+    # Всё, что нужно course.html при открытии, за один вызов и в одной
+    # транзакции: курс и дерево из кэша контента, прогресс, избранное и
+    # выбранный урок с заданием из БД. Без lesson_id выбирается первый
+    # непройденный урок (или первый урок курса).
+    from content_cache import completed_lesson_ids, favorite_course_ids, get_content_cache
+    from db import open_session, unit_of_work
+
+    cache = get_content_cache()
+    course = cache.course(course_id)
+    tree = cache.course_tree(course_id)
+    if course is None or tree is None:
+        return {"ok": False, "error": "Курс не найден"}
+
+    user_id = current_user_id()
+    with unit_of_work() as conn:
+        completed_ids = completed_lesson_ids(conn, user_id, tree.lesson_ids)
+        is_favorite = course_id in favorite_course_ids(conn, user_id)
+        if lesson_id not in tree.lesson_ids:
+            lesson_id = next(
+                (i for i in tree.lesson_ids if i not in completed_ids),
+                tree.lesson_ids[0] if tree.lesson_ids else None,
+            )
+        lesson = None
+        if lesson_id is not None:
+            session = open_session()
+            try:
+                lesson = _lesson_data(session, lesson_id)
+            finally:
+                session.close()
+
+    return {
+        "ok": True,
+        "course": course,
+        "is_favorite": is_favorite,
+        "structure": cache.course_structure(tree, completed_ids),
+        "lesson": lesson,
+    }
+
+
+@api
+def api_batch(calls: list):
+    # Несколько вызовов api_* за один обмен по websocket:
+    #   [{"name": "api_mark_lesson_completed", "args": [5]},
+    #    {"name": "api_get_course_structure", "args": [1]}]
+    # Вызовы выполняются по порядку в одной транзакции; исключение в любом
+    # из них откатывает весь пакет. Пакет только из чтений не ждёт
+    # блокировку записи (WRITE_API).
+    from db import unit_of_work
+
+    results = []
+    write = any(isinstance(call, dict) and call.get("name") in WRITE_API for call in calls or [])
+    with unit_of_work(write=write):
+        for call in calls or []:
+            name = call.get("name")
+            handler = API.get(name)
+            if handler is None or handler is api_batch:
+                results.append({"ok": False, "error": f"Неизвестный вызов: {name}"})
+                continue
+            results.append({"ok": True, "result": handler(*call.get("args", []))})
+    return {"ok": True, "results": results}
+
+
+@api
 def api_mark_lesson_completed(lesson_id: int):
-    if CURRENT_USER_ID is None:
+    from db import unit_of_work
+    from user_state import mark_lessons_completed
+
+    user_id = current_user_id()
+    if user_id is None:
         return {"ok": False, "error": "Необходима авторизация"}
-    session = get_session()
-    try:
-        lesson = session.get(Lesson, lesson_id)
-        if not lesson:
-            return {"ok": False, "error": "Урок не найден"}
+    with unit_of_work(write=True) as conn:
+        marked = mark_lessons_completed(conn, user_id, [lesson_id])
+    if not marked:
+        return {"ok": False, "error": "Урок не найден"}
+    return {"ok": True}
 
-        lp = (
-            session.query(LessonProgress)
-            .filter_by(user_id=CURRENT_USER_ID, lesson_id=lesson_id)
-            .first()
-        )
-        if not lp:
-            lp = LessonProgress(user_id=CURRENT_USER_ID, lesson_id=lesson_id)
-            session.add(lp)
-        lp.is_completed = True
-        lp.completed_at = datetime.utcnow()
-        session.commit()
-        return {"ok": True}
-    finally:
-        session.close()
 
+@api
+def api_mark_lessons_completed(lesson_ids: list):
+    # Отметка нескольких уроков одним executemany в одной транзакции
+    from db import unit_of_work
+    from user_state import mark_lessons_completed
 
-@eel.expose
+    user_id = current_user_id()
+    if user_id is None:
+        return {"ok": False, "error": "Необходима авторизация"}
+    with unit_of_work(write=True) as conn:
+        marked = mark_lessons_completed(conn, user_id, [int(i) for i in lesson_ids or []])
+    return {"ok": True, "marked": marked}
+
+
+@api
+def api_import_progress(records: list):
+    # Импорт своего прогресса: [{"lesson_id", "completed_at"?, "user_id"?}];
+    # completed_at — строка ISO 8601, user_id — только свой. Прогресс группы
+    # импортирует python user_state.py import.
+    from db import unit_of_work
+    from user_state import import_progress
+
+    user_id = current_user_id()
+    if user_id is None:
+        return {"ok": False, "error": "Необходима авторизация"}
+    try:
+        rows = [
+            dict(
+                record,
+                user_id=int(record.get("user_id", user_id)),
+                completed_at=datetime.fromisoformat(record["completed_at"]) if record.get("completed_at") else None,
+            )
+            for record in records or []
+        ]
+        if any(row["user_id"] != user_id for row in rows):
+            return {"ok": False, "error": "Можно импортировать только свой прогресс"}
+        with unit_of_work(write=True) as conn:
+            imported = import_progress(conn, rows)
+    except (AttributeError, KeyError, TypeError, ValueError):
+        return {"ok": False, "error": "Некорректные записи прогресса"}
+    return {"ok": True, "imported": imported, "skipped": len(rows) - imported}
+
+
+@api
 def api_get_task(task_id: int):
-    session = get_session()
+    from sqlalchemy.orm import undefer_group
+
+    from db import open_session
+    from models import Task
+
+    session = open_session()
     try:
-        task = session.get(Task, task_id)
+        task = session.get(Task, task_id, options=[undefer_group("task_text")])
         if not task:
             return None
         return {
@@ -669,74 +479,278 @@ def api_get_task(task_id: int):
         session.close()
 
 
-def _run_python_user_code(user_code: str, checker_code: str | None = None, timeout: int = 3):
-    # Создаем временный файл в UTF-8 и явно указываем кодировку в заголовке,
-    # чтобы русские комментарии и строки не вызывали SyntaxError в Python.
-    with NamedTemporaryFile("w", suffix=".py", delete=False, encoding="utf-8") as tmp:
-        path = tmp.name
-        tmp.write("# -*- coding: utf-8 -*-\n")
-        if checker_code:
-            tmp.write(user_code)
-            tmp.write("\n\n")
-            tmp.write(checker_code)
-        else:
-            tmp.write(user_code)
+def _run_python_user_code(
+    user_code: str, checker_code: str | None = None, timeout: float = RUNNER_TIMEOUT, on_output=None
+):
+    # Код выполняется в заранее запущенном интерпретаторе из пула,
+    # без временных файлов на диске.
+    return run_user_code(user_code, checker_code=checker_code, timeout=timeout, on_output=on_output)
 
-    try:
-        completed = subprocess.run(
-            [sys.executable, "-I", path],
-            capture_output=True,
-            text=True,
-            timeout=timeout,
-        )
-        stdout = completed.stdout
-        stderr = completed.stderr
-        ok = completed.returncode == 0
-        return ok, stdout, stderr
-    except subprocess.TimeoutExpired:
-        return False, "", "Превышено время выполнения кода"
 
+def _grade_submission(code: str, task_id: int | None, user_id: int | None):
+    # Выполняется в потоке очереди проверок: сессия БД открыта только на
+    # время чтения проверки и записи попытки, но не на время запуска кода.
+    from sqlalchemy.orm import undefer
 
-@eel.expose
-def api_run_python(code: str, task_id: int | None = None):
-    session = get_session()
-    try:
-        checker_code = None
-        task = None
-        if task_id is not None:
-            task = session.get(Task, task_id)
+    from attempt_storage import get_attempt_writer
+    from db import get_session
+    from models import Task
+    from result_cache import get_result_cache, make_key
+
+    checker_code = None
+    if task_id is not None:
+        session = get_session()
+        try:
+            task = session.get(Task, task_id, options=[undefer(Task.checker_code)])
             if not task:
                 return {"ok": False, "error": "Задание не найдено"}
             checker_code = task.checker_code
+        finally:
+            session.close()
+
+    cache = get_result_cache()
+    cache_key = make_key(code, checker_code)
+    result = cache.get(cache_key)
+    usage = {}
+    if result is None:
+        on_output = _job_output_pusher(current_job_id())
+        result = _run_python_user_code(code, checker_code=checker_code, on_output=on_output)
+        cache.put(cache_key, checker_hash(checker_code), result)
+        # Ресурсы пишутся только для настоящего запуска, не для кэша
+        usage = result.usage or {}
+
+    is_passed = check_passed(result, checker_code)
+
+    # Запуск без задания не является попыткой: task_id в task_attempts
+    # обязателен. Попытка пишется в фоне, вердикт возвращается сразу.
+    if task_id is not None:
+        get_attempt_writer().submit(
+            {
+                "task_id": task_id,
+                "user_id": user_id if user_id is not None else 0,
+                "code": code,
+                "is_passed": is_passed,
+                "output": (result.stdout + "\n" + result.stderr).strip(),
+                "cpu_ms": usage.get("cpu_ms"),
+                "peak_rss_kb": usage.get("peak_rss_kb"),
+            }
+        )
+
+    verdict = result.verdict or {}
+    return {
+        "ok": True,
+        "is_passed": is_passed,
+        "stdout": result.stdout,
+        "stderr": result.stderr,
+        "cases": verdict.get("cases", []),
+        "checker_error": verdict.get("error"),
+    }
+
+
+def _push_to_window(name, payload):
+    # Вызов функции static/app.js из потока очереди: eel работает в цикле
+    # gevent, поэтому вызов передаётся в цикл потокобезопасно. Колбэк цикла
+    # только кладёт его в очередь (переключаться в нём нельзя), а отправляет
+    # один greenlet (_window_push_loop), поэтому вызовы доходят в порядке
+    # отправки.
+    if _EEL_HUB is None:
+        return
+    _EEL_HUB.loop.run_callback_threadsafe(_window_pushes.put_nowait, (name, payload))
+
+
+def _window_push_loop():
+    for name, payload in _window_pushes:
+        function = getattr(eel, name, None)
+        if function is None:
+            continue
+        try:
+            function(payload)
+        except Exception:
+            traceback.print_exc()
+
+
+def _notify_job_finished(job):
+    # Результат отправляется в static/app.js (onJobFinished)
+    _push_to_window("on_job_finished", job)
+
+
+def _job_output_pusher(job_id):
+    # Вывод запуска по частям (onJobOutput), пока код ещё выполняется. В
+    # server.py окна нет: там результат приходит целиком.
+    if _EEL_HUB is None or job_id is None:
+        return None
+
+    def on_output(stream, data):
+        _push_to_window("on_job_output", {"job_id": job_id, "stream": stream, "data": data})
+
+    return on_output
+
+
+@api
+def api_get_result_cache_stats():
+    from result_cache import get_result_cache
+
+    return get_result_cache().stats()
+
 
-        ok, stdout, stderr = _run_python_user_code(code, checker_code=checker_code)
+@api
+def api_get_metrics(format: str = "json"):
+    # Метрики процесса (metrics.py): снимок для страниц или текст Prometheus
+    if not metrics.ENABLED:
+        return {"ok": False, "error": "Сбор метрик выключен"}
+    if format == "prometheus":
+        return {"ok": True, "text": metrics.prometheus_text()}
+    return {"ok": True, "metrics": metrics.snapshot()}
 
-        is_passed = ok and ("OK" in stdout or checker_code is None)
 
-        attempt = TaskAttempt(
-            task_id=task_id if task_id is not None else None,
-            user_id=CURRENT_USER_ID if CURRENT_USER_ID is not None else 0,
-            code=code,
-            is_passed=is_passed,
-            output=(stdout + "\n" + stderr).strip(),
+def get_job_queue() -> JobQueue:
+    global _job_queue
+    if _job_queue is None:
+        _job_queue = JobQueue(on_finished=_notify_job_finished)
+    return _job_queue
+
+
+def _syntax_error_result(code: str, task_id: int | None, user_id: int | None, exc):
+    # Результат как у _grade_submission, но без запуска: код не компилируется.
+    # Попытка всё равно пишется, как и любая неудачная отправка.
+    from attempt_storage import get_attempt_writer
+
+    stderr = format_exception_only(exc)
+    if task_id is not None:
+        get_attempt_writer().submit(
+            {
+                "task_id": task_id,
+                "user_id": user_id if user_id is not None else 0,
+                "code": code,
+                "is_passed": False,
+                "output": stderr,
+            }
         )
-        session.add(attempt)
-        session.commit()
+    return {
+        "ok": True,
+        "is_passed": False,
+        "stdout": "",
+        "stderr": stderr,
+        "cases": [],
+        "checker_error": None,
+        "syntax_error": {
+            "line": getattr(exc, "lineno", None),
+            "column": getattr(exc, "offset", None),
+            "message": getattr(exc, "msg", None) or str(exc),
+        },
+    }
+
+
+@api
+def api_run_python(code: str, task_id: int | None = None):
+    # Код с синтаксической ошибкой не доходит до очереди и интерпретатора:
+    # ответ сразу готов, как у server.py
+    exc = check_syntax(code)
+    if exc is not None:
+        result = _syntax_error_result(code, task_id, current_user_id(), exc)
+        return {"ok": True, "status": STATUS_DONE, "result": result}
+    try:
+        job_id = get_job_queue().submit(_grade_submission, code, task_id, current_user_id())
+    except QueueFullError:
+        return {"ok": False, "error": "Слишком много запусков, попробуйте чуть позже"}
+    return {"ok": True, "job_id": job_id, "status": STATUS_QUEUED}
+
+
+@api
+def api_get_job(job_id: str):
+    job = get_job_queue().get(job_id)
+    if job is None:
+        return {"ok": False, "error": "Задание на проверку не найдено"}
+    return {"ok": True, **job}
+
+
+def init_backend():
+    # Импорт SQLAlchemy и моделей и подготовка БД. main() вызывает её в фоне,
+    # пока открывается окно; при импорте app без окна (бенчмарки, скрипты)
+    # её выполняет первый вызов эндпоинта.
+    global _backend_error
+    with _backend_lock:
+        if _backend_ready.is_set():
+            return
+        try:
+            with startup.phase("import backend"):
+                import db  # noqa: F401
+                import models  # noqa: F401
+            init_db()
+        except BaseException as exc:
+            _backend_error = exc
+            raise
+        finally:
+            _backend_ready.set()
+            startup.mark("backend ready")
+
+
+def _start_backend():
+    # Пул интерпретаторов и обслуживание БД запускаются после подготовки БД
+    # и первых вызовов эндпоинтов не задерживают
+    from attempt_storage import compact_if_due, get_attempt_writer
+    from db import engine
+    from result_cache import get_result_cache
+
+    init_backend()
+    with startup.phase("runner pool"):
+        get_runner_pool().start()
+    with startup.phase("result cache prune"):
+        get_result_cache().prune()
+    # Уплотнение попыток в фоне, не чаще раза в сутки: удаление старых и
+    # возврат части страниц
+    threading.Thread(target=compact_if_due, args=(engine,), name="attempt-compaction", daemon=True).start()
+    get_attempt_writer().start()
+    startup.report()
+
+
+_first_paint = False
 
-        return {
-            "ok": True,
-            "is_passed": is_passed,
-            "stdout": stdout,
-            "stderr": stderr,
-        }
-    finally:
-        session.close()
+
+@eel.expose
+def api_mark_first_paint():
+    # static/app.js сообщает об отрисовке страницы, для отчёта о запуске.
+    # Не ждёт БД, поэтому не через @api.
+    global _first_paint
+    if not _first_paint:
+        _first_paint = True
+        startup.mark("first paint")
+        startup.report()
 
 
 def main():
-    init_db()
-    eel.init(str(WEB_DIR))
-    eel.start("index.html", size=(1200, 800), icon="static/logo.ico")
+    global _EEL_HUB, _backend_thread
+    _EEL_HUB = gevent.get_hub()
+    gevent.spawn(_window_push_loop)
+    with startup.phase("eel.init"):
+        # eel.init ищет eel.expose(...) во всех файлах каталога, разбирая их
+        # pyparsing; функции для Python объявляет только static/app.js, а
+        # разбор HTML страниц и файлов сборки PyInstaller занимал секунды
+        eel.init(str(WEB_DIR), allowed_extensions=[".js"])
+    _backend_thread = threading.Thread(target=_start_backend, name="backend-startup", daemon=True)
+    _backend_thread.start()
+    try:
+        eel.start("index.html", size=(1200, 800), icon="static/logo.ico")
+    finally:
+        shutdown()
+
+
+def shutdown():
+    # Порядок важен: сначала доделываются проверки, затем дописываются их
+    # попытки, затем WAL переносится в файл БД. Окно могли закрыть, пока
+    # БД ещё готовилась, поэтому сначала дожидаемся подготовки.
+    from attempt_storage import get_attempt_writer
+    from db import checkpoint
+
+    if _backend_thread is not None:
+        _backend_thread.join()
+    if _job_queue is not None:
+        _job_queue.shutdown(wait=True)
+    get_attempt_writer().close()
+    checkpoint()
+    startup.report(force=True)
+    metrics.dump()
 
 
-main()
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,354 @@
+# Хранение кода и вывода попыток и уплотнение task_attempts.
+#
+#   python attempt_storage.py report              # сколько места занимают попытки
+#   python attempt_storage.py compact             # удалить старые попытки и освободить страницы
+#   python attempt_storage.py compact --vacuum    # один раз перевести БД на incremental vacuum
+#   python attempt_storage.py replay              # дописать попытки из файла отказов
+#
+# Код и вывод хранятся в blobs под своим sha256, попытка ссылается на них
+# по хэшу: повторная отправка того же решения и одинаковый вывод (частая
+# ошибка) не занимают место повторно. Вывод обрезается до
+# ATTEMPT_OUTPUT_LIMIT байт с пометкой в конце.
+import argparse
+import atexit
+import hashlib
+import threading
+from datetime import datetime, timedelta
+
+from sqlalchemy import bindparam, func, insert as core_insert, select, text
+from sqlalchemy.dialects.sqlite import insert
+
+from config import ATTEMPT_COMPACT_INTERVAL_HOURS, ATTEMPT_KEEP_LAST, ATTEMPT_OUTPUT_LIMIT, ATTEMPT_VACUUM_PAGES
+from models import AppMeta, Blob, TaskAttempt
+from text_storage import decompress_text
+from write_behind import WriteBehindWriter, read_dead_letter
+
+attempts = TaskAttempt.__table__
+blobs = Blob.__table__
+meta = AppMeta.__table__
+
+# Ключ app_meta со временем последнего уплотнения (compact_if_due)
+COMPACTED_AT_KEY = "attempts_compacted_at"
+
+TRUNCATED_MARKER = "\n… [вывод обрезан: показано {shown} из {total} байт]"
+
+_insert_blob = insert(blobs).on_conflict_do_nothing(index_elements=[blobs.c.hash])
+
+
+def blob_hash(value: str) -> str:
+    return hashlib.sha256(value.encode("utf-8")).hexdigest()
+
+
+def cap_output(value: str, limit: int = ATTEMPT_OUTPUT_LIMIT) -> str:
+    raw = value.encode("utf-8")
+    if len(raw) <= limit:
+        return value
+    head = raw[:limit].decode("utf-8", errors="ignore")
+    return head + TRUNCATED_MARKER.format(shown=len(head.encode("utf-8")), total=len(raw))
+
+
+def put_blobs(conn, values) -> list:
+    # Возвращает хэши в порядке values (None для None). Вставка без
+    # предварительного чтения: существующие блобы пропускает ON CONFLICT,
+    # а запись сразу берёт блокировку, так что уплотнение не удалит блоб
+    # между вставкой и ссылкой на него.
+    now = datetime.utcnow()
+    hashes = []
+    rows = {}
+    for value in values:
+        if value is None:
+            hashes.append(None)
+            continue
+        digest = blob_hash(value)
+        hashes.append(digest)
+        if digest not in rows:
+            rows[digest] = {"hash": digest, "content": value, "size": len(value.encode("utf-8")), "created_at": now}
+    if rows:
+        conn.execute(_insert_blob, list(rows.values()))
+    return hashes
+
+
+def get_blobs(conn, hashes) -> dict:
+    hashes = [h for h in set(hashes) if h is not None]
+    if not hashes:
+        return {}
+    rows = conn.execute(
+        select(blobs.c.hash, blobs.c.content).where(blobs.c.hash.in_(bindparam("hashes", expanding=True))),
+        {"hashes": hashes},
+    )
+    return dict(rows.all())
+
+
+def record_attempts(conn, rows):
+    # rows: словари task_id, user_id, code, is_passed, output[, cpu_ms,
+    # peak_rss_kb, created_at]
+    rows = list(rows)
+    if not rows:
+        return
+    now = datetime.utcnow()
+    outputs = [cap_output(row["output"]) if row.get("output") else None for row in rows]
+    hashes = put_blobs(conn, [row["code"] for row in rows] + outputs)
+    conn.execute(
+        core_insert(attempts),
+        [
+            {
+                "task_id": row["task_id"],
+                "user_id": row["user_id"],
+                "code_hash": hashes[i],
+                "is_passed": row["is_passed"],
+                "output_hash": hashes[len(rows) + i],
+                "cpu_ms": row.get("cpu_ms"),
+                "peak_rss_kb": row.get("peak_rss_kb"),
+                "created_at": row.get("created_at") or now,
+            }
+            for i, row in enumerate(rows)
+        ],
+    )
+
+
+def _flush_attempts(rows):
+    # Без отложенной записи попытка пишется в потоке вызова: внутри
+    # api_batch — в его транзакции, а не вторым соединением, которое ждало
+    # бы блокировку записи пакета
+    from db import unit_of_work
+
+    with unit_of_work(write=True) as conn:
+        record_attempts(conn, rows)
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def failed_attempts_path():
+    # Файл отказов отложенной записи попыток, рядом с БД
+    from db import DB_PATH
+
+    return DB_PATH.with_name(DB_PATH.name + "-failed-attempts.jsonl")
+
+
+def get_attempt_writer() -> WriteBehindWriter:
+    # С BRAVELEARN_WRITE_BEHIND=1 попытки пишутся фоновым потоком пачками
+    # (write_behind.py): проверка возвращает вердикт, не дожидаясь commit
+    global _writer
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                _writer = WriteBehindWriter(
+                    _flush_attempts, name="attempt-writer", dead_letter=failed_attempts_path()
+                )
+                atexit.register(_writer.close)
+    return _writer
+
+
+def copy_legacy_attempts(conn, legacy_table: str, chunk_size: int = 1000):
+    # Перенос попыток из прежней таблицы с code/output в тексте (миграция 4).
+    # id сохраняются: на них ссылаются контрольные точки regrade.py.
+    query = text(
+        f"SELECT id, task_id, user_id, code, is_passed, output, created_at FROM {legacy_table} "
+        "WHERE id > :after_id ORDER BY id LIMIT :limit"
+    )
+    after_id = 0
+    while True:
+        rows = conn.execute(query, {"after_id": after_id, "limit": chunk_size}).all()
+        if not rows:
+            return
+        outputs = [decompress_text(row.output) for row in rows]
+        hashes = put_blobs(
+            conn,
+            [decompress_text(row.code) or "" for row in rows] + [cap_output(o) if o else None for o in outputs],
+        )
+        conn.execute(
+            text(
+                "INSERT INTO task_attempts (id, task_id, user_id, code_hash, is_passed, output_hash, created_at) "
+                "VALUES (:id, :task_id, :user_id, :code_hash, :is_passed, :output_hash, :created_at)"
+            ),
+            [
+                {
+                    "id": row.id,
+                    "task_id": row.task_id,
+                    "user_id": row.user_id,
+                    "code_hash": hashes[i],
+                    "is_passed": row.is_passed,
+                    "output_hash": hashes[len(rows) + i],
+                    "created_at": row.created_at,
+                }
+                for i, row in enumerate(rows)
+            ],
+        )
+        after_id = rows[-1].id
+
+
+# Для каждой пары (ученик, задание) остаются последние keep_last попыток и
+# первая успешная
+_retention_sql = text(
+    """
+    DELETE FROM task_attempts WHERE id IN (
+        SELECT id FROM (
+            SELECT id, is_passed,
+                   ROW_NUMBER() OVER (PARTITION BY user_id, task_id ORDER BY id DESC) AS recent,
+                   ROW_NUMBER() OVER (PARTITION BY user_id, task_id, is_passed ORDER BY id) AS nth_of_kind
+            FROM task_attempts
+        )
+        WHERE recent > :keep_last AND NOT (is_passed = 1 AND nth_of_kind = 1)
+    )
+    """
+)
+
+_orphan_blobs_sql = text(
+    """
+    DELETE FROM blobs
+    WHERE NOT EXISTS (SELECT 1 FROM task_attempts WHERE code_hash = blobs.hash)
+      AND NOT EXISTS (SELECT 1 FROM task_attempts WHERE output_hash = blobs.hash)
+    """
+)
+
+
+# Блобы, на которые ссылается хоть одна попытка, и осиротевшие (их удалит
+# следующее уплотнение)
+_blob_usage_sql = text(
+    """
+    SELECT referenced, count(*), coalesce(sum(length(CAST(content AS BLOB))), 0)
+    FROM (
+        SELECT content,
+               EXISTS (SELECT 1 FROM task_attempts WHERE code_hash = blobs.hash)
+               OR EXISTS (SELECT 1 FROM task_attempts WHERE output_hash = blobs.hash) AS referenced
+        FROM blobs
+    )
+    GROUP BY referenced
+    """
+)
+
+
+def _file_stats(conn) -> dict:
+    page_size = conn.exec_driver_sql("PRAGMA page_size").scalar()
+    return {
+        "file_bytes": page_size * conn.exec_driver_sql("PRAGMA page_count").scalar(),
+        "free_bytes": page_size * conn.exec_driver_sql("PRAGMA freelist_count").scalar(),
+    }
+
+
+def storage_report(bind) -> dict:
+    code = blobs.alias("code_blob")
+    output = blobs.alias("output_blob")
+    with bind.connect() as conn:
+        count, logical = conn.execute(
+            select(func.count(), func.coalesce(func.sum(code.c.size + func.coalesce(output.c.size, 0)), 0))
+            .select_from(attempts)
+            .join(code, code.c.hash == attempts.c.code_hash)
+            .outerjoin(output, output.c.hash == attempts.c.output_hash)
+        ).one()
+        usage = {bool(row[0]): (row[1], row[2]) for row in conn.execute(_blob_usage_sql)}
+        blob_count, stored = usage.get(True, (0, 0))
+        orphan_count, orphan_bytes = usage.get(False, (0, 0))
+        return {
+            "attempts": count,
+            # Столько занимали бы код и вывод, храни каждая попытка свою копию
+            "logical_bytes": logical,
+            # Только блобы попыток: осиротевшие в «сэкономлено» не входят
+            "blobs": blob_count,
+            "stored_bytes": stored,
+            "orphan_blobs": orphan_count,
+            "orphan_bytes": orphan_bytes,
+            **_file_stats(conn),
+        }
+
+
+def compact(bind, keep_last: int = ATTEMPT_KEEP_LAST, vacuum_pages: int = ATTEMPT_VACUUM_PAGES) -> dict:
+    with bind.begin() as conn:
+        deleted = conn.execute(_retention_sql, {"keep_last": keep_last}).rowcount
+        orphaned = conn.execute(_orphan_blobs_sql).rowcount
+    with bind.connect() as conn:
+        before = _file_stats(conn)
+        # Страницы возвращаются порциями, чтобы не держать запись надолго;
+        # остаток освободится при следующем запуске.
+        if conn.exec_driver_sql("PRAGMA auto_vacuum").scalar() == 2 and vacuum_pages > 0:
+            # execute() делает один шаг прагмы, то есть освобождает одну
+            # страницу; executescript выполняет её до конца
+            conn.connection.driver_connection.executescript(f"PRAGMA incremental_vacuum({int(vacuum_pages)});")
+        after = _file_stats(conn)
+    return {
+        "deleted_attempts": deleted,
+        "deleted_blobs": orphaned,
+        "released_bytes": before["file_bytes"] - after["file_bytes"],
+        **after,
+    }
+
+
+def compact_if_due(bind, interval_hours: float = ATTEMPT_COMPACT_INTERVAL_HOURS):
+    # Уплотнение при запуске не чаще раза в interval_hours. Время
+    # записывается в app_meta до уплотнения и в транзакции с блокировкой
+    # записи, поэтому одновременно запущенные процессы не уплотняют вместе.
+    # None — ещё рано.
+    now = datetime.utcnow()
+    with bind.begin() as conn:
+        conn.exec_driver_sql("BEGIN IMMEDIATE")
+        last = conn.execute(select(meta.c.value).where(meta.c.key == COMPACTED_AT_KEY)).scalar()
+        if last is not None and now - datetime.fromisoformat(last) < timedelta(hours=interval_hours):
+            return None
+        stmt = insert(meta).values(key=COMPACTED_AT_KEY, value=now.isoformat())
+        conn.execute(stmt.on_conflict_do_update(index_elements=[meta.c.key], set_={"value": now.isoformat()}))
+    return compact(bind)
+
+
+def enable_incremental_vacuum(bind):
+    # auto_vacuum существующей БД меняется только полным VACUUM; новые БД
+    # создаются уже с ним (см. db.STORAGE_PROFILES)
+    with bind.connect() as conn:
+        conn.exec_driver_sql("PRAGMA auto_vacuum = INCREMENTAL")
+        conn.exec_driver_sql("VACUUM")
+
+
+def _format_report(report: dict) -> str:
+    mb = 1024 * 1024
+    lines = [f"{name}: {value / mb:.2f} МБ" if name.endswith("bytes") else f"{name}: {value}" for name, value in report.items()]
+    if report.get("logical_bytes"):
+        saved = report["logical_bytes"] - report["stored_bytes"]
+        lines.append(f"сэкономлено: {saved / mb:.2f} МБ ({saved * 100 / report['logical_bytes']:.0f}%)")
+    return "\n".join(lines)
+
+
+def replay_failed_attempts(bind) -> int:
+    # Попытки из файла отказов одной транзакцией; файл удаляется после
+    # записи, при ошибке остаётся как есть
+    path = failed_attempts_path()
+    if not path.exists():
+        return 0
+    rows = read_dead_letter(path)
+    for row in rows:
+        if row.get("created_at"):
+            row["created_at"] = datetime.fromisoformat(row["created_at"])
+    with bind.begin() as conn:
+        record_attempts(conn, rows)
+    path.unlink()
+    return len(rows)
+
+
+def main(argv=None):
+    from db import engine
+    from migrations import upgrade
+
+    parser = argparse.ArgumentParser(description="Хранение и уплотнение попыток")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("report", help="статистика хранения попыток")
+    compact_parser = sub.add_parser("compact", help="удалить старые попытки и неиспользуемые блобы")
+    compact_parser.add_argument("--keep", type=int, default=ATTEMPT_KEEP_LAST, help="последних попыток на задание")
+    compact_parser.add_argument("--pages", type=int, default=ATTEMPT_VACUUM_PAGES, help="страниц за один проход")
+    compact_parser.add_argument("--vacuum", action="store_true", help="включить incremental vacuum (полный VACUUM)")
+    sub.add_parser("replay", help="записать попытки из файла отказов отложенной записи")
+    args = parser.parse_args(argv)
+
+    upgrade(engine)
+    if args.command == "replay":
+        print(f"Записано попыток: {replay_failed_attempts(engine)}")
+        return
+    if args.command == "compact":
+        if args.vacuum:
+            enable_incremental_vacuum(engine)
+        print(_format_report(compact(engine, args.keep, args.pages)))
+        print()
+    print(_format_report(storage_report(engine)))
+
+
+if __name__ == "__main__":
+    main()
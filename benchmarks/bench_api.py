@@ -0,0 +1,309 @@
+# Нагрузочный бенчмарк всех эндпоинтов app.API без окна.
+#
+#   python benchmarks/bench_api.py                                  # small и medium
+#   python benchmarks/bench_api.py --scales small,medium,large --json results.json
+#   python benchmarks/bench_api.py --json new.json --compare results.json
+#   python benchmarks/bench_api.py --scales small --metrics                # SQL на вызов, N+1
+#
+# Для каждого масштаба datagen.py создаёт БД во временном каталоге, а замеры
+# идут в отдельном процессе: engine приложения привязывается к
+# BRAVELEARN_DB_PATH при импорте. Каждый эндпоинт вызывается --calls раз
+# подряд после прогрева, как их вызывает цикл eel; в отчёте перцентили
+# задержки и вызовов в секунду. api_run_python меряется от отправки до
+# готового результата (опрос api_get_job, как в static/app.js), отдельно с
+# попаданием в кэш результатов и пачкой одновременных отправок.
+#
+# Эндпоинт без сценария в CASES — ошибка: новые api_* не должны выпадать из
+# замеров. --compare сравнивает p50 с прошлым отчётом и завершается с кодом
+# 1, если что-то стало медленнее порога. --metrics включает metrics.py в
+# процессе замеров: в отчёт добавляются SQL-запросы на вызов и места,
+# похожие на N+1 (сами задержки тогда включают накладные расходы сбора).
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from datagen import SCALES, USER_PASSWORD, correct_solution  # noqa: E402
+
+WARMUP = 5
+JOB_POLL_INTERVAL = 0.0005
+BURST = 50
+
+
+def _course_id(ctx, rnd):
+    return rnd.randint(1, ctx["courses"])
+
+
+def _lesson_id(ctx, rnd):
+    return rnd.randint(1, ctx["lessons"])
+
+
+def _task_id(ctx, rnd):
+    return rnd.randint(1, ctx["tasks"])
+
+
+# Аргументы каждого эндпоинта: (ctx, rnd) -> tuple
+CASES = {
+    "api_login": lambda ctx, rnd: ("user1", USER_PASSWORD),
+    "api_get_current_user": lambda ctx, rnd: (),
+    "api_get_courses": lambda ctx, rnd: (),
+    "api_query_catalog": lambda ctx, rnd: (
+        rnd.choice([{}, {"sort": "title"}, {"category": "Дизайн"}, {"level": "Начинающий", "sort": "popular"}]),
+    ),
+    "api_search": lambda ctx, rnd: (rnd.choice(["python", "словарь", "функц", "декоратор класс", "запрос"]),),
+    "api_toggle_favorite": lambda ctx, rnd: (_course_id(ctx, rnd),),
+    "api_get_course": lambda ctx, rnd: (_course_id(ctx, rnd),),
+    "api_get_course_structure": lambda ctx, rnd: (_course_id(ctx, rnd),),
+    "api_get_lesson": lambda ctx, rnd: (_lesson_id(ctx, rnd),),
+    "api_get_course_page": lambda ctx, rnd: (_course_id(ctx, rnd),),
+    "api_batch": lambda ctx, rnd: (
+        [
+            {"name": "api_mark_lesson_completed", "args": [_lesson_id(ctx, rnd)]},
+            {"name": "api_get_course_structure", "args": [_course_id(ctx, rnd)]},
+        ],
+    ),
+    "api_mark_lesson_completed": lambda ctx, rnd: (_lesson_id(ctx, rnd),),
+    "api_mark_lessons_completed": lambda ctx, rnd: ([_lesson_id(ctx, rnd) for _ in range(20)],),
+    "api_import_progress": lambda ctx, rnd: (
+        [
+            {"lesson_id": _lesson_id(ctx, rnd), "completed_at": "2024-05-01T10:00:00"} for _ in range(100)
+        ],
+    ),
+    "api_get_task": lambda ctx, rnd: (_task_id(ctx, rnd),),
+    "api_run_python": None,
+    "api_get_job": None,
+    "api_get_result_cache_stats": lambda ctx, rnd: (),
+    "api_get_metrics": lambda ctx, rnd: (rnd.choice(["json", "prometheus"]),),
+}
+
+
+def _stats(latencies, elapsed=None):
+    latencies = sorted(latencies)
+    n = len(latencies)
+
+    def percentile(q):
+        return round(latencies[min(int(q * n), n - 1)] * 1000, 3)
+
+    return {
+        "calls": n,
+        "p50_ms": percentile(0.5),
+        "p90_ms": percentile(0.9),
+        "p99_ms": percentile(0.99),
+        "max_ms": round(latencies[-1] * 1000, 3),
+        "per_sec": round(n / (elapsed if elapsed is not None else sum(latencies)), 1),
+    }
+
+
+def _measure(fn, make_args, calls, rnd):
+    for _ in range(WARMUP):
+        fn(*make_args(rnd))
+    latencies = []
+    for _ in range(calls):
+        args = make_args(rnd)
+        started = time.perf_counter()
+        fn(*args)
+        latencies.append(time.perf_counter() - started)
+    return _stats(latencies)
+
+
+def _wait_job(app, job_id):
+    while True:
+        job = app.api_get_job(job_id)
+        if job["status"] in ("done", "failed"):
+            return job
+        time.sleep(JOB_POLL_INTERVAL)
+
+
+def _run_python_cases(app, ctx, calls, rnd):
+    counter = iter(range(10**9))
+
+    def submit(code, task_id):
+        job = app.api_run_python(code, task_id)
+        if not job.get("ok"):
+            raise RuntimeError(job.get("error"))
+        return job["job_id"]
+
+    def unique_run():
+        # Комментарий с номером меняет хэш кода: кэш результатов не попадает
+        task_id = _task_id(ctx, rnd)
+        return _wait_job(app, submit(correct_solution(task_id) + f"# {next(counter)}\n", task_id))
+
+    cached_task = 1
+
+    def cached_run():
+        return _wait_job(app, submit(correct_solution(cached_task), cached_task))
+
+    results = {
+        "api_run_python": _measure(unique_run, lambda rnd: (), calls, rnd),
+        "api_run_python:cached": _measure(cached_run, lambda rnd: (), calls, rnd),
+    }
+    job_id = submit(correct_solution(cached_task), cached_task)
+    _wait_job(app, job_id)
+    results["api_get_job"] = _measure(app.api_get_job, lambda rnd: (job_id,), calls, rnd)
+
+    # Пачка одновременных отправок: пропускная способность очереди и пула
+    started = time.perf_counter()
+    job_ids = [submit(correct_solution(task_id) + f"# {next(counter)}\n", task_id) for task_id in range(1, BURST + 1)]
+    latencies = []
+    for job_id in job_ids:
+        _wait_job(app, job_id)
+        latencies.append(time.perf_counter() - started)
+    results["api_run_python:burst"] = _stats(latencies, time.perf_counter() - started)
+    return results
+
+
+def run_worker(ctx, calls, seed):
+    # Выполняется в отдельном процессе с BRAVELEARN_DB_PATH на БД масштаба
+    import app
+
+    started = time.perf_counter()
+    app.init_backend()
+    app.get_runner_pool().start()
+    report = {"init_backend_s": round(time.perf_counter() - started, 3), "endpoints": {}}
+
+    missing = sorted(set(app.API) - set(CASES))
+    if missing:
+        raise SystemExit(f"Нет сценария для эндпоинтов: {', '.join(missing)}")
+
+    rnd = random.Random(seed)
+    endpoints = report["endpoints"]
+    # api_login первым: остальные эндпоинты работают от имени user1
+    for name, make_args in CASES.items():
+        if make_args is None or name not in app.API:
+            continue
+        endpoints[name] = _measure(app.API[name], lambda rnd, make_args=make_args: make_args(ctx, rnd), calls, rnd)
+    if ctx["tasks"]:
+        endpoints.update(_run_python_cases(app, ctx, calls, rnd))
+    app.shutdown()
+    if app.metrics.ENABLED:
+        snapshot = app.metrics.snapshot()
+        report["sql_per_call"] = {
+            row["labels"]["endpoint"]: round(row["sum"] / row["count"], 2)
+            for row in snapshot["histograms"].get("sql_statements_per_call", [])
+        }
+        report["n_plus_one"] = snapshot["n_plus_one"]
+    return report
+
+
+def _git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def bench_scale(scale, calls, seed, tmp, collect_metrics=False):
+    from datagen import generate
+    from db import content_path_for, make_engine
+
+    path = Path(tmp) / f"{scale}.db"
+    engine = make_engine(path, pool_size=1, max_overflow=0, content_path=content_path_for(path))
+    started = time.perf_counter()
+    try:
+        counts = generate(engine, seed=seed, **SCALES[scale])
+    finally:
+        engine.dispose()
+    generated = time.perf_counter() - started
+
+    env = dict(os.environ, BRAVELEARN_DB_PATH=str(path))
+    if collect_metrics:
+        env["BRAVELEARN_METRICS"] = "1"
+    out = subprocess.run(
+        [sys.executable, __file__, "--worker", json.dumps(counts), "--calls", str(calls), "--seed", str(seed)],
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    if out.returncode != 0:
+        raise SystemExit(f"{scale}: замеры завершились с ошибкой\n{out.stderr}")
+    return {"data": counts, "generate_s": round(generated, 1), **json.loads(out.stdout.splitlines()[-1])}
+
+
+def compare(old, new, threshold):
+    regressions = []
+    for scale, result in new["scales"].items():
+        previous = old.get("scales", {}).get(scale)
+        if previous is None:
+            continue
+        print(f"\n{scale}: p50, мс (было → стало)")
+        for name, row in result["endpoints"].items():
+            before = previous["endpoints"].get(name)
+            if before is None:
+                continue
+            ratio = row["p50_ms"] / before["p50_ms"] if before["p50_ms"] else 1.0
+            flag = ""
+            if ratio > 1 + threshold:
+                flag = "  медленнее"
+                regressions.append((scale, name))
+            print(f"  {name:<32} {before['p50_ms']:>9} → {row['p50_ms']:>9}  x{ratio:.2f}{flag}")
+    return regressions
+
+
+def print_report(report):
+    for scale, result in report["scales"].items():
+        data = ", ".join(f"{name} {value}" for name, value in result["data"].items())
+        print(f"\n{scale}: {data}")
+        print(f"  {'эндпоинт':<32} {'p50, мс':>9} {'p90, мс':>9} {'p99, мс':>9} {'выз/с':>9}")
+        for name, row in result["endpoints"].items():
+            print(f"  {name:<32} {row['p50_ms']:>9} {row['p90_ms']:>9} {row['p99_ms']:>9} {row['per_sec']:>9}")
+        if "sql_per_call" in result:
+            print(f"  {'эндпоинт':<32} {'SQL за вызов':>12}")
+            for name, count in sorted(result["sql_per_call"].items()):
+                print(f"  {name:<32} {count:>12}")
+            for suspect in result["n_plus_one"]:
+                print(f"  возможный N+1 в {suspect['endpoint']}: {suspect['what'][:100]}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Бенчмарк эндпоинтов app.API")
+    parser.add_argument("--scales", default="small,medium", help=f"через запятую из {', '.join(SCALES)}")
+    parser.add_argument("--calls", type=int, default=200, help="вызовов каждого эндпоинта")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", help="сохранить результаты в файл")
+    parser.add_argument("--compare", help="сравнить с прошлым отчётом")
+    parser.add_argument("--threshold", type=float, default=0.2, help="допустимое замедление p50 (0.2 = 20%%)")
+    parser.add_argument("--metrics", action="store_true", help="собрать SQL-запросы на вызов (metrics.py)")
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.worker:
+        print(json.dumps(run_worker(json.loads(args.worker), args.calls, args.seed)))
+        return
+
+    scales = [scale.strip() for scale in args.scales.split(",") if scale.strip()]
+    unknown = [scale for scale in scales if scale not in SCALES]
+    if unknown:
+        parser.error(f"неизвестный масштаб: {', '.join(unknown)}")
+    report = {
+        "revision": _git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "calls": args.calls,
+        "scales": {},
+    }
+    with tempfile.TemporaryDirectory() as tmp:
+        for scale in scales:
+            report["scales"][scale] = bench_scale(scale, args.calls, args.seed, tmp, args.metrics)
+    print_report(report)
+    if args.json:
+        Path(args.json).write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+    if args.compare:
+        old = json.loads(Path(args.compare).read_text(encoding="utf-8"))
+        if compare(old, report, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
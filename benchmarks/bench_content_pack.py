@@ -0,0 +1,149 @@
+# Импорт пакета контента (content_pack.py): прежнее наполнение ORM-объектами
+# через session.add_all в общий файл БД против публикации отдельной БД
+# контента (сравнение, executemany, поисковый индекс, подмена файла), а также
+# повторный импорт неизменённого пакета и пакета с 1% изменённых уроков.
+#
+#   python benchmarks/bench_content_pack.py [--courses 100] [--lessons 10000]
+import argparse
+import json
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from sqlalchemy.orm import Session  # noqa: E402
+
+from content_pack import COURSE_FILE, import_pack, load_pack  # noqa: E402
+from db import content_path_for, make_engine  # noqa: E402
+from migrations import upgrade  # noqa: E402
+from models import Course, CourseModule, Lesson, Task  # noqa: E402
+
+MODULES_PER_COURSE = 10
+TASK_EVERY = 5
+PARAGRAPH = "<p>Разбираем <code>{word}</code> на примерах и типичных ошибках.</p>\n"
+WORDS = "list dict set tuple generator decorator class module exception context".split()
+
+
+def write_pack(root, course_count, lesson_count):
+    rnd = random.Random(1)
+    per_course = max(lesson_count // course_count, 1)
+    lesson_id = task_id = module_id = 0
+    for course_id in range(1, course_count + 1):
+        course_dir = root / f"course-{course_id}"
+        (course_dir / "lessons").mkdir(parents=True)
+        (course_dir / "tasks").mkdir()
+        modules = []
+        for m in range(MODULES_PER_COURSE):
+            module_id += 1
+            lessons = []
+            for _ in range(per_course // MODULES_PER_COURSE):
+                lesson_id += 1
+                content_file = f"lessons/{lesson_id}.html"
+                html = "".join(PARAGRAPH.format(word=rnd.choice(WORDS)) for _ in range(20))
+                (course_dir / content_file).write_text(html, encoding="utf-8")
+                lesson = {"id": lesson_id, "title": f"Урок {lesson_id}", "content_file": content_file}
+                if lesson_id % TASK_EVERY == 0:
+                    task_id += 1
+                    checker_file = f"tasks/{task_id}.py"
+                    (course_dir / checker_file).write_text(
+                        f"def test_solve():\n    assert solve() == {task_id}\n", encoding="utf-8"
+                    )
+                    lesson["tasks"] = [
+                        {
+                            "id": task_id,
+                            "title": f"Задание {task_id}",
+                            "description": "<p>Напишите функцию solve.</p>",
+                            "checker_file": checker_file,
+                        }
+                    ]
+                lessons.append(lesson)
+            modules.append({"id": module_id, "title": f"Модуль {module_id}", "lessons": lessons})
+        course = {
+            "id": course_id,
+            "title": f"Курс {course_id}",
+            "description": "Описание курса",
+            "long_description": "Подробное описание курса. " * 10,
+            "category": rnd.choice(["Программирование", "Дизайн", "Аналитика"]),
+            "duration": "3 месяца",
+            "level": rnd.choice(["Начинающий", "Продолжающий"]),
+            "image_path": "./static/photo1.jpg",
+            "materials_path": None,
+            "is_popular": course_id % 7 == 0,
+            "modules": modules,
+        }
+        (course_dir / COURSE_FILE).write_text(json.dumps(course, ensure_ascii=False), encoding="utf-8")
+    return lesson_id
+
+
+def touch_lessons(root, share):
+    # Меняет HTML доли уроков, как правка контента между выпусками
+    files = sorted(root.glob("*/lessons/*.html"))
+    for path in files[:: max(int(1 / share), 1)]:
+        path.write_text(path.read_text(encoding="utf-8") + "<p>Дополнение.</p>\n", encoding="utf-8")
+
+
+def _import_orm(engine, pack_dir):
+    # Как прежний seed_courses: объект на строку и session.add_all
+    rows = load_pack(pack_dir)
+    with Session(engine) as session:
+        session.add_all(Course(**row) for row in rows["courses"])
+        session.add_all(CourseModule(**row) for row in rows["course_modules"])
+        session.add_all(Lesson(**row) for row in rows["lessons"])
+        session.add_all(Task(**row) for row in rows["tasks"])
+        session.commit()
+
+
+def _timed(fn):
+    started = time.perf_counter()
+    result = fn()
+    return round(time.perf_counter() - started, 3), result
+
+
+def bench(course_count, lesson_count):
+    report = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        pack_dir = Path(tmp) / "pack"
+        lessons = write_pack(pack_dir, course_count, lesson_count)
+        report["lessons"] = lessons
+
+        for name, fn in (("orm_add_all", _import_orm), ("import_pack", import_pack)):
+            path = Path(tmp) / f"{name}.db"
+            # Прежняя схема — всё в одном файле, новая — с БД контента рядом
+            content_path = content_path_for(path) if name == "import_pack" else None
+            engine = make_engine(path, pool_size=1, max_overflow=0, content_path=content_path)
+            try:
+                upgrade(engine)
+                report[name], _ = _timed(lambda: fn(engine, pack_dir))
+                if name == "import_pack":
+                    report["reimport_unchanged"], result = _timed(lambda: import_pack(engine, pack_dir))
+                    report["unchanged_version"] = result["content_version"]
+                    touch_lessons(pack_dir, 0.01)
+                    report["reimport_1pct"], result = _timed(lambda: import_pack(engine, pack_dir))
+                    report["updated_lessons"] = len(result["plan"]["lessons"]["update"])
+            finally:
+                engine.dispose()
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Бенчмарк импорта пакета контента")
+    parser.add_argument("--courses", type=int, default=100)
+    parser.add_argument("--lessons", type=int, default=10000)
+    parser.add_argument("--json", help="сохранить результаты в файл")
+    args = parser.parse_args(argv)
+
+    report = bench(args.courses, args.lessons)
+    print(f"курсов {args.courses}, уроков {report['lessons']}")
+    print(f"ORM add_all:                  {report['orm_add_all']:>7} с")
+    print(f"import_pack:                  {report['import_pack']:>7} с")
+    print(f"повторно, без изменений:      {report['reimport_unchanged']:>7} с (версия {report['unchanged_version']})")
+    print(f"повторно, изменено {report['updated_lessons']:>5} ур.: {report['reimport_1pct']:>7} с")
+    if args.json:
+        Path(args.json).write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+# Импорт прогресса группы: прежняя запись «прочитать, затем вставить» по
+# одной строке в своей транзакции против user_state.import_progress
+# (INSERT ... ON CONFLICT, executemany, одна транзакция).
+#
+#   python benchmarks/bench_progress.py [--students 5000] [--lessons 40]
+import argparse
+import json
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from sqlalchemy import insert  # noqa: E402
+from sqlalchemy.orm import Session  # noqa: E402
+
+from db import make_engine  # noqa: E402
+from migrations import upgrade  # noqa: E402
+from models import Course, CourseModule, Lesson, LessonProgress, User  # noqa: E402
+from user_state import import_progress  # noqa: E402
+
+
+def _prepare(engine, students, lessons):
+    upgrade(engine)
+    with engine.begin() as conn:
+        conn.execute(
+            insert(Course.__table__),
+            [
+                {
+                    "id": 1,
+                    "title": "Курс",
+                    "description": "Описание",
+                    "category": "Программирование",
+                    "duration": "1 месяц",
+                    "level": "Начинающий",
+                    "image_path": "./static/photo1.jpg",
+                    "is_popular": False,
+                }
+            ],
+        )
+        conn.execute(insert(CourseModule.__table__), [{"id": 1, "course_id": 1, "title": "Модуль", "order_index": 1}])
+        conn.execute(
+            insert(Lesson.__table__),
+            [{"id": i, "module_id": 1, "title": f"Урок {i}", "order_index": i} for i in range(1, lessons + 1)],
+        )
+        conn.execute(
+            insert(User.__table__),
+            [{"id": i, "username": f"student{i}", "password": "x"} for i in range(1, students + 1)],
+        )
+
+
+def _records(students, lessons):
+    rnd = random.Random(1)
+    for user_id in range(1, students + 1):
+        for lesson_id in range(1, rnd.randint(1, lessons) + 1):
+            yield {"user_id": user_id, "lesson_id": lesson_id, "completed_at": datetime(2024, 1, 1)}
+
+
+def _import_row_by_row(engine, records):
+    # Как прежний api_mark_lesson_completed: запрос, затем вставка или
+    # обновление, по транзакции на запись
+    for record in records:
+        with Session(engine) as session:
+            lp = (
+                session.query(LessonProgress)
+                .filter_by(user_id=record["user_id"], lesson_id=record["lesson_id"])
+                .first()
+            )
+            if not lp:
+                lp = LessonProgress(user_id=record["user_id"], lesson_id=record["lesson_id"])
+                session.add(lp)
+            lp.is_completed = True
+            lp.completed_at = record["completed_at"]
+            session.commit()
+
+
+def _import_bulk(engine, records):
+    with engine.begin() as conn:
+        import_progress(conn, records)
+
+
+def bench(fn, students, lessons, sample):
+    records = list(_records(students, lessons))
+    if sample:
+        records = records[:sample]
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = make_engine(Path(tmp) / "bench.db", pool_size=1, max_overflow=0)
+        try:
+            _prepare(engine, students, lessons)
+            started = time.perf_counter()
+            fn(engine, records)
+            elapsed = time.perf_counter() - started
+        finally:
+            engine.dispose()
+    return {"records": len(records), "seconds": round(elapsed, 3), "per_sec": round(len(records) / elapsed)}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Бенчмарк импорта прогресса")
+    parser.add_argument("--students", type=int, default=5000)
+    parser.add_argument("--lessons", type=int, default=40)
+    parser.add_argument("--row-sample", type=int, default=5000, help="записей для построчного варианта")
+    parser.add_argument("--json", help="сохранить результаты в файл")
+    args = parser.parse_args(argv)
+
+    report = {
+        "построчно": bench(_import_row_by_row, args.students, args.lessons, args.row_sample),
+        "upsert": bench(_import_bulk, args.students, args.lessons, None),
+    }
+    for name, row in report.items():
+        print(f"{name:<10} {row['records']:>8} записей {row['seconds']:>9} с {row['per_sec']:>9} зап/с")
+    if args.json:
+        Path(args.json).write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
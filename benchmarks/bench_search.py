@@ -0,0 +1,114 @@
+# Бенчмарк полнотекстового поиска (search.py) на синтетическом корпусе.
+#
+#   python benchmarks/bench_search.py [--lessons 40000] [--words 300]
+#
+# Слова уроков берутся из словаря с распределением Ципфа, как в реальных
+# текстах: частые слова встречаются почти везде, редкие — в единицах уроков.
+import argparse
+import json
+import random
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from content_pack import import_rows  # noqa: E402
+from db import content_path_for, make_engine  # noqa: E402
+from migrations import upgrade  # noqa: E402
+from search import search, sync_index  # noqa: E402
+
+COURSES = 200
+MODULES_PER_COURSE = 10
+TERMS = "функция цикл список словарь класс объект исключение вёрстка html css python django запрос индекс".split()
+SYLLABLES = "ка ло ми ну ре та по ви са до ке лю на ро ти".split()
+QUERIES = ["функция", "фу", "вёрстка html", "python django запрос", "исключ", "кало"]
+
+
+def _vocabulary(rnd, size=20000):
+    words = TERMS + ["".join(rnd.choice(SYLLABLES) for _ in range(rnd.randint(2, 4))) for _ in range(size)]
+    rnd.shuffle(words)
+    return words, [1 / (rank + 1) for rank in range(len(words))]
+
+
+def _prepare(engine, lessons, words_per_lesson):
+    rnd = random.Random(1)
+    words, weights = _vocabulary(rnd)
+    modules = COURSES * MODULES_PER_COURSE
+    upgrade(engine)
+    # Индекс собирается при публикации БД контента
+    import_rows(
+        engine,
+        {
+            "courses": [
+                {
+                    "id": i,
+                    "title": f"Курс {i} {rnd.choice(TERMS)}",
+                    "description": " ".join(rnd.choices(words, weights, k=20)),
+                    "category": "Программирование",
+                    "duration": "1 месяц",
+                    "level": "Начинающий",
+                    "image_path": "./static/photo1.jpg",
+                    "long_description": None,
+                    "materials_path": None,
+                    "is_popular": False,
+                }
+                for i in range(1, COURSES + 1)
+            ],
+            "course_modules": [
+                {"id": i, "course_id": (i - 1) // MODULES_PER_COURSE + 1, "title": f"Модуль {rnd.choice(words)}", "order_index": i}
+                for i in range(1, modules + 1)
+            ],
+            "lessons": [
+                {
+                    "id": i,
+                    "module_id": (i - 1) % modules + 1,
+                    "title": f"Урок {rnd.choice(words)}",
+                    "order_index": i,
+                    "content": "<p>" + " ".join(rnd.choices(words, weights, k=words_per_lesson)) + "</p>",
+                }
+                for i in range(1, lessons + 1)
+            ],
+            "tasks": [],
+        },
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Бенчмарк полнотекстового поиска")
+    parser.add_argument("--lessons", type=int, default=40000)
+    parser.add_argument("--words", type=int, default=300, help="слов в уроке")
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--json", help="сохранить результаты в файл")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "bench.db"
+        engine = make_engine(path, pool_size=1, max_overflow=0, content_path=content_path_for(path))
+        try:
+            started = time.perf_counter()
+            _prepare(engine, args.lessons, args.words)
+            report = {"publish_seconds": round(time.perf_counter() - started, 2), "queries": {}}
+            if not sync_index(engine):
+                sys.exit("SQLite собран без FTS5")
+            with engine.connect() as conn:
+                for query in QUERIES:
+                    hits = search(conn, query)
+                    started = time.perf_counter()
+                    for _ in range(args.repeat):
+                        search(conn, query)
+                    elapsed = (time.perf_counter() - started) / args.repeat
+                    report["queries"][query] = {"ms": round(elapsed * 1000, 2), "hits": len(hits)}
+        finally:
+            engine.dispose()
+
+    print(f"Публикация контента с индексом: {report['publish_seconds']} с")
+    for query, row in report["queries"].items():
+        print(f"{query:<24} {row['ms']:>8} мс {row['hits']:>4} совпадений")
+    if args.json:
+        Path(args.json).write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,248 @@
+# Нагрузочный тест серверного режима (server.py): много учеников
+# одновременно входят и ходят по курсам, как из браузера.
+#
+#   python benchmarks/bench_server.py                                  # 200 учеников, 30 с
+#   python benchmarks/bench_server.py --learners 500 --workers 4 --duration 60 --json server.json
+#   python benchmarks/bench_server.py --think 0                        # предельная пропускная способность
+#
+# datagen.py создаёт БД во временном каталоге, server.py запускается на ней
+# отдельным процессом. Каждый ученик — гринлет со своим соединением и cookie
+# сессии: вход, затем случайные шаги из SCENARIO с паузой --think между ними.
+# В отчёте перцентили задержки по эндпоинтам, запросов в секунду и ошибки;
+# ответ api_get_current_user сверяется с именем ученика, так что перепутанные
+# между сессиями ученики тоже считаются ошибкой.
+from gevent import monkey
+
+monkey.patch_all()
+
+import argparse  # noqa: E402
+import http.client  # noqa: E402
+import json  # noqa: E402
+import os  # noqa: E402
+import platform  # noqa: E402
+import random  # noqa: E402
+import signal  # noqa: E402
+import socket  # noqa: E402
+import subprocess  # noqa: E402
+import sys  # noqa: E402
+import tempfile  # noqa: E402
+import time  # noqa: E402
+from collections import Counter, defaultdict  # noqa: E402
+from pathlib import Path  # noqa: E402
+
+import gevent  # noqa: E402
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from bench_api import _git_revision, _stats  # noqa: E402
+from datagen import SCALES, USER_PASSWORD, correct_solution  # noqa: E402
+
+SERVER_START_TIMEOUT = 60
+COOKIE = "bravelearn_session"
+
+# Шаги ученика: (эндпоинт, вес, аргументы (ctx, rnd) -> list)
+SCENARIO = [
+    ("api_get_courses", 3, lambda ctx, rnd: []),
+    ("api_get_course_page", 3, lambda ctx, rnd: [rnd.randint(1, ctx["courses"])]),
+    ("api_get_lesson", 4, lambda ctx, rnd: [rnd.randint(1, ctx["lessons"])]),
+    ("api_mark_lesson_completed", 2, lambda ctx, rnd: [rnd.randint(1, ctx["lessons"])]),
+    ("api_search", 1, lambda ctx, rnd: [rnd.choice(["python", "словарь", "функц", "декоратор класс"])]),
+    ("api_toggle_favorite", 1, lambda ctx, rnd: [rnd.randint(1, ctx["courses"])]),
+    ("api_get_current_user", 1, lambda ctx, rnd: []),
+    ("api_run_python", 1, None),
+]
+
+
+class Learner:
+    def __init__(self, host, port, username):
+        self.conn = http.client.HTTPConnection(host, port, timeout=60)
+        self.username = username
+        self.cookie = None
+
+    def call(self, name, args):
+        headers = {"Content-Type": "application/json"}
+        if self.cookie:
+            headers["Cookie"] = self.cookie
+        self.conn.request("POST", f"/api/{name}", body=json.dumps(args), headers=headers)
+        response = self.conn.getresponse()
+        body = response.read()
+        set_cookie = response.getheader("Set-Cookie")
+        if set_cookie and set_cookie.startswith(COOKIE + "="):
+            self.cookie = set_cookie.split(";", 1)[0]
+        return response.status, json.loads(body)
+
+
+def _check(name, status, result, learner):
+    # Текст ошибки или None
+    if status != 200:
+        return f"HTTP {status}"
+    if name == "api_login" and not result.get("ok"):
+        return "вход не удался"
+    if name == "api_get_current_user" and (result or {}).get("username") != learner.username:
+        return "чужой ученик в сессии"
+    if name == "api_run_python" and not (result.get("ok") and result.get("result", {}).get("is_passed")):
+        return "проверка решения не прошла"
+    return None
+
+
+def run_learner(learner, ctx, rnd, deadline, think, latencies, errors):
+    steps = [step for step in SCENARIO for _ in range(step[1])]
+    plan = [("api_login", lambda ctx, rnd: [learner.username, USER_PASSWORD])]
+    while time.monotonic() < deadline:
+        if plan:
+            name, make_args = plan.pop()
+        else:
+            name, _, make_args = rnd.choice(steps)
+        if make_args is None:
+            task_id = rnd.randint(1, ctx["tasks"])
+            args = [correct_solution(task_id), task_id]
+        else:
+            args = make_args(ctx, rnd)
+        started = time.perf_counter()
+        try:
+            status, result = learner.call(name, args)
+        except (OSError, http.client.HTTPException, ValueError) as exc:
+            errors[f"{name}: {exc.__class__.__name__}"] += 1
+            learner.conn.close()
+            gevent.sleep(think or 0.1)
+            continue
+        latencies[name].append(time.perf_counter() - started)
+        problem = _check(name, status, result, learner)
+        if problem:
+            errors[f"{name}: {problem}"] += 1
+        if think:
+            gevent.sleep(rnd.uniform(0.5, 1.5) * think)
+
+
+def _wait_port(port, proc):
+    deadline = time.monotonic() + SERVER_START_TIMEOUT
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise SystemExit("server.py завершился при запуске")
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise SystemExit("server.py не начал принимать соединения")
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def bench(args, tmp):
+    from datagen import generate
+    from db import content_path_for, make_engine
+
+    path = Path(tmp) / "server.db"
+    engine = make_engine(path, pool_size=1, max_overflow=0, content_path=content_path_for(path))
+    try:
+        counts = generate(engine, seed=args.seed, **SCALES[args.scale])
+    finally:
+        engine.dispose()
+
+    port = _free_port()
+    env = dict(os.environ, BRAVELEARN_DB_PATH=str(path))
+    log_path = Path(tmp) / "server.log"
+    with open(log_path, "wb") as log:
+        proc = subprocess.Popen(
+            [sys.executable, str(ROOT / "server.py"), "--host", "127.0.0.1", "--port", str(port)]
+            + (["--workers", str(args.workers)] if args.workers else []),
+            env=env,
+            stdout=log,
+            stderr=subprocess.STDOUT,
+        )
+        try:
+            _wait_port(port, proc)
+            latencies = defaultdict(list)
+            errors = Counter()
+            rnd = random.Random(args.seed)
+            started = time.monotonic()
+            deadline = started + args.ramp + args.duration
+            learners = []
+            for i in range(args.learners):
+                learner = Learner("127.0.0.1", port, f"user{i % counts['users'] + 1}")
+                learners.append(
+                    gevent.spawn_later(
+                        args.ramp * i / args.learners,
+                        run_learner,
+                        learner,
+                        counts,
+                        random.Random(rnd.random()),
+                        deadline,
+                        args.think,
+                        latencies,
+                        errors,
+                    )
+                )
+            gevent.joinall(learners)
+            elapsed = time.monotonic() - started
+        finally:
+            proc.send_signal(signal.SIGTERM)
+            proc.wait()
+    requests = sum(len(values) for values in latencies.values())
+    report = {
+        "revision": _git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "workers": args.workers,
+        "learners": args.learners,
+        "think_s": args.think,
+        "data": counts,
+        "requests": requests,
+        "per_sec": round(requests / elapsed, 1),
+        "errors": dict(errors),
+        "endpoints": {name: _stats(values, elapsed) for name, values in sorted(latencies.items())},
+    }
+    if errors:
+        report["server_log"] = log_path.read_text(encoding="utf-8", errors="replace")[-4000:]
+    return report
+
+
+def print_report(report):
+    workers = report["workers"] or "по числу ядер"
+    print(
+        f"учеников {report['learners']}, процессов {workers}, ядер {report['cpus']}: "
+        f"{report['requests']} запросов, {report['per_sec']} в секунду"
+    )
+    print(f"  {'эндпоинт':<28} {'p50, мс':>9} {'p90, мс':>9} {'p99, мс':>9} {'max, мс':>9} {'запр/с':>9}")
+    for name, row in report["endpoints"].items():
+        print(
+            f"  {name:<28} {row['p50_ms']:>9} {row['p90_ms']:>9} {row['p99_ms']:>9} "
+            f"{row['max_ms']:>9} {row['per_sec']:>9}"
+        )
+    for problem, count in sorted(report["errors"].items()):
+        print(f"  ошибка: {problem} — {count}")
+    if report.get("server_log"):
+        print(report["server_log"], file=sys.stderr)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Нагрузочный тест серверного режима")
+    parser.add_argument("--learners", type=int, default=200, help="одновременных учеников")
+    parser.add_argument("--duration", type=float, default=30, help="секунд нагрузки после разгона")
+    parser.add_argument("--ramp", type=float, default=5, help="секунд на подключение всех учеников")
+    parser.add_argument("--think", type=float, default=1.0, help="средняя пауза ученика между шагами, с")
+    parser.add_argument("--workers", type=int, help="процессов server.py (по умолчанию по числу ядер)")
+    parser.add_argument("--scale", choices=sorted(SCALES), default="small", help="размер БД из datagen.py")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--json", help="сохранить результаты в файл")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        report = bench(args, tmp)
+    print_report(report)
+    if args.json:
+        Path(args.json).write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+    if report["errors"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+# Сравнение профилей хранения SQLite из db.STORAGE_PROFILES.
+#
+#   python benchmarks/bench_storage.py [--threads 8] [--ops 300]
+#
+# Для каждого профиля создаётся временная БД, после чего измеряются
+# чтение (урок по id), запись (отметка прогресса отдельной транзакцией тем
+# же upsert, что и api_mark_lesson_completed: повторная отметка не нарушает
+# уникальность) и смешанная нагрузка из нескольких потоков.
+import argparse
+import json
+import random
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from sqlalchemy import insert, select  # noqa: E402
+from sqlalchemy.exc import OperationalError  # noqa: E402
+
+from db import STORAGE_PROFILES, make_engine  # noqa: E402
+from models import Base, Course, CourseModule, Lesson, User  # noqa: E402
+from user_state import mark_lessons_completed  # noqa: E402
+
+LESSONS = 500
+USERS = 200
+
+
+def _prepare(engine):
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        conn.execute(
+            insert(Course.__table__),
+            [
+                {
+                    "id": 1,
+                    "title": "Курс",
+                    "description": "Описание",
+                    "category": "Программирование",
+                    "duration": "1 месяц",
+                    "level": "Начинающий",
+                    "image_path": "./static/photo1.jpg",
+                    "is_popular": False,
+                }
+            ],
+        )
+        conn.execute(insert(CourseModule.__table__), [{"id": 1, "course_id": 1, "title": "Модуль", "order_index": 1}])
+        conn.execute(
+            insert(Lesson.__table__),
+            [
+                {"id": i, "module_id": 1, "title": f"Урок {i}", "order_index": i, "content": "<p>текст</p>" * 50}
+                for i in range(1, LESSONS + 1)
+            ],
+        )
+        conn.execute(
+            insert(User.__table__),
+            [{"id": i, "username": f"user{i}", "password": "x"} for i in range(1, USERS + 1)],
+        )
+
+
+def _read_op(engine, rnd):
+    with engine.connect() as conn:
+        conn.execute(select(Lesson.__table__).where(Lesson.__table__.c.id == rnd.randint(1, LESSONS))).first()
+
+
+def _write_op(engine, rnd):
+    with engine.begin() as conn:
+        mark_lessons_completed(conn, rnd.randint(1, USERS), [rnd.randint(1, LESSONS)])
+
+
+def _run_threads(engine, threads, ops, pick_op):
+    errors = []
+
+    def worker(seed):
+        rnd = random.Random(seed)
+        for _ in range(ops):
+            try:
+                pick_op(rnd)(engine, rnd)
+            except OperationalError as exc:
+                errors.append(str(exc.orig))
+
+    pool = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    started = time.perf_counter()
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    elapsed = time.perf_counter() - started
+    return {"ops_per_sec": round(threads * ops / elapsed, 1), "seconds": round(elapsed, 3), "errors": len(errors)}
+
+
+def bench_profile(profile, threads, ops):
+    with tempfile.TemporaryDirectory() as tmp:
+        engine = make_engine(Path(tmp) / "bench.db", profile, pool_size=threads, max_overflow=0)
+        try:
+            _prepare(engine)
+            return {
+                "read": _run_threads(engine, threads, ops, lambda rnd: _read_op),
+                "write": _run_threads(engine, threads, ops, lambda rnd: _write_op),
+                "mixed": _run_threads(
+                    engine, threads, ops, lambda rnd: _write_op if rnd.random() < 0.2 else _read_op
+                ),
+            }
+        finally:
+            engine.dispose()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Бенчмарк профилей хранения SQLite")
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--ops", type=int, default=300, help="операций на поток")
+    parser.add_argument("--profile", nargs="*", default=list(STORAGE_PROFILES))
+    parser.add_argument("--json", help="сохранить результаты в файл")
+    args = parser.parse_args(argv)
+
+    report = {profile: bench_profile(profile, args.threads, args.ops) for profile in args.profile}
+    print(f"{'профиль':<12} {'нагрузка':<8} {'оп/с':>10} {'сек':>8} {'ошибок':>7}")
+    for profile, rows in report.items():
+        for name, row in rows.items():
+            print(f"{profile:<12} {name:<8} {row['ops_per_sec']:>10} {row['seconds']:>8} {row['errors']:>7}")
+    if args.json:
+        Path(args.json).write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+# Отложенная загрузка и сжатие больших текстовых столбцов (text_storage.py).
+#
+#   python benchmarks/bench_text_storage.py [--lessons 2000] [--attempts 5000]
+#
+# «до» — все столбцы грузятся сразу (undefer("*")) и тексты хранятся как есть,
+# «после» — отложенные столбцы из models.py и сжатие HTML уроков и вывода
+# попыток (blobs). Для каждого варианта измеряются размер файла БД, время и пик
+# памяти (tracemalloc) запросов структуры курса и урока с заданием.
+import argparse
+import json
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from sqlalchemy import insert, select  # noqa: E402
+from sqlalchemy.orm import Session, undefer, undefer_group  # noqa: E402
+
+from attempt_storage import record_attempts  # noqa: E402
+from db import checkpoint, make_engine  # noqa: E402
+from models import Base, Blob, Course, CourseModule, Lesson, Task, User  # noqa: E402
+
+MODULES = 20
+PARAGRAPH = (
+    "<p>В этом разделе разбираем <code>{word}</code>: синтаксис, типичные ошибки и "
+    "примеры из практики. Повторите пример из урока и измените его под свою задачу.</p>\n"
+)
+WORDS = "list dict set tuple generator decorator class module exception context".split()
+
+
+def _lesson_html(rnd):
+    return "<h2>Урок</h2>\n" + "".join(PARAGRAPH.format(word=rnd.choice(WORDS)) for _ in range(40))
+
+
+def _prepare(engine, lessons, attempts):
+    rnd = random.Random(1)
+    Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        conn.execute(
+            insert(Course.__table__),
+            [
+                {
+                    "id": 1,
+                    "title": "Курс",
+                    "description": "Описание",
+                    "long_description": "Подробное описание курса. " * 40,
+                    "category": "Программирование",
+                    "duration": "1 месяц",
+                    "level": "Начинающий",
+                    "image_path": "./static/photo1.jpg",
+                    "is_popular": False,
+                }
+            ],
+        )
+        conn.execute(
+            insert(CourseModule.__table__),
+            [{"id": i, "course_id": 1, "title": f"Модуль {i}", "order_index": i} for i in range(1, MODULES + 1)],
+        )
+        conn.execute(
+            insert(Lesson.__table__),
+            [
+                {
+                    "id": i,
+                    "module_id": (i - 1) % MODULES + 1,
+                    "title": f"Урок {i}",
+                    "order_index": i,
+                    "content": _lesson_html(rnd),
+                }
+                for i in range(1, lessons + 1)
+            ],
+        )
+        conn.execute(
+            insert(Task.__table__),
+            [
+                {
+                    "id": i,
+                    "lesson_id": i,
+                    "title": f"Задание {i}",
+                    "description": "<p>Напишите функцию.</p>" * 5,
+                    "starter_code": "def solve():\n    pass\n",
+                    "checker_code": "def test_solve():\n    assert solve() is None\n" * 20,
+                }
+                for i in range(1, lessons + 1)
+            ],
+        )
+        conn.execute(insert(User.__table__), [{"id": 1, "username": "user", "password": "x"}])
+        record_attempts(
+            conn,
+            [
+                {
+                    "task_id": rnd.randint(1, lessons),
+                    "user_id": 1,
+                    "code": f"def solve():\n    return sum(range({i}))\n" * 5,
+                    "is_passed": False,
+                    "output": f"Traceback (most recent call last):\n  File \"<main>\", line {i}\nAssertionError\n" * 20,
+                }
+                for i in range(attempts)
+            ],
+        )
+
+
+def _course_structure(session, eager):
+    # Структура курса через ORM: модули и уроки без текстов
+    options = [undefer("*")] if eager else []
+    modules = session.scalars(
+        select(CourseModule).where(CourseModule.course_id == 1).order_by(CourseModule.order_index)
+    ).all()
+    lessons = session.scalars(
+        select(Lesson).options(*options).where(Lesson.module_id.in_([m.id for m in modules]))
+    ).all()
+    course = session.scalars(select(Course).options(*options).where(Course.id == 1)).one()
+    return {"course": course.title, "lessons": [(lesson.id, lesson.title) for lesson in lessons]}
+
+
+def _lesson(session, lesson_id, eager):
+    # Урок с заданием, как в app._lesson_data
+    lesson_options = [undefer("*")] if eager else [undefer(Lesson.content)]
+    task_options = [undefer("*")] if eager else [undefer_group("task_text")]
+    lesson = session.get(Lesson, lesson_id, options=lesson_options)
+    task = session.scalars(select(Task).options(*task_options).where(Task.lesson_id == lesson_id)).first()
+    return {"content_html": lesson.content, "task": task.description + (task.starter_code or "")}
+
+
+def _measure(engine, fn, repeat):
+    rnd = random.Random(2)
+    tracemalloc.start()
+    peak = 0
+    started = time.perf_counter()
+    for _ in range(repeat):
+        tracemalloc.reset_peak()
+        with Session(engine) as session:
+            fn(session, rnd)
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+    elapsed = time.perf_counter() - started
+    tracemalloc.stop()
+    return {"ms": round(elapsed / repeat * 1000, 3), "peak_kb": round(peak / 1024, 1)}
+
+
+def bench_variant(compress, eager, lessons, attempts, repeat):
+    for column in (Lesson.__table__.c.content, Blob.__table__.c.content):
+        column.type.compress = compress
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "bench.db"
+        engine = make_engine(path, pool_size=1, max_overflow=0)
+        try:
+            _prepare(engine, lessons, attempts)
+            with engine.connect() as conn:
+                conn.exec_driver_sql("VACUUM")
+            # VACUUM в режиме WAL пишет новую БД в -wal: без checkpoint основной
+            # файл остаётся почти пустым
+            checkpoint(engine)
+            files = (path, path.with_name(path.name + "-wal"))
+            size = sum(file.stat().st_size for file in files if file.exists())
+            return {
+                "db_mb": round(size / 1024 / 1024, 2),
+                "course_structure": _measure(engine, lambda s, rnd: _course_structure(s, eager), repeat),
+                "lesson": _measure(engine, lambda s, rnd: _lesson(s, rnd.randint(1, lessons), eager), repeat * 10),
+            }
+        finally:
+            engine.dispose()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Бенчмарк отложенных и сжатых текстовых столбцов")
+    parser.add_argument("--lessons", type=int, default=2000)
+    parser.add_argument("--attempts", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--json", help="сохранить результаты в файл")
+    args = parser.parse_args(argv)
+
+    report = {
+        "до": bench_variant(False, True, args.lessons, args.attempts, args.repeat),
+        "после": bench_variant(True, False, args.lessons, args.attempts, args.repeat),
+    }
+    print(f"{'вариант':<8} {'БД, МБ':>8} {'структура, мс':>14} {'пик, КБ':>9} {'урок, мс':>9} {'пик, КБ':>9}")
+    for name, row in report.items():
+        structure, lesson = row["course_structure"], row["lesson"]
+        print(
+            f"{name:<8} {row['db_mb']:>8} {structure['ms']:>14} {structure['peak_kb']:>9}"
+            f" {lesson['ms']:>9} {lesson['peak_kb']:>9}"
+        )
+    if args.json:
+        Path(args.json).write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,211 @@
+# Синтетическая БД для бенчмарков: пользователи, курсы с модулями, уроками и
+# заданиями, прогресс и попытки.
+#
+#   python benchmarks/datagen.py bench.db --scale medium
+#   python benchmarks/datagen.py bench.db --users 1000 --courses 50 --lessons 5000 \
+#       --progress 100000 --attempts 20000
+#
+# Контент публикуется как импорт пакета (content_pack.import_rows) в БД
+# контента рядом с файлом (bench.db -> bench.content.db), прогресс —
+# user_state.import_progress, попытки — attempt_storage.record_attempts,
+# то есть теми же путями, что и в приложении. Данные детерминированы (seed).
+import argparse
+import json
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from sqlalchemy import insert  # noqa: E402
+
+from attempt_storage import record_attempts  # noqa: E402
+from content_pack import import_rows  # noqa: E402
+from db import content_path_for, make_engine  # noqa: E402
+from migrations import upgrade  # noqa: E402
+from models import User  # noqa: E402
+from user_state import import_progress  # noqa: E402
+
+SCALES = {
+    "small": {"users": 100, "courses": 10, "lessons": 500, "progress": 5_000, "attempts": 2_000},
+    "medium": {"users": 1_000, "courses": 50, "lessons": 5_000, "progress": 100_000, "attempts": 20_000},
+    "large": {"users": 10_000, "courses": 100, "lessons": 10_000, "progress": 1_000_000, "attempts": 200_000},
+}
+
+USER_PASSWORD = "password"
+MODULES_PER_COURSE = 10
+TASK_EVERY = 5
+CHUNK = 10_000
+
+# Слова уроков: по ним же бенчмарк ищет через api_search
+WORDS = "python список словарь функция класс цикл исключение генератор декоратор модуль запрос таблица".split()
+CATEGORIES = ["Программирование", "Дизайн", "Аналитика", "Маркетинг"]
+LEVELS = ["Начинающий", "Продолжающий", "Интенсив"]
+
+# Задание n: solve(x) должна вернуть x * n; правильное и неправильное решения
+CHECKER = "def test_solve():\n    \"solve(3)\"\n    assert solve(3) == {expected}\n"
+SOLUTIONS = [
+    "def solve(x):\n    return x * {factor}\n",
+    "def solve(x):\n    return x + {factor}\n",
+    "def solve(x):\n    result = 0\n    for _ in range({factor}):\n        result += x\n    return result\n",
+]
+
+
+def task_factor(task_id: int) -> int:
+    return task_id % 7 + 2
+
+
+def correct_solution(task_id: int) -> str:
+    return SOLUTIONS[0].format(factor=task_factor(task_id))
+
+
+def content_rows(course_count, lesson_count, rnd) -> dict:
+    # Строки в формате content_pack.load_pack
+    rows = {"courses": [], "course_modules": [], "lessons": [], "tasks": []}
+    per_module = max(lesson_count // (course_count * MODULES_PER_COURSE), 1)
+    module_id = lesson_id = task_id = 0
+    for course_id in range(1, course_count + 1):
+        rows["courses"].append(
+            {
+                "id": course_id,
+                "title": f"Курс {course_id}: {rnd.choice(WORDS)}",
+                "description": f"Описание курса {course_id}",
+                "long_description": "Подробное описание курса. " * 10,
+                "category": rnd.choice(CATEGORIES),
+                "duration": f"{rnd.randint(1, 6)} месяцев",
+                "level": rnd.choice(LEVELS),
+                "image_path": "./static/photo1.jpg",
+                "materials_path": None,
+                "is_popular": rnd.random() < 0.2,
+            }
+        )
+        for module_index in range(1, MODULES_PER_COURSE + 1):
+            module_id += 1
+            rows["course_modules"].append(
+                {"id": module_id, "course_id": course_id, "title": f"Модуль {module_id}", "order_index": module_index}
+            )
+            for lesson_index in range(1, per_module + 1):
+                lesson_id += 1
+                paragraphs = "".join(
+                    f"<p>{' '.join(rnd.choice(WORDS) for _ in range(12))}.</p>\n" for _ in range(15)
+                )
+                rows["lessons"].append(
+                    {
+                        "id": lesson_id,
+                        "module_id": module_id,
+                        "title": f"Урок {lesson_id}: {rnd.choice(WORDS)}",
+                        "order_index": lesson_index,
+                        "content": f"<h2>Урок {lesson_id}</h2>\n{paragraphs}",
+                    }
+                )
+                if lesson_id % TASK_EVERY == 0:
+                    task_id += 1
+                    rows["tasks"].append(
+                        {
+                            "id": task_id,
+                            "lesson_id": lesson_id,
+                            "title": f"Задание {task_id}",
+                            "description": f"<p>Функция solve(x) возвращает x * {task_factor(task_id)}.</p>",
+                            "starter_code": "def solve(x):\n    pass\n",
+                            "checker_code": CHECKER.format(expected=3 * task_factor(task_id)),
+                        }
+                    )
+    return rows
+
+
+def _progress_records(users, lesson_ids, count, rnd):
+    # Ученик проходит уроки подряд с начала курса, как в приложении
+    started = datetime(2024, 1, 1)
+    produced = 0
+    while produced < count:
+        user_id = rnd.randint(1, users)
+        first = rnd.randrange(len(lesson_ids))
+        for lesson_id in lesson_ids[first : first + rnd.randint(1, 30)]:
+            yield {"user_id": user_id, "lesson_id": lesson_id, "completed_at": started + timedelta(minutes=produced)}
+            produced += 1
+            if produced >= count:
+                return
+
+
+def _attempt_rows(users, task_ids, count, rnd):
+    started = datetime(2024, 1, 1)
+    for i in range(count):
+        task_id = rnd.choice(task_ids)
+        template = rnd.choice(SOLUTIONS)
+        code = template.format(factor=task_factor(task_id))
+        is_passed = template is SOLUTIONS[0] or template is SOLUTIONS[2]
+        yield {
+            "task_id": task_id,
+            "user_id": rnd.randint(1, users),
+            "code": code,
+            "is_passed": is_passed,
+            "output": "" if is_passed else "AssertionError: solve(3)",
+            "created_at": started + timedelta(seconds=i),
+        }
+
+
+def _chunks(items, size):
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def generate(bind, users, courses, lessons, progress, attempts, seed=1) -> dict:
+    rnd = random.Random(seed)
+    upgrade(bind)
+    rows = content_rows(courses, lessons, rnd)
+    import_rows(bind, rows)
+    with bind.begin() as conn:
+        conn.execute(
+            insert(User.__table__),
+            [{"id": i, "username": f"user{i}", "password": USER_PASSWORD} for i in range(1, users + 1)],
+        )
+        imported = import_progress(conn, _progress_records(users, [r["id"] for r in rows["lessons"]], progress, rnd))
+    task_ids = [r["id"] for r in rows["tasks"]]
+    if task_ids:
+        for chunk in _chunks(_attempt_rows(users, task_ids, attempts, rnd), CHUNK):
+            with bind.begin() as conn:
+                record_attempts(conn, chunk)
+    return {
+        "users": users,
+        "courses": courses,
+        "modules": len(rows["course_modules"]),
+        "lessons": len(rows["lessons"]),
+        "tasks": len(task_ids),
+        "progress": imported,
+        "attempts": attempts if task_ids else 0,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Синтетическая БД для бенчмарков")
+    parser.add_argument("path", help="файл новой БД")
+    parser.add_argument("--scale", choices=sorted(SCALES), default="small", help="готовый набор размеров")
+    for name in SCALES["small"]:
+        parser.add_argument(f"--{name}", type=int, help="переопределить размер набора")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args(argv)
+
+    path = Path(args.path)
+    if path.exists():
+        parser.error(f"{path} уже существует")
+    sizes = {name: getattr(args, name) if getattr(args, name) is not None else value for name, value in SCALES[args.scale].items()}
+    engine = make_engine(path, pool_size=1, max_overflow=0, content_path=content_path_for(path))
+    started = time.perf_counter()
+    try:
+        counts = generate(engine, seed=args.seed, **sizes)
+    finally:
+        engine.dispose()
+    print(json.dumps(counts, ensure_ascii=False))
+    print(f"Время: {time.perf_counter() - started:.1f} с", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,165 @@
+import base64
+import json
+
+from sqlalchemy import and_, exists, func, or_, select, tuple_
+
+from content_cache import CATALOG_FIELDS, favorite_course_ids
+from models import Course, FavoriteCourse
+
+courses = Course.__table__
+favorites = FavoriteCourse.__table__
+
+DEFAULT_LIMIT = 24
+MAX_LIMIT = 100
+
+# Сортировки каталога: ключ keyset-курсора всегда заканчивается id
+SORTS = ("id", "title", "popular")
+# Типы ключа курсора перед id для каждой сортировки
+_CURSOR_KEYS = {"id": (), "title": (str,), "popular": (bool,)}
+# Значения флагов (popular, favorites_only) из параметров запроса
+_FLAGS = {"1": True, "true": True, "yes": True, "0": False, "false": False, "no": False}
+
+
+class CatalogQueryError(ValueError):
+    pass
+
+
+def encode_cursor(sort, row) -> str:
+    key = {"id": [], "title": [row["title"]], "popular": [bool(row["is_popular"])]}[sort]
+    payload = json.dumps([sort, *key, row["id"]], ensure_ascii=False).encode("utf-8")
+    return base64.urlsafe_b64encode(payload).decode("ascii")
+
+
+def decode_cursor(sort, cursor):
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+    except (AttributeError, ValueError, UnicodeError):
+        raise CatalogQueryError("Некорректный курсор")
+    if not isinstance(payload, list) or not payload or payload[0] != sort:
+        raise CatalogQueryError("Курсор не соответствует сортировке")
+    key = payload[1:]
+    types = (*_CURSOR_KEYS[sort], int)
+    # bool — подкласс int, поэтому id проверяется отдельно
+    if len(key) != len(types) or not all(isinstance(v, t) for v, t in zip(key, types)) or isinstance(key[-1], bool):
+        raise CatalogQueryError("Некорректный курсор")
+    return key
+
+
+def parse_flag(value, name):
+    # None и "" — фильтр не задан; строки из URL разбираются явно, bool("false") — True
+    if value is None or value == "":
+        return None
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, int) and value in (0, 1):
+        return bool(value)
+    if isinstance(value, str) and value.strip().lower() in _FLAGS:
+        return _FLAGS[value.strip().lower()]
+    raise CatalogQueryError(f"Некорректное значение {name}")
+
+
+def parse_limit(limit):
+    if limit is None or limit == "":
+        return DEFAULT_LIMIT
+    if isinstance(limit, bool):
+        raise CatalogQueryError("Некорректный limit")
+    try:
+        limit = int(limit)
+    except (TypeError, ValueError):
+        raise CatalogQueryError("Некорректный limit")
+    return max(1, min(limit, MAX_LIMIT))
+
+
+def _keyset_condition(sort, key):
+    if sort == "id":
+        (last_id,) = key
+        return courses.c.id > last_id
+    if sort == "title":
+        last_title, last_id = key
+        return tuple_(courses.c.title, courses.c.id) > tuple_(last_title, last_id)
+    # popular: сначала популярные, внутри группы по id
+    last_popular, last_id = key
+    last_popular = 1 if last_popular else 0
+    return or_(
+        courses.c.is_popular < last_popular,
+        and_(courses.c.is_popular == last_popular, courses.c.id > last_id),
+    )
+
+
+def _order_by(sort):
+    if sort == "title":
+        return (courses.c.title, courses.c.id)
+    if sort == "popular":
+        return (courses.c.is_popular.desc(), courses.c.id)
+    return (courses.c.id,)
+
+
+def query_catalog(
+    conn,
+    user_id=None,
+    category=None,
+    level=None,
+    popular=None,
+    favorites_only=False,
+    sort="id",
+    cursor=None,
+    limit=DEFAULT_LIMIT,
+):
+    if sort not in SORTS:
+        raise CatalogQueryError("Неизвестная сортировка")
+    limit = parse_limit(limit)
+    popular = parse_flag(popular, "popular")
+    favorites_only = parse_flag(favorites_only, "favorites_only") or False
+
+    # Условия, общие для страницы и фасетов. Фильтры по категории и уровню
+    # к фасетам не применяются: фасет категории считается с учётом уровня
+    # и наоборот, поэтому обе раскладки берутся из одного GROUP BY.
+    base = []
+    if popular is not None:
+        base.append(courses.c.is_popular.is_(popular))
+    if favorites_only:
+        if user_id is None:
+            return {"courses": [], "next_cursor": None, "total": 0, "facets": {"category": {}, "level": {}}}
+        base.append(exists().where(favorites.c.course_id == courses.c.id, favorites.c.user_id == user_id))
+
+    facet_rows = conn.execute(
+        select(courses.c.category, courses.c.level, func.count())
+        .where(*base)
+        .group_by(courses.c.category, courses.c.level)
+    ).all()
+    facets = {"category": {}, "level": {}}
+    total = 0
+    for row_category, row_level, count in facet_rows:
+        if level is None or row_level == level:
+            facets["category"][row_category] = facets["category"].get(row_category, 0) + count
+        if category is None or row_category == category:
+            facets["level"][row_level] = facets["level"].get(row_level, 0) + count
+        if (level is None or row_level == level) and (category is None or row_category == category):
+            total += count
+
+    filters = list(base)
+    if category is not None:
+        filters.append(courses.c.category == category)
+    if level is not None:
+        filters.append(courses.c.level == level)
+    if cursor:
+        filters.append(_keyset_condition(sort, decode_cursor(sort, cursor)))
+
+    rows = (
+        conn.execute(
+            select(*(courses.c[name] for name in CATALOG_FIELDS))
+            .where(*filters)
+            .order_by(*_order_by(sort))
+            .limit(limit + 1)
+        )
+        .mappings()
+        .all()
+    )
+    page = rows[:limit]
+    fav_ids = favorite_course_ids(conn, user_id)
+    return {
+        "courses": [dict(row, is_favorite=row["id"] in fav_ids) for row in page],
+        "next_cursor": encode_cursor(sort, page[-1]) if len(rows) > limit else None,
+        "total": total,
+        "facets": facets,
+    }
@@ -0,0 +1,132 @@
+import math
+import os
+import sys
+
+
+def _env_int(name: str, default: int) -> int:
+    value = os.environ.get(name)
+    if value is None or not value.strip():
+        return default
+    return int(value)
+
+
+def _env_str(name: str, default: str) -> str:
+    value = os.environ.get(name)
+    if value is None or not value.strip():
+        return default
+    return value.strip()
+
+
+def _env_float(name: str, default: float) -> float:
+    value = os.environ.get(name)
+    if value is None or not value.strip():
+        return default
+    return float(value)
+
+
+# Пул интерпретаторов, в которых выполняется код учеников
+RUNNER_POOL_SIZE = _env_int("BRAVELEARN_RUNNER_POOL_SIZE", max(2, min(os.cpu_count() or 1, 8)))
+RUNNER_MAX_RUNS = _env_int("BRAVELEARN_RUNNER_MAX_RUNS", 50)
+RUNNER_TIMEOUT = _env_float("BRAVELEARN_RUNNER_TIMEOUT", 3)
+RUNNER_CASE_TIMEOUT = _env_float("BRAVELEARN_RUNNER_CASE_TIMEOUT", 1)
+# Вывод запуска: предел в байтах (при превышении интерпретатор завершается)
+# и как часто он отправляется в окно по ходу выполнения
+RUNNER_OUTPUT_LIMIT = _env_int("BRAVELEARN_RUNNER_OUTPUT_LIMIT", 1024 * 1024)
+RUNNER_OUTPUT_INTERVAL_MS = _env_int("BRAVELEARN_RUNNER_OUTPUT_INTERVAL_MS", 100)
+# Пределы интерпретатора (rlimit, только Linux): процессорное время на
+# запуск в секундах, адресное пространство, размер записываемого файла и
+# число процессов. RLIMIT_NPROC считает все процессы пользователя, поэтому
+# осмыслен только 0 — запрет новых процессов и потоков; -1 — не ограничивать.
+RUNNER_CPU_LIMIT = _env_int("BRAVELEARN_RUNNER_CPU_LIMIT", max(1, math.ceil(RUNNER_TIMEOUT)))
+RUNNER_MEMORY_LIMIT_MB = _env_int("BRAVELEARN_RUNNER_MEMORY_LIMIT_MB", 512)
+RUNNER_FILE_SIZE_LIMIT = _env_int("BRAVELEARN_RUNNER_FILE_SIZE_LIMIT", 1024 * 1024)
+RUNNER_NPROC_LIMIT = _env_int("BRAVELEARN_RUNNER_NPROC_LIMIT", 0)
+# Пользователь ОС для интерпретаторов (Linux; приложение запущено от root):
+# код учеников не должен читать файлы БД. Пусто — тот же пользователь, что у
+# приложения; server.py тогда слушает только loopback.
+RUNNER_USER = _env_str("BRAVELEARN_RUNNER_USER", "")
+# Допуск запусков: одновременно не больше RUNNER_CONCURRENCY (по ядрам, но
+# не меньше двух, как пул: пока один запуск обменивается кадрами, другой
+# занимает ядро) и только пока свободной памяти хватает ещё на
+# RUNNER_MEMORY_LIMIT_MB; сколько секунд запуск может ждать допуска
+RUNNER_CONCURRENCY = _env_int("BRAVELEARN_RUNNER_CONCURRENCY", max(2, os.cpu_count() or 1))
+RUNNER_ADMISSION_TIMEOUT = _env_float("BRAVELEARN_RUNNER_ADMISSION_TIMEOUT", 30)
+
+# Очередь проверок решений (api_run_python)
+GRADER_CONCURRENCY = _env_int("BRAVELEARN_GRADER_CONCURRENCY", RUNNER_POOL_SIZE)
+GRADER_QUEUE_DEPTH = _env_int("BRAVELEARN_GRADER_QUEUE_DEPTH", 100)
+GRADER_FINISHED_JOBS = _env_int("BRAVELEARN_GRADER_FINISHED_JOBS", 1000)
+# Сколько мегабайт вывода могут занимать результаты завершённых заданий
+GRADER_FINISHED_MB = _env_int("BRAVELEARN_GRADER_FINISHED_MB", 64)
+
+# Кэш результатов запуска одинакового кода с одинаковой проверкой: не
+# больше RESULT_CACHE_SIZE записей и RESULT_CACHE_MB мегабайт вывода;
+# результаты с выводом длиннее ATTEMPT_OUTPUT_LIMIT не кэшируются
+RESULT_CACHE_SIZE = _env_int("BRAVELEARN_RESULT_CACHE_SIZE", 2048)
+RESULT_CACHE_MB = _env_int("BRAVELEARN_RESULT_CACHE_MB", 64)
+RESULT_CACHE_TTL = _env_float("BRAVELEARN_RESULT_CACHE_TTL", 3600)
+RESULT_CACHE_PERSIST = _env_int("BRAVELEARN_RESULT_CACHE_PERSIST", 0) == 1
+
+# Хранилище SQLite (db.py): профиль из db.STORAGE_PROFILES и размер пула
+# соединений под потоки очереди проверок плюс цикл eel.
+DB_PATH_OVERRIDE = _env_str("BRAVELEARN_DB_PATH", "")
+DB_PROFILE = _env_str("BRAVELEARN_DB_PROFILE", "production")
+DB_POOL_SIZE = _env_int("BRAVELEARN_DB_POOL_SIZE", GRADER_CONCURRENCY + 2)
+DB_POOL_OVERFLOW = _env_int("BRAVELEARN_DB_POOL_OVERFLOW", 4)
+
+# БД контента (курсы, модули, уроки, задания, поисковый индекс): отдельный
+# файл только для чтения, по умолчанию рядом с БД (app.db -> app.content.db).
+# 1 — загружать её в память процесса. В Windows заменить открытый файл
+# нельзя, поэтому там память по умолчанию.
+CONTENT_DB_PATH_OVERRIDE = _env_str("BRAVELEARN_CONTENT_DB_PATH", "")
+CONTENT_DB_MEMORY = _env_int("BRAVELEARN_CONTENT_DB_MEMORY", 1 if sys.platform == "win32" else 0) == 1
+
+# Кэш каталога: как часто сверять версию контента с БД (секунды, 0 — только
+# при изменении контента в этом процессе)
+CONTENT_VERSION_CHECK_INTERVAL = _env_float("BRAVELEARN_CONTENT_VERSION_CHECK_INTERVAL", 5)
+
+# Сжатие больших текстов (HTML уроков, вывод попыток) в БД: значения длиннее
+# порога пишутся zlib-блобом, чтение понимает оба формата
+TEXT_COMPRESSION = _env_int("BRAVELEARN_TEXT_COMPRESSION", 1) == 1
+TEXT_COMPRESSION_MIN_SIZE = _env_int("BRAVELEARN_TEXT_COMPRESSION_MIN_SIZE", 512)
+
+# Хранение попыток: вывод длиннее лимита обрезается с пометкой; при
+# уплотнении остаются последние ATTEMPT_KEEP_LAST попыток и первая успешная
+# для каждой пары (ученик, задание)
+ATTEMPT_OUTPUT_LIMIT = _env_int("BRAVELEARN_ATTEMPT_OUTPUT_LIMIT", 64 * 1024)
+ATTEMPT_KEEP_LAST = _env_int("BRAVELEARN_ATTEMPT_KEEP_LAST", 20)
+ATTEMPT_VACUUM_PAGES = _env_int("BRAVELEARN_ATTEMPT_VACUUM_PAGES", 2000)
+# Уплотнение при запуске приложения и сервера — не чаще раза в столько часов
+ATTEMPT_COMPACT_INTERVAL_HOURS = _env_float("BRAVELEARN_ATTEMPT_COMPACT_INTERVAL_HOURS", 24)
+
+# Отложенная запись попыток (1 — включить; по умолчанию попытка пишется
+# сразу в потоке проверки): фоновый поток сбрасывает записи пачками по
+# WRITE_BEHIND_BATCH или раз в WRITE_BEHIND_INTERVAL_MS. Занятая БД
+# повторяется до WRITE_BEHIND_RETRIES раз. Заполненная очередь задерживает
+# проверку до WRITE_BEHIND_SUBMIT_TIMEOUT секунд; записи, которые не удалось
+# записать или поставить в очередь, уходят в файл отказов рядом с БД.
+# Закрытие ждёт записи не дольше WRITE_BEHIND_CLOSE_TIMEOUT секунд.
+WRITE_BEHIND = _env_int("BRAVELEARN_WRITE_BEHIND", 0) == 1
+WRITE_BEHIND_BATCH = _env_int("BRAVELEARN_WRITE_BEHIND_BATCH", 200)
+WRITE_BEHIND_INTERVAL_MS = _env_int("BRAVELEARN_WRITE_BEHIND_INTERVAL_MS", 200)
+WRITE_BEHIND_QUEUE = _env_int("BRAVELEARN_WRITE_BEHIND_QUEUE", 10000)
+WRITE_BEHIND_RETRIES = _env_int("BRAVELEARN_WRITE_BEHIND_RETRIES", 8)
+WRITE_BEHIND_CLOSE_TIMEOUT = _env_float("BRAVELEARN_WRITE_BEHIND_CLOSE_TIMEOUT", 10)
+WRITE_BEHIND_SUBMIT_TIMEOUT = _env_float("BRAVELEARN_WRITE_BEHIND_SUBMIT_TIMEOUT", 5)
+
+# Отчёт о фазах запуска (startup.py): "1" — в stderr, иначе путь к файлу
+STARTUP_REPORT = _env_str("BRAVELEARN_STARTUP_REPORT", "")
+
+# Метрики (metrics.py): "1" — собирать, путь к файлу — ещё и сохранить при
+# выходе; пусто — выключено. Порог повторов одного SQL-запроса за вызов
+# эндпоинта, после которого вызов считается подозрительным на N+1.
+METRICS = _env_str("BRAVELEARN_METRICS", "")
+METRICS_REPEATED_STATEMENTS = _env_int("BRAVELEARN_METRICS_REPEATED_STATEMENTS", 10)
+
+# Серверный режим (server.py): процессы на общей БД, потоки для вызовов
+# эндпоинтов в каждом процессе, предел одновременных соединений процесса и
+# срок жизни сессии ученика
+SERVER_WORKERS = _env_int("BRAVELEARN_SERVER_WORKERS", os.cpu_count() or 1)
+SERVER_THREADS = _env_int("BRAVELEARN_SERVER_THREADS", 8)
+SERVER_MAX_CONNECTIONS = _env_int("BRAVELEARN_SERVER_MAX_CONNECTIONS", 1000)
+SESSION_TTL_HOURS = _env_float("BRAVELEARN_SESSION_TTL_HOURS", 24 * 14)
@@ -0,0 +1,8 @@
+def test_cyrillic_name():
+    "format_user('Иван Петров')"
+    assert format_user('Иван Петров') == 'Петров, Иван'
+
+
+def test_latin_name():
+    "format_user('Anna Smith')"
+    assert format_user('Anna Smith') == 'Smith, Anna'
@@ -0,0 +1,3 @@
+def format_user(full_name: str) -> str:
+    # Разбейте строку по пробелу и верните в формате 'Фамилия, Имя'
+    pass
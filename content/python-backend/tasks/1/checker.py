@@ -0,0 +1,8 @@
+def test_greet_world():
+    "greet('Мир')"
+    assert greet('Мир') == 'Привет, Мир!'
+
+
+def test_greet_bravelearn():
+    "greet('Bravelearn')"
+    assert greet('Bravelearn') == 'Привет, Bravelearn!'
@@ -0,0 +1,3 @@
+def greet(name):
+    # TODO: реализуйте функцию
+    pass
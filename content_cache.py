@@ -0,0 +1,200 @@
+import threading
+import time
+from types import MappingProxyType
+
+from sqlalchemy import bindparam, select
+
+from config import CONTENT_VERSION_CHECK_INTERVAL
+from db import CONTENT_SCHEMA, connect, content_attached
+from models import Course, CourseModule, FavoriteCourse, Lesson, LessonProgress
+
+courses = Course.__table__
+favorites = FavoriteCourse.__table__
+modules = CourseModule.__table__
+lessons = Lesson.__table__
+progress = LessonProgress.__table__
+
+CATALOG_FIELDS = ("id", "title", "description", "category", "duration", "level", "image_path", "is_popular")
+DETAIL_FIELDS = (
+    "id",
+    "title",
+    "description",
+    "long_description",
+    "category",
+    "duration",
+    "level",
+    "image_path",
+    "materials_path",
+)
+
+
+def get_content_version(conn) -> int:
+    # Версия контента — PRAGMA user_version подключённой БД контента
+    # (content_pack.build_content); 0, пока контент не опубликован
+    if not content_attached(conn):
+        return 0
+    return conn.exec_driver_sql(f"PRAGMA {CONTENT_SCHEMA}.user_version").scalar()
+
+
+def favorite_course_ids(conn, user_id) -> set:
+    if user_id is None:
+        return set()
+    return set(conn.execute(select(favorites.c.course_id).where(favorites.c.user_id == user_id)).scalars())
+
+
+_completed_query = select(progress.c.lesson_id).where(
+    progress.c.user_id == bindparam("user_id"),
+    progress.c.is_completed.is_(True),
+    progress.c.lesson_id.in_(bindparam("lesson_ids", expanding=True)),
+)
+
+
+def completed_lesson_ids(conn, user_id, lesson_ids) -> set:
+    if user_id is None or not lesson_ids:
+        return set()
+    return set(conn.execute(_completed_query, {"user_id": user_id, "lesson_ids": list(lesson_ids)}).scalars())
+
+
+# Скелет курса: модули с уроками (только id, названия и порядок)
+class CourseTree:
+    def __init__(self, course, modules, lesson_ids):
+        self.course = course
+        self.modules = modules
+        self.lesson_ids = lesson_ids
+
+
+# Неизменяемый снимок контента, собранный один раз на версию контента.
+# Эндпоинты копируют готовые записи и добавляют только данные пользователя.
+# Деревья курсов строятся по первому запросу и живут до смены версии.
+class ContentSnapshot:
+    def __init__(self, version, catalog, course_details):
+        self.version = version
+        self.catalog = catalog
+        self.course_details = course_details
+        self.course_trees = {}
+
+
+class ContentCache:
+    def __init__(self, check_interval=CONTENT_VERSION_CHECK_INTERVAL):
+        self.check_interval = check_interval
+        self._snapshot = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def _build(self, conn):
+        version = get_content_version(conn)
+        rows = conn.execute(
+            select(*(courses.c[name] for name in dict.fromkeys(CATALOG_FIELDS + DETAIL_FIELDS))).order_by(
+                courses.c.id
+            )
+        ).mappings()
+        catalog = []
+        course_details = {}
+        for row in rows:
+            catalog.append(MappingProxyType({name: row[name] for name in CATALOG_FIELDS}))
+            course_details[row["id"]] = MappingProxyType({name: row[name] for name in DETAIL_FIELDS})
+        return ContentSnapshot(version, tuple(catalog), MappingProxyType(course_details))
+
+    def snapshot(self) -> ContentSnapshot:
+        snapshot = self._snapshot
+        if snapshot is not None and not self._should_check():
+            return snapshot
+        # connect(): внутри unit_of_work() — его соединение, а не второе из
+        # пула, которого писатель с блокировкой записи мог бы не дождаться
+        with self._lock:
+            with connect() as conn:
+                if self._snapshot is not None and get_content_version(conn) == self._snapshot.version:
+                    self._checked_at = time.monotonic()
+                    return self._snapshot
+                self._snapshot = self._build(conn)
+                self._checked_at = time.monotonic()
+                return self._snapshot
+
+    def _should_check(self):
+        # Версию в БД сверяем не чаще раза в check_interval: изменения из
+        # других процессов подхватываются с этой задержкой.
+        return self.check_interval > 0 and time.monotonic() - self._checked_at >= self.check_interval
+
+    def _build_tree(self, course_id, course):
+        query = (
+            select(
+                modules.c.id.label("module_id"),
+                modules.c.title.label("module_title"),
+                modules.c.order_index.label("module_order"),
+                lessons.c.id.label("lesson_id"),
+                lessons.c.title.label("lesson_title"),
+                lessons.c.order_index.label("lesson_order"),
+            )
+            .select_from(modules.outerjoin(lessons, lessons.c.module_id == modules.c.id))
+            .where(modules.c.course_id == course_id)
+            .order_by(modules.c.order_index, modules.c.id, lessons.c.order_index, lessons.c.id)
+        )
+        with connect() as conn:
+            rows = conn.execute(query).all()
+        tree_modules = []
+        lesson_ids = []
+        for row in rows:
+            if not tree_modules or tree_modules[-1][0]["id"] != row.module_id:
+                module = MappingProxyType(
+                    {"id": row.module_id, "title": row.module_title, "order_index": row.module_order}
+                )
+                tree_modules.append((module, []))
+            if row.lesson_id is not None:
+                tree_modules[-1][1].append(
+                    MappingProxyType({"id": row.lesson_id, "title": row.lesson_title, "order_index": row.lesson_order})
+                )
+                lesson_ids.append(row.lesson_id)
+        return CourseTree(
+            MappingProxyType({"id": course["id"], "title": course["title"]}),
+            tuple((module, tuple(module_lessons)) for module, module_lessons in tree_modules),
+            tuple(lesson_ids),
+        )
+
+    def course_tree(self, course_id):
+        snapshot = self.snapshot()
+        tree = snapshot.course_trees.get(course_id)
+        if tree is None:
+            course = snapshot.course_details.get(course_id)
+            if course is None:
+                return None
+            tree = snapshot.course_trees.setdefault(course_id, self._build_tree(course_id, course))
+        return tree
+
+    def course_structure(self, tree: CourseTree, completed_ids=frozenset()):
+        total = len(tree.lesson_ids)
+        completed = sum(1 for lesson_id in tree.lesson_ids if lesson_id in completed_ids)
+        return {
+            "course": dict(tree.course),
+            "progress_percent": int((completed / total) * 100) if total else 0,
+            "modules": [
+                dict(
+                    module,
+                    lessons=[dict(lesson, is_completed=lesson["id"] in completed_ids) for lesson in module_lessons],
+                )
+                for module, module_lessons in tree.modules
+            ],
+        }
+
+    def invalidate(self):
+        with self._lock:
+            self._snapshot = None
+
+    def catalog(self, favorite_ids=frozenset()):
+        return [dict(course, is_favorite=course["id"] in favorite_ids) for course in self.snapshot().catalog]
+
+    def course(self, course_id):
+        course = self.snapshot().course_details.get(course_id)
+        return dict(course) if course is not None else None
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_content_cache() -> ContentCache:
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ContentCache()
+    return _cache
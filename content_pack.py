@@ -0,0 +1,410 @@
+# Пакеты контента: курсы, модули, уроки и задания в файлах.
+#
+#   python content_pack.py check content/              # только проверить пакет
+#   python content_pack.py import content/ --dry-run   # показать, что изменится
+#   python content_pack.py import content/             # применить пакет
+#   python content_pack.py import content/ --prune     # и удалить то, чего нет в пакете
+#
+# Пакет — каталог, в котором у каждого курса свой подкаталог:
+#
+#   content/frontend/course.json           поля курса, модули, уроки, задания
+#   content/frontend/lessons/1.html        HTML урока (content_file)
+#   content/frontend/tasks/1/starter.py    код задания (starter_file,
+#   content/frontend/tasks/1/checker.py    checker_file)
+#
+# id задаются в пакете и не меняются: на них ссылаются прогресс, избранное и
+# попытки. Порядок модулей, уроков и заданий — порядок в списках.
+#
+# Контент живёт в отдельной БД только для чтения (db.ContentStore). Импорт
+# сравнивает пакет с опубликованной версией и собирает рядом новый файл:
+# копию прежнего, в которую вставлены новые и обновлены изменённые строки
+# (executemany по таблице), с пересобранным поисковым индексом и следующей
+# версией контента в PRAGMA user_version. Затем файл подменяется через
+# os.replace: читатели без остановки переходят на новую версию. Неизменённый
+# пакет ничего не пишет и не меняет версию контента.
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import time
+from pathlib import Path
+
+from sqlalchemy import bindparam, delete, insert, select, update
+
+from content_cache import get_content_version
+from db import content_attached, content_db_path, make_engine
+from models import (
+    CONTENT_TABLES,
+    Base,
+    Course,
+    CourseModule,
+    FavoriteCourse,
+    Lesson,
+    LessonProgress,
+    RegradeCheckpoint,
+    Task,
+    TaskAttempt,
+)
+from runner import check_syntax, checker_problems
+from search import fts5_available, rebuild_index
+
+COURSE_FILE = "course.json"
+
+courses = Course.__table__
+modules = CourseModule.__table__
+lessons = Lesson.__table__
+tasks = Task.__table__
+
+# Таблицы в порядке вставки (родитель раньше потомка)
+TABLES = (courses, modules, lessons, tasks)
+
+_TEXT = ((str,), "строка")
+_OPTIONAL_TEXT = ((str, type(None)), "строка или null")
+_FLAG = ((bool,), "true или false")
+
+# Поля курса в course.json: (допустимые типы, описание для ошибки)
+_COURSE_FIELDS = {
+    "title": _TEXT,
+    "description": _TEXT,
+    "long_description": _OPTIONAL_TEXT,
+    "category": _TEXT,
+    "duration": _TEXT,
+    "level": _TEXT,
+    "image_path": _TEXT,
+    "materials_path": _OPTIONAL_TEXT,
+    "is_popular": _FLAG,
+}
+
+
+class ContentPackError(ValueError):
+    def __init__(self, problems):
+        super().__init__("\n".join(problems))
+        self.problems = problems
+
+
+class _Loader:
+    def __init__(self):
+        self.problems = []
+        self.rows = {table.name: [] for table in TABLES}
+        self.ids = {table.name: {} for table in TABLES}
+
+    def problem(self, where, message):
+        self.problems.append(f"{where}: {message}")
+
+    def read_file(self, course_dir, where, relative):
+        if not isinstance(relative, str) or not relative:
+            self.problem(where, "не указан файл")
+            return None
+        path = course_dir / relative
+        try:
+            return path.read_text(encoding="utf-8")
+        except (OSError, UnicodeDecodeError) as exc:
+            self.problem(where, f"не удалось прочитать {relative}: {exc}")
+            return None
+
+    def add(self, table, where, row):
+        row_id = row["id"]
+        if not isinstance(row_id, int) or isinstance(row_id, bool) or row_id <= 0:
+            self.problem(where, f"id должен быть положительным целым, получено {row_id!r}")
+            return False
+        seen = self.ids[table.name]
+        if row_id in seen:
+            self.problem(where, f"id {row_id} уже занят ({seen[row_id]})")
+            return False
+        seen[row_id] = where
+        self.rows[table.name].append(row)
+        return True
+
+    def title(self, where, data):
+        title = data.get("title")
+        if not isinstance(title, str) or not title.strip():
+            self.problem(where, "нет названия")
+            return ""
+        return title
+
+    def items(self, where, data, key):
+        value = data.get(key, [])
+        if not isinstance(value, list) or not all(isinstance(item, dict) for item in value):
+            self.problem(where, f"{key} должен быть списком объектов")
+            return []
+        return value
+
+    def load_course(self, path):
+        where = str(path)
+        try:
+            data = json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, UnicodeDecodeError, json.JSONDecodeError) as exc:
+            self.problem(where, f"не удалось прочитать: {exc}")
+            return
+        if not isinstance(data, dict):
+            self.problem(where, "ожидается объект JSON")
+            return
+        course = {"id": data.get("id")}
+        for name, (kinds, expected) in _COURSE_FIELDS.items():
+            value = data.get(name, False if name == "is_popular" else None)
+            if not isinstance(value, kinds):
+                self.problem(where, f"поле {name}: ожидается {expected}")
+            course[name] = value
+        if not self.add(courses, where, course):
+            return
+
+        course_dir = path.parent
+        for module_index, module in enumerate(self.items(where, data, "modules"), 1):
+            module_where = f"{where}: модуль {module_index}"
+            module_row = {
+                "id": module.get("id"),
+                "course_id": course["id"],
+                "title": self.title(module_where, module),
+                "order_index": module_index,
+            }
+            if not self.add(modules, module_where, module_row):
+                continue
+            for lesson_index, lesson in enumerate(self.items(module_where, module, "lessons"), 1):
+                self.load_lesson(course_dir, f"{module_where}, урок {lesson_index}", module_row["id"], lesson_index, lesson)
+
+    def load_lesson(self, course_dir, where, module_id, order_index, lesson):
+        content = self.read_file(course_dir, where, lesson.get("content_file"))
+        lesson_row = {
+            "id": lesson.get("id"),
+            "module_id": module_id,
+            "title": self.title(where, lesson),
+            "order_index": order_index,
+            # Перевод строки в конце файла добавляют редакторы, в HTML он не нужен
+            "content": content.rstrip("\n") if content is not None else None,
+        }
+        if not self.add(lessons, where, lesson_row):
+            return
+        for task_index, task in enumerate(self.items(where, lesson, "tasks"), 1):
+            task_where = f"{where}, задание {task_index}"
+            description = task.get("description")
+            if not isinstance(description, str) or not description.strip():
+                self.problem(task_where, "нет описания")
+            starter_code = None
+            if task.get("starter_file") is not None:
+                starter_code = self.read_file(course_dir, task_where, task["starter_file"])
+            if starter_code is not None:
+                exc = check_syntax(starter_code)
+                if exc is not None:
+                    line = f", строка {exc.lineno}" if getattr(exc, "lineno", None) else ""
+                    self.problem(task_where, f"ошибка в заготовке кода{line}: {getattr(exc, 'msg', None) or exc}")
+            checker_code = None
+            if task.get("checker_file") is not None:
+                checker_code = self.read_file(course_dir, task_where, task["checker_file"])
+            if checker_code is not None:
+                # Те же разбор и компиляция, что и перед запуском (runner.py)
+                for problem in checker_problems(checker_code):
+                    self.problem(task_where, problem)
+            self.add(
+                tasks,
+                task_where,
+                {
+                    "id": task.get("id"),
+                    "lesson_id": lesson_row["id"],
+                    "title": self.title(task_where, task),
+                    "description": description,
+                    "starter_code": starter_code,
+                    "checker_code": checker_code,
+                },
+            )
+
+
+def load_pack(path) -> dict:
+    # Возвращает строки по таблицам {имя таблицы: [словарь столбцов]};
+    # все ошибки пакета собираются в одно ContentPackError
+    root = Path(path)
+    course_files = sorted(root.glob(f"*/{COURSE_FILE}"))
+    if not course_files:
+        raise ContentPackError([f"{root}: нет ни одного {COURSE_FILE}"])
+    loader = _Loader()
+    for course_file in course_files:
+        loader.load_course(course_file)
+    if loader.problems:
+        raise ContentPackError(loader.problems)
+    return loader.rows
+
+
+def empty_plan() -> dict:
+    return {table.name: {"insert": [], "update": [], "unchanged": 0, "missing": []} for table in TABLES}
+
+
+def diff_pack(conn, rows) -> dict:
+    # {имя таблицы: {"insert": [...], "update": [...], "unchanged": n, "missing": [id, ...]}};
+    # conn — соединение с подключённой БД контента (до первой публикации её нет)
+    plan = empty_plan()
+    for table in TABLES:
+        columns = [column.name for column in table.columns]
+        existing = {}
+        if content_attached(conn):
+            existing = {row.id: row._mapping for row in conn.execute(select(table))}
+        entry = plan[table.name]
+        for row in rows[table.name]:
+            current = existing.pop(row["id"], None)
+            if current is None:
+                entry["insert"].append(row)
+            elif any(current[name] != row[name] for name in columns):
+                entry["update"].append(row)
+            else:
+                entry["unchanged"] += 1
+        entry["missing"] = sorted(existing)
+    return plan
+
+
+def has_changes(plan, prune=False) -> bool:
+    return any(entry["insert"] or entry["update"] or (prune and entry["missing"]) for entry in plan.values())
+
+
+def _update_statement(table):
+    # Изменяемые столбцы берутся из ключей параметров executemany
+    return update(table).where(table.c.id == bindparam("row_id"))
+
+
+def prune_state(conn, plan):
+    # Строки учеников, ссылающиеся на удаляемый контент: прогресс, избранное,
+    # попытки (их блобы уберёт уплотнение попыток). conn — БД состояния.
+    task_ids = plan["tasks"]["missing"]
+    for table, column, ids in (
+        (TaskAttempt.__table__, "task_id", task_ids),
+        (RegradeCheckpoint.__table__, "task_id", task_ids),
+        (LessonProgress.__table__, "lesson_id", plan["lessons"]["missing"]),
+        (FavoriteCourse.__table__, "course_id", plan["courses"]["missing"]),
+    ):
+        if ids:
+            conn.execute(delete(table).where(table.c[column].in_(ids)))
+
+
+def apply_pack(conn, plan, prune=False):
+    # conn — собираемая БД контента (build_content)
+    if prune:
+        for table in reversed(TABLES):
+            ids = plan[table.name]["missing"]
+            if ids:
+                conn.execute(delete(table).where(table.c.id.in_(ids)))
+    for table in TABLES:
+        entry = plan[table.name]
+        if entry["insert"]:
+            conn.execute(insert(table), entry["insert"])
+        if entry["update"]:
+            conn.execute(
+                _update_statement(table),
+                [{**{k: v for k, v in row.items() if k != "id"}, "row_id": row["id"]} for row in entry["update"]],
+            )
+
+
+def build_content(path, plan, version, prune=False) -> Path:
+    # Новая версия БД контента рядом с path: копия опубликованной версии
+    # (если она есть) с применённым планом и пересобранным поисковым индексом.
+    # Журнал — обычный, не WAL: читатели открывают файл как immutable.
+    path = Path(path)
+    target = path.with_name(f"{path.name}.{os.getpid()}.tmp")
+    target.unlink(missing_ok=True)
+    if path.exists():
+        source = sqlite3.connect(f"{path.resolve().as_uri()}?mode=ro", uri=True)
+        copy = sqlite3.connect(target)
+        try:
+            source.backup(copy)
+        finally:
+            source.close()
+            copy.close()
+    build = make_engine(target, profile="legacy", pool_size=1, max_overflow=0)
+    try:
+        with build.begin() as conn:
+            Base.metadata.create_all(bind=conn, tables=CONTENT_TABLES)
+            apply_pack(conn, plan, prune)
+            if fts5_available(conn):
+                rebuild_index(conn)
+            conn.exec_driver_sql(f"PRAGMA user_version = {int(version)}")
+    except BaseException:
+        build.dispose()
+        target.unlink(missing_ok=True)
+        raise
+    build.dispose()
+    return target
+
+
+def replace_content(built, path):
+    # Атомарная публикация: новые соединения и соединения из пула при
+    # следующей выдаче подключают новый файл (db.ContentStore)
+    os.replace(built, path)
+    if hasattr(os, "O_DIRECTORY"):
+        # Сама замена тоже должна пережить сбой питания
+        fd = os.open(Path(path).parent, os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+
+def import_rows(bind, rows, prune=False, dry_run=False) -> dict:
+    # rows — в формате load_pack; bind — engine БД состояния с подключённой
+    # БД контента
+    path = content_db_path(bind)
+    if path is None:
+        raise ValueError("К engine не подключена БД контента")
+    with bind.connect() as conn:
+        plan = diff_pack(conn, rows)
+        version = get_content_version(conn) + 1
+    if dry_run or not has_changes(plan, prune):
+        return {"plan": plan, "content_version": None}
+    built = build_content(path, plan, version, prune)
+    try:
+        with bind.begin() as conn:
+            if prune:
+                prune_state(conn, plan)
+            replace_content(built, path)
+    finally:
+        Path(built).unlink(missing_ok=True)
+    return {"plan": plan, "content_version": version}
+
+
+def import_pack(bind, path, prune=False, dry_run=False) -> dict:
+    return import_rows(bind, load_pack(path), prune, dry_run)
+
+
+def format_plan(plan, prune=False) -> str:
+    lines = []
+    for name, entry in plan.items():
+        missing = len(entry["missing"])
+        lines.append(
+            f"{name}: новых {len(entry['insert'])}, изменено {len(entry['update'])}, "
+            f"без изменений {entry['unchanged']}, "
+            + (f"удалено {missing}" if prune else f"нет в пакете {missing}")
+        )
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    from db import engine
+    from migrations import upgrade
+
+    parser = argparse.ArgumentParser(description="Проверка и импорт пакетов контента")
+    sub = parser.add_subparsers(dest="command", required=True)
+    check_parser = sub.add_parser("check", help="проверить пакет без обращения к БД")
+    check_parser.add_argument("path")
+    import_parser = sub.add_parser("import", help="импортировать пакет в БД")
+    import_parser.add_argument("path")
+    import_parser.add_argument("--prune", action="store_true", help="удалить курсы, модули, уроки и задания, которых нет в пакете")
+    import_parser.add_argument("--dry-run", action="store_true", help="только показать изменения")
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    try:
+        if args.command == "check":
+            rows = load_pack(args.path)
+            print(", ".join(f"{name}: {len(items)}" for name, items in rows.items()))
+            return
+        upgrade(engine)
+        result = import_pack(engine, args.path, prune=args.prune, dry_run=args.dry_run)
+    except ContentPackError as exc:
+        print("\n".join(exc.problems), file=sys.stderr)
+        sys.exit(1)
+    print(format_plan(result["plan"], args.prune))
+    if result["content_version"] is not None:
+        print(f"Версия контента: {result['content_version']}")
+    elif not args.dry_run:
+        print("Изменений нет")
+    print(f"Время: {time.perf_counter() - started:.2f} с", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,259 @@
+import itertools
+import os
+import sqlite3
+import threading
+import weakref
+from contextlib import contextmanager
+from contextvars import ContextVar
 from pathlib import Path
 
-from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker, scoped_session
+from sqlalchemy import create_engine, event
+from sqlalchemy.orm import sessionmaker
+
+import metrics
+from config import (
+    CONTENT_DB_MEMORY,
+    CONTENT_DB_PATH_OVERRIDE,
+    DB_PATH_OVERRIDE,
+    DB_POOL_OVERFLOW,
+    DB_POOL_SIZE,
+    DB_PROFILE,
+)
+
+CONTENT_SCHEMA = "content"
+
+
+def content_path_for(path) -> Path:
+    # app.db -> app.content.db
+    path = Path(path)
+    return path.with_name(f"{path.stem}.content.db")
+
 
 BASE_DIR = Path(__file__).resolve().parent
-DB_PATH = BASE_DIR / "app.db"
+DB_PATH = Path(DB_PATH_OVERRIDE) if DB_PATH_OVERRIDE else BASE_DIR / "app.db"
+CONTENT_DB_PATH = Path(CONTENT_DB_PATH_OVERRIDE) if CONTENT_DB_PATH_OVERRIDE else content_path_for(DB_PATH)
+
+# Профили хранения SQLite. "legacy" — прежнее поведение (журнал отката,
+# настройки по умолчанию), "production" — WAL и PRAGMA для конкурентной
+# записи прогресса, избранного и попыток.
+STORAGE_PROFILES = {
+    "legacy": {
+        "pragmas": {},
+        "cached_statements": 128,
+    },
+    "production": {
+        "pragmas": {
+            # Действует только для новой БД; существующую переводит
+            # attempt_storage.py compact --vacuum
+            "auto_vacuum": "INCREMENTAL",
+            "journal_mode": "WAL",
+            "synchronous": "NORMAL",
+            "busy_timeout": 5000,
+            "cache_size": -64000,
+            "mmap_size": 256 * 1024 * 1024,
+            "temp_store": "MEMORY",
+        },
+        "cached_statements": 512,
+    },
+}
+
+
+_CONTENT_KEY = "bravelearn_content"
+_memory_names = itertools.count(1)
+_content_stores = weakref.WeakKeyDictionary()
+
+
+# БД контента, подключаемая к соединениям engine как схема content. Таблиц
+# контента в основной БД нет, а неполное имя SQLite ищет и в подключённых
+# схемах, поэтому запросы к courses/lessons/tasks не меняются.
+#
+# Файл не меняется на месте: content_pack.build_content собирает новый,
+# replace_content подменяет его через os.replace. При выдаче из пула
+# соединение сверяет файл (inode, время изменения, размер) с подключённым и
+# при смене переподключает; запросы, уже читающие прежний файл, дочитывают
+# его.
+class ContentStore:
+    def __init__(self, path, memory=False, mmap_size=0):
+        self.path = Path(path).resolve()
+        self.memory = memory
+        self.mmap_size = mmap_size
+        self._lock = threading.Lock()
+        self._loaded = None
+
+    def current(self):
+        # (отпечаток файла, URI для ATTACH) или None, пока контент не опубликован
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        identity = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+        if not self.memory:
+            # immutable: файл не меняется, блокировки и проверки WAL не нужны
+            return identity, f"{self.path.as_uri()}?mode=ro&immutable=1"
+        loaded = self._loaded
+        if loaded is None or loaded[0] != identity:
+            loaded = self._load(identity)
+        return loaded[0], loaded[1]
+
+    def _load(self, identity):
+        # Копия в памяти (VFS memdb) общая для соединений процесса и живёт,
+        # пока хоть одно из них её держит. Держатель есть у последней копии;
+        # прежнюю освобождают соединения, переподключаясь к новой.
+        with self._lock:
+            if self._loaded is not None and self._loaded[0] == identity:
+                return self._loaded
+            uri = f"file:/bravelearn-content-{os.getpid()}-{next(_memory_names)}?vfs=memdb"
+            holder = sqlite3.connect(uri, uri=True, check_same_thread=False)
+            source = sqlite3.connect(f"{self.path.as_uri()}?mode=ro", uri=True)
+            try:
+                source.backup(holder)
+            finally:
+                source.close()
+            previous, self._loaded = self._loaded, (identity, uri + "&mode=ro", holder)
+            if previous is not None:
+                previous[2].close()
+            return self._loaded
+
+    def sync(self, dbapi_connection, info):
+        current = self.current()
+        wanted = current[0] if current is not None else None
+        attached = info.get(_CONTENT_KEY)
+        if wanted == attached:
+            return
+        cursor = dbapi_connection.cursor()
+        try:
+            if attached is not None:
+                cursor.execute(f"DETACH DATABASE {CONTENT_SCHEMA}")
+                del info[_CONTENT_KEY]
+            if current is not None:
+                cursor.execute(f"ATTACH DATABASE ? AS {CONTENT_SCHEMA}", (current[1],))
+                if self.mmap_size and not self.memory:
+                    cursor.execute(f"PRAGMA {CONTENT_SCHEMA}.mmap_size={int(self.mmap_size)}")
+                info[_CONTENT_KEY] = wanted
+        finally:
+            cursor.close()
+
+
+def make_engine(
+    path=DB_PATH,
+    profile=DB_PROFILE,
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_POOL_OVERFLOW,
+    content_path=None,
+    content_memory=CONTENT_DB_MEMORY,
+):
+    # content_path — БД контента для подключения (см. ContentStore); без
+    # неё все таблицы живут в одном файле, как у служебных БД и бенчмарков
+    settings = STORAGE_PROFILES[profile]
+    engine = create_engine(
+        f"sqlite:///{path}",
+        echo=False,
+        future=True,
+        pool_size=pool_size,
+        max_overflow=max_overflow,
+        # uri: ATTACH принимает URI (mode=ro, immutable, vfs=memdb), только
+        # если так открыта основная БД
+        connect_args={"cached_statements": settings["cached_statements"], "uri": True},
+    )
+    pragmas = settings["pragmas"]
+    if pragmas:
+
+        @event.listens_for(engine, "connect")
+        def _apply_pragmas(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            try:
+                for name, value in pragmas.items():
+                    cursor.execute(f"PRAGMA {name}={value}")
+            finally:
+                cursor.close()
+
+    if content_path is not None:
+        store = ContentStore(content_path, memory=content_memory, mmap_size=pragmas.get("mmap_size", 0))
+        _content_stores[engine] = store
 
-engine = create_engine(f"sqlite:///{DB_PATH}", echo=False, future=True)
-SessionLocal = scoped_session(sessionmaker(bind=engine, autoflush=False, autocommit=False))
+        @event.listens_for(engine, "checkout")
+        def _sync_content(dbapi_connection, connection_record, connection_proxy):
+            store.sync(dbapi_connection, connection_record.info)
+
+    return engine
+
+
+def content_db_path(bind):
+    store = _content_stores.get(bind.engine)
+    return store.path if store is not None else None
+
+
+def content_attached(conn) -> bool:
+    return conn.connection.info.get(_CONTENT_KEY) is not None
+
+
+engine = make_engine(content_path=CONTENT_DB_PATH)
+if metrics.ENABLED:
+    metrics.instrument_engine(engine)
+session_factory = sessionmaker(bind=engine, autoflush=False, autocommit=False)
+
+# Соединение текущего запроса (api_batch, api_get_course_page) и можно ли
+# в нём писать. Обработчики eel работают в гринлетах, у каждого свой
+# контекст contextvars.
+_unit_connection = ContextVar("bravelearn_unit_connection", default=None)
 
 
 def get_session():
-    return SessionLocal()
\ No newline at end of file
+    # Новая сессия на каждый вызов. Общая на поток scoped_session не годится:
+    # гринлеты eel и запросы server.py в одном потоке делили бы одну сессию.
+    return session_factory()
+
+
+@contextmanager
+def unit_of_work(write=False):
+    # Все connect()/open_session() внутри блока идут через одно соединение
+    # и одну транзакцию: чтения видят один снимок БД, записи фиксируются
+    # вместе при выходе и откатываются вместе при исключении.
+    #
+    # write=True — блок может писать. Тогда транзакция начинается с BEGIN
+    # IMMEDIATE и сразу берёт блокировку записи (ожидая её busy_timeout):
+    # читающая транзакция в WAL не может перейти к записи, если другой
+    # писатель уже зафиксировал изменения после её снимка, и SQLite
+    # отвечает SQLITE_BUSY_SNAPSHOT без ожидания.
+    unit = _unit_connection.get()
+    if unit is not None:
+        conn, writable = unit
+        if write and not writable:
+            raise RuntimeError("Запись внутри читающего unit_of_work()")
+        yield conn
+        return
+    with engine.begin() as conn:
+        # pysqlite сам открывает транзакцию только перед записью; явный
+        # BEGIN нужен, чтобы и чтения шли в одной транзакции.
+        conn.exec_driver_sql("BEGIN IMMEDIATE" if write else "BEGIN")
+        token = _unit_connection.set((conn, write))
+        try:
+            yield conn
+        finally:
+            _unit_connection.reset(token)
+
+
+@contextmanager
+def connect():
+    unit = _unit_connection.get()
+    if unit is not None:
+        yield unit[0]
+        return
+    with engine.connect() as conn:
+        yield conn
+
+
+def open_session():
+    # Внутри unit_of_work() commit сессии фиксирует только SAVEPOINT,
+    # сама транзакция завершается вместе с блоком.
+    unit = _unit_connection.get()
+    if unit is None:
+        return get_session()
+    return session_factory(bind=unit[0], join_transaction_mode="create_savepoint")
+
+
+def checkpoint(bind=engine):
+    # При synchronous=NORMAL последние транзакции живут в WAL до checkpoint;
+    # при выходе переносим их в основной файл
+    with bind.connect() as conn:
+        conn.exec_driver_sql("PRAGMA main.wal_checkpoint(TRUNCATE)")
@@ -0,0 +1,120 @@
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextvars import ContextVar
+
+import metrics
+from config import GRADER_CONCURRENCY, GRADER_FINISHED_JOBS, GRADER_FINISHED_MB, GRADER_QUEUE_DEPTH
+
+STATUS_QUEUED = "queued"
+STATUS_RUNNING = "running"
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
+
+_current_job = ContextVar("bravelearn_current_job", default=None)
+
+
+class QueueFullError(Exception):
+    pass
+
+
+def result_size(result) -> int:
+    # Оценка памяти результата задания: строки верхнего уровня (вывод запуска)
+    if not isinstance(result, dict):
+        return 0
+    return sum(len(value) for value in result.values() if isinstance(value, str))
+
+
+def current_job_id():
+    # Идентификатор задания, которое выполняет этот поток очереди
+    return _current_job.get()
+
+
+# Очередь проверок: задания выполняются в ограниченном пуле потоков, а
+# вызывающий сразу получает идентификатор задания. Если в очереди уже
+# max_pending заданий, новое отклоняется с QueueFullError. Завершённых
+# хранится не больше keep_finished и не больше keep_finished_bytes их вывода.
+class JobQueue:
+    def __init__(
+        self,
+        concurrency=GRADER_CONCURRENCY,
+        max_pending=GRADER_QUEUE_DEPTH,
+        keep_finished=GRADER_FINISHED_JOBS,
+        on_finished=None,
+        keep_finished_bytes=GRADER_FINISHED_MB * 1024 * 1024,
+    ):
+        self.max_pending = max_pending
+        self.keep_finished = keep_finished
+        self.keep_finished_bytes = keep_finished_bytes
+        self.on_finished = on_finished
+        self._executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="grader")
+        self._jobs = OrderedDict()
+        self._pending = 0
+        # Размеры результатов завершённых заданий (result_size)
+        self._sizes = {}
+        self._finished_bytes = 0
+        self._lock = threading.Lock()
+
+    def submit(self, fn, *args, **kwargs) -> str:
+        job_id = uuid.uuid4().hex
+        with self._lock:
+            if self._pending >= self.max_pending:
+                raise QueueFullError()
+            self._pending += 1
+            self._jobs[job_id] = {"job_id": job_id, "status": STATUS_QUEUED, "result": None}
+        self._executor.submit(self._run, job_id, time.perf_counter(), fn, args, kwargs)
+        return job_id
+
+    def _run(self, job_id, submitted, fn, args, kwargs):
+        with self._lock:
+            self._jobs[job_id]["status"] = STATUS_RUNNING
+        started = time.perf_counter()
+        token = _current_job.set(job_id)
+        try:
+            result = fn(*args, **kwargs)
+            status = STATUS_DONE
+        except Exception as exc:
+            result = {"ok": False, "error": str(exc) or exc.__class__.__name__}
+            status = STATUS_FAILED
+        finally:
+            _current_job.reset(token)
+        if metrics.ENABLED:
+            metrics.observe("job_wait_seconds", started - submitted)
+            metrics.observe("job_run_seconds", time.perf_counter() - started, status=status)
+        with self._lock:
+            self._pending -= 1
+            job = self._jobs[job_id]
+            job["status"] = status
+            job["result"] = result
+            self._sizes[job_id] = result_size(result)
+            self._finished_bytes += self._sizes[job_id]
+            snapshot = dict(job)
+            self._trim_finished()
+        if self.on_finished is not None:
+            self.on_finished(snapshot)
+
+    def _trim_finished(self):
+        finished = len(self._jobs) - self._pending
+        if finished <= self.keep_finished and self._finished_bytes <= self.keep_finished_bytes:
+            return
+        for job_id in list(self._jobs):
+            if finished <= self.keep_finished and self._finished_bytes <= self.keep_finished_bytes:
+                break
+            if self._jobs[job_id]["status"] in (STATUS_DONE, STATUS_FAILED):
+                del self._jobs[job_id]
+                self._finished_bytes -= self._sizes.pop(job_id)
+                finished -= 1
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job is not None else None
+
+    def stats(self):
+        with self._lock:
+            return {"pending": self._pending, "max_pending": self.max_pending}
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
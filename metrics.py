@@ -0,0 +1,289 @@
+# Метрики процесса: задержка эндпоинтов, SQL-запросы, запуски кода.
+#
+#   BRAVELEARN_METRICS=1 python app.py                 # сбор, api_get_metrics
+#   BRAVELEARN_METRICS=metrics.json python app.py      # и снимок в файл при выходе
+#   BRAVELEARN_METRICS=metrics.prom python server.py   # текст Prometheus, файл на процесс
+#
+# Выключено по умолчанию: тогда app.api не оборачивает эндпоинты, к engine
+# не подключаются события, а runner.py и jobs.py проверяют только ENABLED.
+#
+# Гистограммы с фиксированными корзинами, как в Prometheus; перцентили в
+# снимке — оценка по верхней границе корзины. SQL-запросы считаются событиями
+# engine и относятся к эндпоинту, внутри которого выполнены (ContextVar, как
+# app.current_user_id). Признаки N+1: ленивые загрузки связей ORM и один и тот
+# же запрос, повторённый за вызов METRICS_REPEATED_STATEMENTS раз и больше;
+# о каждом таком месте один раз пишется в stderr.
+import json
+import sys
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+from functools import wraps
+from pathlib import Path
+
+from config import METRICS, METRICS_REPEATED_STATEMENTS
+
+ENABLED = bool(METRICS)
+PREFIX = "bravelearn_"
+BACKGROUND = "background"
+
+SECONDS_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+COUNT_BUCKETS = (1, 2, 3, 5, 10, 20, 50, 100, 200)
+BYTES_BUCKETS = tuple(2**power * 1024 * 1024 for power in range(3, 11))
+
+# имя -> (тип, описание, корзины гистограммы)
+DEFINITIONS = {
+    "endpoint_seconds": ("histogram", "Время вызова эндпоинта api_*", SECONDS_BUCKETS),
+    "endpoint_errors_total": ("counter", "Исключения в эндпоинтах", None),
+    "sql_statements_per_call": ("histogram", "SQL-запросов за вызов эндпоинта", COUNT_BUCKETS),
+    "sql_statements_total": ("counter", "SQL-запросы по эндпоинтам", None),
+    "sql_seconds_total": ("counter", "Время SQL-запросов по эндпоинтам", None),
+    "sql_statement_seconds": ("histogram", "Время одного SQL-запроса", SECONDS_BUCKETS),
+    "sql_lazy_loads_total": ("counter", "Ленивые загрузки связей ORM", None),
+    "sql_repeated_statements_total": ("counter", "Вызовы, повторившие один запрос (N+1)", None),
+    "job_wait_seconds": ("histogram", "Ожидание проверки в очереди jobs.JobQueue", SECONDS_BUCKETS),
+    "job_run_seconds": ("histogram", "Выполнение проверки", SECONDS_BUCKETS),
+    "runner_admission_wait_seconds": ("histogram", "Ожидание допуска к запуску", SECONDS_BUCKETS),
+    "runner_admission_rejected_total": ("counter", "Запуски, не дождавшиеся допуска", None),
+    "runner_wait_seconds": ("histogram", "Ожидание свободного интерпретатора", SECONDS_BUCKETS),
+    "runner_spawn_seconds": ("histogram", "Запуск процесса интерпретатора", SECONDS_BUCKETS),
+    "runner_exec_seconds": ("histogram", "Выполнение кода в интерпретаторе", SECONDS_BUCKETS),
+    "runner_cpu_seconds": ("histogram", "Процессорное время запуска", SECONDS_BUCKETS),
+    "runner_peak_rss_bytes": ("histogram", "Пик RSS интерпретатора за запуск", BYTES_BUCKETS),
+    "runner_restarts_total": ("counter", "Замены интерпретаторов пула", None),
+}
+
+_SQL_STARTED = "bravelearn_metrics_started"
+
+_lock = threading.Lock()
+_started = time.time()
+_histograms = {}
+_counters = {}
+_suspects = {}
+_call = ContextVar("bravelearn_metrics_call", default=None)
+
+
+class _Histogram:
+    __slots__ = ("buckets", "counts", "count", "sum", "max")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    def quantile(self, q):
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+
+class _CallStats:
+    __slots__ = ("name", "statements", "seconds", "repeats")
+
+    def __init__(self, name):
+        self.name = name
+        self.statements = 0
+        self.seconds = 0.0
+        self.repeats = {}
+
+
+def _key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def observe(name: str, value: float, **labels):
+    with _lock:
+        key = (name, _key(labels))
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = _Histogram(DEFINITIONS[name][2])
+        histogram.observe(value)
+
+
+def inc(name: str, value: float = 1, **labels):
+    key = (name, _key(labels))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def timed(name: str, function):
+    # Обёртка эндпоинта: время вызова и SQL-запросы внутри него. Вызовы
+    # внутри api_batch меряются отдельно и входят в запросы пакета.
+    @wraps(function)
+    def wrapper(*args, **kwargs):
+        parent = _call.get()
+        stats = _CallStats(name)
+        token = _call.set(stats)
+        started = time.perf_counter()
+        try:
+            return function(*args, **kwargs)
+        except BaseException:
+            inc("endpoint_errors_total", endpoint=name)
+            raise
+        finally:
+            observe("endpoint_seconds", time.perf_counter() - started, endpoint=name)
+            _call.reset(token)
+            _finish_call(stats, parent)
+
+    return wrapper
+
+
+def _finish_call(stats, parent):
+    name = stats.name
+    observe("sql_statements_per_call", stats.statements, endpoint=name)
+    if stats.statements:
+        inc("sql_statements_total", stats.statements, endpoint=name)
+        inc("sql_seconds_total", stats.seconds, endpoint=name)
+    for statement, count in stats.repeats.items():
+        if count >= METRICS_REPEATED_STATEMENTS:
+            inc("sql_repeated_statements_total", endpoint=name)
+            _suspect(name, statement, f"{count} × {statement}")
+    if parent is not None:
+        parent.statements += stats.statements
+        parent.seconds += stats.seconds
+
+
+def _suspect(endpoint, place, what):
+    with _lock:
+        key = (endpoint, place)
+        first = key not in _suspects
+        _suspects[key] = what
+    if first and sys.stderr is not None:
+        print(f"metrics: возможный N+1 в {endpoint}: {what[:300]}", file=sys.stderr)
+
+
+def _record_sql(statement, elapsed):
+    observe("sql_statement_seconds", elapsed)
+    stats = _call.get()
+    if stats is None:
+        inc("sql_statements_total", endpoint=BACKGROUND)
+        inc("sql_seconds_total", elapsed, endpoint=BACKGROUND)
+        return
+    stats.statements += 1
+    stats.seconds += elapsed
+    stats.repeats[statement] = stats.repeats.get(statement, 0) + 1
+
+
+def instrument_engine(engine):
+    # Вызывается из db.py для engine приложения, если сбор включён
+    from sqlalchemy import event
+    from sqlalchemy.orm import Session
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault(_SQL_STARTED, []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        _record_sql(statement, time.perf_counter() - conn.info[_SQL_STARTED].pop())
+
+    @event.listens_for(engine, "handle_error")
+    def handle_error(context):
+        started = context.connection.info.get(_SQL_STARTED) if context.connection is not None else None
+        if started:
+            started.pop()
+
+    @event.listens_for(Session, "do_orm_execute")
+    def do_orm_execute(state):
+        # Ленивая загрузка связи (user.favorites) — отдельный запрос на
+        # каждый объект; selectinload/joinedload сюда не попадают
+        if state.is_relationship_load and state.lazy_loaded_from is not None:
+            stats = _call.get()
+            endpoint = stats.name if stats is not None else BACKGROUND
+            relationship = str(state.loader_strategy_path[-1])
+            inc("sql_lazy_loads_total", endpoint=endpoint, relationship=relationship)
+            _suspect(endpoint, relationship, f"ленивая загрузка {relationship}")
+
+
+def snapshot() -> dict:
+    with _lock:
+        histograms = {}
+        for (name, labels), histogram in sorted(_histograms.items()):
+            histograms.setdefault(name, []).append(
+                {
+                    "labels": dict(labels),
+                    "count": histogram.count,
+                    "sum": round(histogram.sum, 6),
+                    "max": round(histogram.max, 6),
+                    "p50": round(histogram.quantile(0.5), 6),
+                    "p90": round(histogram.quantile(0.9), 6),
+                    "p99": round(histogram.quantile(0.99), 6),
+                }
+            )
+        counters = {}
+        for (name, labels), value in sorted(_counters.items()):
+            counters.setdefault(name, []).append({"labels": dict(labels), "value": round(value, 6)})
+        suspects = [{"endpoint": endpoint, "what": what} for (endpoint, _), what in sorted(_suspects.items())]
+    return {
+        "uptime_s": round(time.time() - _started, 1),
+        "histograms": histograms,
+        "counters": counters,
+        "n_plus_one": suspects,
+    }
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", " ")
+
+
+def _labels_text(labels, extra=()):
+    items = [*labels, *extra]
+    if not items:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in items) + "}"
+
+
+def prometheus_text(**const_labels) -> str:
+    # const_labels добавляются ко всем строкам (server.py: worker=pid)
+    const = sorted(const_labels.items())
+    with _lock:
+        histograms = sorted((key, (h.buckets, list(h.counts), h.sum, h.count)) for key, h in _histograms.items())
+        counters = sorted(_counters.items())
+    lines = []
+    for name, (kind, help_text, _) in DEFINITIONS.items():
+        rows = [row for row in (histograms if kind == "histogram" else counters) if row[0][0] == name]
+        if not rows:
+            continue
+        lines.append(f"# HELP {PREFIX}{name} {help_text}")
+        lines.append(f"# TYPE {PREFIX}{name} {kind}")
+        for (_, labels), value in rows:
+            labels = [*labels, *const]
+            if kind == "counter":
+                lines.append(f"{PREFIX}{name}{_labels_text(labels)} {value:g}")
+                continue
+            buckets, counts, total, count = value
+            cumulative = 0
+            for bound, in_bucket in zip([f"{bound:.12g}" for bound in buckets] + ["+Inf"], counts):
+                cumulative += in_bucket
+                lines.append(f"{PREFIX}{name}_bucket{_labels_text(labels, [('le', bound)])} {cumulative}")
+            lines.append(f"{PREFIX}{name}_sum{_labels_text(labels)} {total:.6f}")
+            lines.append(f"{PREFIX}{name}_count{_labels_text(labels)} {count}")
+    return "\n".join(lines) + "\n"
+
+
+def dump(suffix: str = ""):
+    # Снимок в файл из BRAVELEARN_METRICS: *.prom и *.txt — текст
+    # Prometheus, иначе JSON. suffix отличает файлы процессов server.py.
+    if METRICS in ("", "1"):
+        return
+    path = Path(METRICS)
+    if suffix:
+        path = path.with_name(f"{path.stem}{suffix}{path.suffix}")
+    if path.suffix in (".prom", ".txt"):
+        path.write_text(prometheus_text(), encoding="utf-8")
+    else:
+        path.write_text(json.dumps(snapshot(), ensure_ascii=False, indent=2), encoding="utf-8")
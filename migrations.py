@@ -0,0 +1,278 @@
+# Версионированные миграции схемы app.db.
+#
+#   python migrations.py                # обновить БД до последней версии
+#   python migrations.py --check-plans  # проверить, что горячие запросы идут по индексам
+#
+# Версия схемы хранится в PRAGMA user_version; для актуальной БД upgrade()
+# больше ничего не делает. Base.metadata.create_all вызывается только при
+# обновлении, создаёт лишь отсутствующие таблицы и не меняет существующие,
+# поэтому новые таблицы, индексы, ограничения и новые столбцы старых таблиц
+# добавляются здесь.
+#
+# Если к engine подключена БД контента (db.make_engine(content_path=...)),
+# здесь создаются только таблицы состояния учеников (models.STATE_TABLES):
+# таблицы контента и поисковый индекс собирает content_pack.build_content.
+import argparse
+import sys
+
+from sqlalchemy import inspect, select, text
+
+from db import content_db_path, engine
+from models import (
+    CONTENT_TABLES,
+    STATE_TABLES,
+    AppMeta,
+    Base,
+    Course,
+    CourseModule,
+    FavoriteCourse,
+    Lesson,
+    LessonProgress,
+    SubmissionResult,
+    Task,
+    TaskAttempt,
+    UserSession,
+)
+from search import CREATE_INDEX_SQL, fts5_available
+
+
+def get_schema_version(conn) -> int:
+    return conn.exec_driver_sql("PRAGMA user_version").scalar()
+
+
+def _set_schema_version(conn, version: int):
+    conn.exec_driver_sql(f"PRAGMA user_version = {int(version)}")
+
+
+def _add_column_if_missing(conn, table, column_ddl):
+    name = column_ddl.split()[0]
+    if table in inspect(conn).get_table_names():
+        columns = {c["name"] for c in inspect(conn).get_columns(table)}
+        if name not in columns:
+            conn.exec_driver_sql(f"ALTER TABLE {table} ADD COLUMN {column_ddl}")
+
+
+def _create_indexes(conn, *models):
+    # Индексы по столбцам, которых ещё нет в БД, создаст миграция,
+    # добавляющая эти столбцы
+    for model in models:
+        table = model.__table__
+        existing = {c["name"] for c in inspect(conn).get_columns(table.name)}
+        for index in table.indexes:
+            if {column.name for column in index.columns} <= existing:
+                index.create(conn, checkfirst=True)
+
+
+def _migration_1_indexes(conn):
+    # Перед уникальными индексами убираем дубликаты: для прогресса оставляем
+    # самую «завершённую» и свежую запись, для избранного — первую.
+    conn.execute(
+        text(
+            """
+            DELETE FROM lesson_progresses WHERE id NOT IN (
+                SELECT id FROM (
+                    SELECT id, ROW_NUMBER() OVER (
+                        PARTITION BY user_id, lesson_id
+                        ORDER BY is_completed DESC, completed_at DESC, id DESC
+                    ) AS rn
+                    FROM lesson_progresses
+                ) WHERE rn = 1
+            )
+            """
+        )
+    )
+    conn.execute(
+        text(
+            """
+            DELETE FROM favorite_courses WHERE id NOT IN (
+                SELECT MIN(id) FROM favorite_courses GROUP BY user_id, course_id
+            )
+            """
+        )
+    )
+    _create_indexes(conn, FavoriteCourse, CourseModule, Lesson, LessonProgress, Task, TaskAttempt)
+    _add_column_if_missing(conn, "submission_results", "verdict TEXT")
+
+
+def _migration_2_catalog_indexes(conn):
+    _create_indexes(conn, Course)
+
+
+def _migration_3_search_index(conn):
+    # Таблица FTS5 не описывается моделями. С версии 6 индекс живёт в БД
+    # контента и собирается при публикации (content_pack.build_content).
+    # Сборка SQLite без FTS5 просто остаётся без поиска.
+    if fts5_available(conn):
+        conn.exec_driver_sql(CREATE_INDEX_SQL)
+
+
+def _migration_4_attempt_blobs(conn):
+    # code/output попыток переезжают в blobs. Таблица пересоздаётся: снять
+    # NOT NULL со старого столбца code в SQLite можно только так.
+    from attempt_storage import copy_legacy_attempts
+
+    columns = {c["name"] for c in inspect(conn).get_columns("task_attempts")}
+    if "code_hash" in columns:
+        return
+    for index in TaskAttempt.__table__.indexes:
+        conn.exec_driver_sql(f"DROP INDEX IF EXISTS {index.name}")
+    conn.exec_driver_sql("ALTER TABLE task_attempts RENAME TO task_attempts_legacy")
+    TaskAttempt.__table__.create(conn)
+    copy_legacy_attempts(conn, "task_attempts_legacy")
+    conn.exec_driver_sql("DROP TABLE task_attempts_legacy")
+
+
+def _migration_5_user_sessions(conn):
+    # Таблицу создал create_all в upgrade(), индекс — здесь
+    _create_indexes(conn, UserSession)
+
+
+def _migration_6_content_database(conn):
+    # Курсы, модули, уроки и задания переезжают из app.db в отдельную БД
+    # контента вместе с версией контента; поисковый индекс собирается там же.
+    # Уже опубликованную БД контента не трогаем.
+    from content_pack import build_content, empty_plan, replace_content
+
+    path = content_db_path(conn)
+    if path is None or "courses" not in inspect(conn).get_table_names():
+        return
+    if not path.exists():
+        meta = AppMeta.__table__
+        version = conn.execute(select(meta.c.value).where(meta.c.key == "content_version")).scalar()
+        plan = empty_plan()
+        for table in CONTENT_TABLES:
+            plan[table.name]["insert"] = [dict(row._mapping) for row in conn.execute(select(table))]
+        replace_content(build_content(path, plan, int(version or 0) + 1), path)
+    conn.exec_driver_sql("DROP TABLE IF EXISTS main.search_index")
+    for table in reversed(CONTENT_TABLES):
+        conn.exec_driver_sql(f"DROP TABLE IF EXISTS main.{table.name}")
+    conn.execute(
+        AppMeta.__table__.delete().where(AppMeta.__table__.c.key.in_(["content_version", "search_index_version"]))
+    )
+
+
+def _migration_7_attempt_usage(conn):
+    _add_column_if_missing(conn, "task_attempts", "cpu_ms INTEGER")
+    _add_column_if_missing(conn, "task_attempts", "peak_rss_kb INTEGER")
+
+
+def _migration_8_result_worker(conn):
+    # Прежние записи сделаны в общем интерпретаторе без учёта воркера:
+    # доверять им нельзя
+    _add_column_if_missing(conn, "submission_results", "worker VARCHAR(32)")
+    conn.exec_driver_sql("DELETE FROM submission_results WHERE worker IS NULL")
+    _create_indexes(conn, SubmissionResult)
+
+
+# (версия, описание, функция); добавлять только в конец
+MIGRATIONS = [
+    (1, "индексы и уникальность прогресса и избранного", _migration_1_indexes),
+    (2, "индексы каталога по категории, уровню и сортировкам", _migration_2_catalog_indexes),
+    (3, "полнотекстовый индекс поиска (FTS5)", _migration_3_search_index),
+    (4, "код и вывод попыток в общем хранилище blobs", _migration_4_attempt_blobs),
+    (5, "сессии серверного режима", _migration_5_user_sessions),
+    (6, "контент в отдельной БД только для чтения", _migration_6_content_database),
+    (7, "процессорное время и память попыток", _migration_7_attempt_usage),
+    (8, "воркер в кэше результатов запуска", _migration_8_result_worker),
+]
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+
+def upgrade(bind=engine, verbose=False):
+    # Актуальная БД: одно чтение user_version вместо инспекции схемы и
+    # create_all при каждом запуске
+    with bind.connect() as conn:
+        version = get_schema_version(conn)
+    if version >= LATEST_VERSION:
+        return version
+
+    split_content = content_db_path(bind) is not None
+    with bind.begin() as conn:
+        version = get_schema_version(conn)
+        is_fresh = version == 0 and not set(inspect(conn).get_table_names()) & set(Base.metadata.tables)
+        Base.metadata.create_all(bind=conn, tables=STATE_TABLES if split_content else None)
+        if is_fresh:
+            # Новая БД сразу создаётся по актуальным моделям
+            if not split_content:
+                _migration_3_search_index(conn)
+            _set_schema_version(conn, LATEST_VERSION)
+            return LATEST_VERSION
+
+    for number, description, migrate in MIGRATIONS:
+        if number <= version:
+            continue
+        with bind.begin() as conn:
+            migrate(conn)
+            _set_schema_version(conn, number)
+        if verbose:
+            print(f"Миграция {number}: {description}")
+        version = number
+    return version
+
+
+# Горячие запросы приложения: каждый должен использовать индекс
+def _hot_queries():
+    favorites = FavoriteCourse.__table__
+    modules = CourseModule.__table__
+    lessons = Lesson.__table__
+    progress = LessonProgress.__table__
+    tasks = Task.__table__
+    attempts = TaskAttempt.__table__
+    catalog = Course.__table__
+    sessions = UserSession.__table__
+    return {
+        "каталог по категории и уровню": select(catalog.c.id).where(
+            catalog.c.category == "Дизайн", catalog.c.level == "Начинающий"
+        ),
+        "каталог по уровню": select(catalog.c.id).where(catalog.c.level == "Начинающий"),
+        "каталог по названию": select(catalog.c.id)
+        .where(catalog.c.title > "")
+        .order_by(catalog.c.title, catalog.c.id),
+        "progress по (user, lesson)": select(progress).where(progress.c.user_id == 1, progress.c.lesson_id == 1),
+        "progress пользователя по урокам": select(progress).where(
+            progress.c.user_id == 1, progress.c.lesson_id.in_([1, 2, 3])
+        ),
+        "избранное по (user, course)": select(favorites).where(
+            favorites.c.user_id == 1, favorites.c.course_id == 1
+        ),
+        "избранное пользователя": select(favorites.c.course_id).where(favorites.c.user_id == 1),
+        "модули курса": select(modules)
+        .where(modules.c.course_id == 1)
+        .order_by(modules.c.order_index, modules.c.id),
+        "уроки модулей": select(lessons.c.id, lessons.c.title).where(lessons.c.module_id.in_([1, 2])),
+        "задание урока": select(tasks).where(tasks.c.lesson_id == 1).order_by(tasks.c.id),
+        "попытки задания": select(attempts.c.id)
+        .where(attempts.c.task_id == 1, attempts.c.id > 0)
+        .order_by(attempts.c.id),
+        "истёкшие сессии": select(sessions.c.token_hash).where(sessions.c.expires_at < "2024-01-01"),
+    }
+
+
+def check_query_plans(bind=engine):
+    failures = []
+    with bind.connect() as conn:
+        for name, stmt in _hot_queries().items():
+            sql = str(stmt.compile(bind=conn, compile_kwargs={"literal_binds": True}))
+            plan = [row[-1] for row in conn.exec_driver_sql("EXPLAIN QUERY PLAN " + sql)]
+            # "SCAN <таблица>" без индекса означает полный перебор строк
+            full_scans = [step for step in plan if step.startswith("SCAN") and "INDEX" not in step]
+            uses_index = not full_scans and any("INDEX" in step or "PRIMARY KEY" in step for step in plan)
+            if not uses_index:
+                failures.append((name, plan))
+            print(f"{'ok  ' if uses_index else 'FAIL'} {name}: {'; '.join(plan)}")
+    return failures
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Миграции схемы app.db")
+    parser.add_argument("--check-plans", action="store_true", help="проверить планы горячих запросов")
+    args = parser.parse_args(argv)
+
+    version = upgrade(verbose=True)
+    print(f"Версия схемы: {version}")
+    if args.check_plans and check_query_plans():
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
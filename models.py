@@ -1,7 +1,9 @@
-from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, Text, DateTime
-from sqlalchemy.orm import declarative_base, relationship
+from sqlalchemy import Column, Integer, String, Boolean, ForeignKey, Text, DateTime, Index
+from sqlalchemy.orm import declarative_base, deferred, relationship
 from datetime import datetime
 
+from text_storage import CompressedText
+
 Base = declarative_base()
 
 
@@ -21,7 +23,7 @@ class Course(Base):
     id = Column(Integer, primary_key=True)
     title = Column(String(200), nullable=False)
     description = Column(Text, nullable=False)
-    long_description = Column(Text, nullable=True)
+    long_description = deferred(Column(Text, nullable=True))
     category = Column(String(64), nullable=False)
     duration = Column(String(64), nullable=False)
     level = Column(String(64), nullable=False)
@@ -31,6 +33,13 @@ class Course(Base):
 
     favorites = relationship("FavoriteCourse", back_populates="course", cascade="all, delete-orphan")
 
+    __table_args__ = (
+        Index("ix_courses_category_level", "category", "level"),
+        Index("ix_courses_level", "level"),
+        Index("ix_courses_popular", "is_popular", "id"),
+        Index("ix_courses_title", "title", "id"),
+    )
+
 
 class FavoriteCourse(Base):
     __tablename__ = "favorite_courses"
@@ -42,6 +51,11 @@ class FavoriteCourse(Base):
     user = relationship("User", back_populates="favorites")
     course = relationship("Course", back_populates="favorites")
 
+    __table_args__ = (
+        Index("ix_favorite_courses_user_course", "user_id", "course_id", unique=True),
+        Index("ix_favorite_courses_course", "course_id"),
+    )
+
 
 class CourseModule(Base):
     __tablename__ = "course_modules"
@@ -54,6 +68,8 @@ class CourseModule(Base):
     course = relationship("Course", backref="modules")
     lessons = relationship("Lesson", back_populates="module", cascade="all, delete-orphan")
 
+    __table_args__ = (Index("ix_course_modules_course_order", "course_id", "order_index"),)
+
 
 class Lesson(Base):
     __tablename__ = "lessons"
@@ -62,12 +78,16 @@ class Lesson(Base):
     module_id = Column(Integer, ForeignKey("course_modules.id"), nullable=False)
     title = Column(String(200), nullable=False)
     order_index = Column(Integer, nullable=False, default=0)
-    content = Column(Text, nullable=True)
+    # Большие тексты отложены: грузятся только эндпоинтами, которые их
+    # показывают (undefer в запросе), а не при каждом обращении к объекту.
+    content = deferred(Column(CompressedText, nullable=True))
 
     module = relationship("CourseModule", back_populates="lessons")
     progresses = relationship("LessonProgress", back_populates="lesson", cascade="all, delete-orphan")
     tasks = relationship("Task", back_populates="lesson", cascade="all, delete-orphan")
 
+    __table_args__ = (Index("ix_lessons_module_order", "module_id", "order_index"),)
+
 
 class LessonProgress(Base):
     __tablename__ = "lesson_progresses"
@@ -81,6 +101,11 @@ class LessonProgress(Base):
     user = relationship("User", backref="lesson_progresses")
     lesson = relationship("Lesson", back_populates="progresses")
 
+    __table_args__ = (
+        Index("ix_lesson_progresses_user_lesson", "user_id", "lesson_id", unique=True),
+        Index("ix_lesson_progresses_lesson", "lesson_id"),
+    )
+
 
 class Task(Base):
     __tablename__ = "tasks"
@@ -88,13 +113,15 @@ class Task(Base):
     id = Column(Integer, primary_key=True)
     lesson_id = Column(Integer, ForeignKey("lessons.id"), nullable=False)
     title = Column(String(200), nullable=False)
-    description = Column(Text, nullable=False)
-    starter_code = Column(Text, nullable=True)
-    checker_code = Column(Text, nullable=True)
+    description = deferred(Column(Text, nullable=False), group="task_text")
+    starter_code = deferred(Column(Text, nullable=True), group="task_text")
+    checker_code = deferred(Column(Text, nullable=True))
 
     lesson = relationship("Lesson", back_populates="tasks")
     attempts = relationship("TaskAttempt", back_populates="task", cascade="all, delete-orphan")
 
+    __table_args__ = (Index("ix_tasks_lesson", "lesson_id"),)
+
 
 class TaskAttempt(Base):
     __tablename__ = "task_attempts"
@@ -102,10 +129,83 @@ class TaskAttempt(Base):
     id = Column(Integer, primary_key=True)
     task_id = Column(Integer, ForeignKey("tasks.id"), nullable=False)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
-    code = Column(Text, nullable=False)
+    # Код и вывод лежат в blobs по sha256 (см. attempt_storage.py):
+    # одинаковые решения и одинаковый вывод хранятся один раз
+    code_hash = Column(String(64), ForeignKey("blobs.hash"), nullable=False)
     is_passed = Column(Boolean, default=False, nullable=False)
-    output = Column(Text, nullable=True)
+    output_hash = Column(String(64), ForeignKey("blobs.hash"), nullable=True)
+    # Ресурсы запуска: процессорное время и пик RSS процесса запуска; пусто,
+    # если код не запускался (кэш, синтаксическая ошибка)
+    cpu_ms = Column(Integer, nullable=True)
+    peak_rss_kb = Column(Integer, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
 
     task = relationship("Task", back_populates="attempts")
     user = relationship("User", backref="task_attempts")
+
+    __table_args__ = (
+        Index("ix_task_attempts_task", "task_id", "id"),
+        Index("ix_task_attempts_user_task", "user_id", "task_id"),
+        Index("ix_task_attempts_code_hash", "code_hash"),
+        Index("ix_task_attempts_output_hash", "output_hash"),
+    )
+
+
+class Blob(Base):
+    __tablename__ = "blobs"
+
+    hash = Column(String(64), primary_key=True)
+    content = deferred(Column(CompressedText, nullable=False))
+    size = Column(Integer, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+
+class RegradeCheckpoint(Base):
+    __tablename__ = "regrade_checkpoints"
+
+    task_id = Column(Integer, ForeignKey("tasks.id"), primary_key=True)
+    checker_hash = Column(String(64), nullable=False)
+    last_attempt_id = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+
+class SubmissionResult(Base):
+    __tablename__ = "submission_results"
+
+    key = Column(String(64), primary_key=True)
+    checker_hash = Column(String(64), nullable=False, index=True)
+    ok = Column(Boolean, nullable=False)
+    stdout = Column(Text, nullable=False)
+    stderr = Column(Text, nullable=False)
+    verdict = Column(Text, nullable=True)
+    # Воркер, в процессе которого прошёл запуск (RunResult.worker): записи
+    # воркера удаляются, если его заменили из-за сбоя
+    worker = Column(String(32), nullable=True, index=True)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+
+
+class AppMeta(Base):
+    __tablename__ = "app_meta"
+
+    key = Column(String(64), primary_key=True)
+    value = Column(String(255), nullable=False)
+
+
+class UserSession(Base):
+    # Сессии серверного режима (server.py). Хранится sha256 токена, сам
+    # токен есть только в cookie браузера.
+    __tablename__ = "user_sessions"
+
+    token_hash = Column(String(64), primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow, nullable=False)
+    expires_at = Column(DateTime, nullable=False)
+
+    __table_args__ = (Index("ix_user_sessions_expires", "expires_at"),)
+
+
+# Таблицы БД контента (db.ContentStore); остальные — в БД состояния учеников
+CONTENT_TABLES = [Course.__table__, CourseModule.__table__, Lesson.__table__, Task.__table__]
+STATE_TABLES = [
+    table for table in Base.metadata.sorted_tables if table.name not in {t.name for t in CONTENT_TABLES}
+]
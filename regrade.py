@@ -0,0 +1,185 @@
+# Перепроверка сохранённых попыток (task_attempts) текущим checker_code.
+#
+#   python regrade.py                 # все задания
+#   python regrade.py --task 1 2      # только выбранные задания
+#   python regrade.py --restart       # игнорировать сохранённый прогресс
+#
+# Попытки читаются порциями по id, выполняются параллельно в пуле
+# интерпретаторов (по одному на ядро) и записываются пакетом в одной
+# транзакции вместе с контрольной точкой, поэтому прерванный запуск
+# продолжается с места остановки, пока checker_code не изменился.
+# Код попыток хранится в blobs по хэшу: одинаковые решения в порции
+# выполняются один раз.
+#
+# Таймаут, падение или отказ в допуске зависят от нагрузки: такой запуск
+# повторяется до RETRIES раз, а если не удался, попытка остаётся с прежним
+# вердиктом и контрольная точка задания дальше неё не сдвигается —
+# следующий запуск перепроверит её снова.
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from sqlalchemy import bindparam, func, select, update
+
+from attempt_storage import blobs, cap_output, put_blobs
+from db import engine
+from migrations import upgrade
+from models import RegradeCheckpoint, Task, TaskAttempt
+from result_cache import load_dependent
+from runner import RunnerPool, check_passed, checker_hash, run_user_code
+
+# Повторы запуска с результатом, зависящим от нагрузки, и пауза перед ними
+RETRIES = 2
+RETRY_DELAY = 1.0
+
+attempts = TaskAttempt.__table__
+checkpoints = RegradeCheckpoint.__table__
+
+
+def _iter_chunks(task_id: int, after_id: int, chunk_size: int):
+    query = (
+        select(attempts.c.id, attempts.c.code_hash, blobs.c.content.label("code"), attempts.c.is_passed)
+        .join(blobs, blobs.c.hash == attempts.c.code_hash)
+        .where(attempts.c.task_id == task_id, attempts.c.id > bindparam("after_id"))
+        .order_by(attempts.c.id)
+        .limit(chunk_size)
+    )
+    while True:
+        # Порция читается целиком, чтобы не держать блокировку чтения,
+        # пока идёт запись результатов.
+        with engine.connect() as conn:
+            rows = conn.execute(query, {"after_id": after_id}).all()
+        if not rows:
+            return
+        yield rows
+        after_id = rows[-1].id
+
+
+def _load_start(conn, task_id: int, digest: str, restart: bool) -> int:
+    if restart:
+        return 0
+    row = conn.execute(
+        select(checkpoints.c.checker_hash, checkpoints.c.last_attempt_id).where(checkpoints.c.task_id == task_id)
+    ).first()
+    if row is None or row.checker_hash != digest:
+        return 0
+    return row.last_attempt_id
+
+
+def _save_batch(task_id: int, digest: str, results, last_id):
+    # last_id — новая контрольная точка, None — не сдвигать
+    with engine.begin() as conn:
+        if results:
+            hashes = put_blobs(conn, [params.pop("new_output") for params in results])
+            for params, output_hash in zip(results, hashes):
+                params["new_output_hash"] = output_hash
+            conn.execute(
+                update(attempts)
+                .where(attempts.c.id == bindparam("attempt_id"))
+                .values(is_passed=bindparam("new_is_passed"), output_hash=bindparam("new_output_hash")),
+                results,
+            )
+        if last_id is None:
+            return
+        values = {"checker_hash": digest, "last_attempt_id": last_id, "updated_at": datetime.utcnow()}
+        updated = conn.execute(update(checkpoints).where(checkpoints.c.task_id == task_id).values(**values))
+        if updated.rowcount == 0:
+            conn.execute(checkpoints.insert().values(task_id=task_id, **values))
+
+
+def regrade_task(task_id: int, checker_code: str | None, pool: RunnerPool, executor, chunk_size: int, restart: bool):
+    digest = checker_hash(checker_code)
+    with engine.connect() as conn:
+        start_id = _load_start(conn, task_id, digest, restart)
+        total = conn.execute(
+            select(func.count()).select_from(attempts).where(attempts.c.task_id == task_id, attempts.c.id > start_id)
+        ).scalar_one()
+    if start_id:
+        print(f"Задание {task_id}: продолжаем после попытки {start_id}", file=sys.stderr)
+
+    def grade(row):
+        # None — результат так и зависел от нагрузки
+        for attempt in range(RETRIES + 1):
+            if attempt:
+                time.sleep(RETRY_DELAY)
+            result = run_user_code(row.code, checker_code=checker_code, pool=pool)
+            if not load_dependent(result):
+                output = (result.stdout + "\n" + result.stderr).strip()
+                return check_passed(result, checker_code), cap_output(output) if output else None
+        return None
+
+    done = changed = skipped = 0
+    # Контрольная точка сдвигается, только пока не было пропущенных попыток
+    checkpoint_open = True
+    started = time.perf_counter()
+    for rows in _iter_chunks(task_id, start_id, chunk_size):
+        unique = list({row.code_hash: row for row in rows}.values())
+        verdicts = dict(zip((row.code_hash for row in unique), executor.map(grade, unique)))
+        graded = []
+        last_id = None
+        for row in rows:
+            verdict = verdicts[row.code_hash]
+            if verdict is None:
+                skipped += 1
+                checkpoint_open = False
+                continue
+            if checkpoint_open:
+                last_id = row.id
+            is_passed, output = verdict
+            graded.append(
+                (
+                    is_passed != bool(row.is_passed),
+                    {"attempt_id": row.id, "new_is_passed": is_passed, "new_output": output},
+                )
+            )
+        _save_batch(task_id, digest, [params for _, params in graded], last_id)
+        done += len(graded)
+        changed += sum(1 for is_changed, _ in graded if is_changed)
+        rate = done / max(time.perf_counter() - started, 1e-9)
+        print(
+            f"Задание {task_id}: {done + skipped}/{total} ({(done + skipped) * 100 // max(total, 1)}%), "
+            f"{rate:.0f} попыток/с, изменён вердикт: {changed}, пропущено: {skipped}",
+            file=sys.stderr,
+        )
+    return done, changed, skipped
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Перепроверка попыток текущим checker_code")
+    parser.add_argument("--task", type=int, nargs="*", help="id заданий (по умолчанию все)")
+    parser.add_argument("--chunk", type=int, default=500, help="размер порции и пакета записи")
+    parser.add_argument("--processes", type=int, default=os.cpu_count() or 1, help="число интерпретаторов")
+    parser.add_argument("--restart", action="store_true", help="начать заново, игнорируя контрольные точки")
+    args = parser.parse_args(argv)
+
+    upgrade(engine)
+    query = select(Task.__table__.c.id, Task.__table__.c.checker_code).order_by(Task.__table__.c.id)
+    if args.task:
+        query = query.where(Task.__table__.c.id.in_(args.task))
+    with engine.connect() as conn:
+        tasks = conn.execute(query).all()
+
+    pool = RunnerPool(size=args.processes)
+    pool.start()
+    total_done = total_changed = total_skipped = 0
+    try:
+        with ThreadPoolExecutor(max_workers=args.processes) as executor:
+            for task in tasks:
+                done, changed, skipped = regrade_task(
+                    task.id, task.checker_code, pool, executor, args.chunk, args.restart
+                )
+                total_done += done
+                total_changed += changed
+                total_skipped += skipped
+    finally:
+        pool.close()
+    print(f"Перепроверено попыток: {total_done}, изменён вердикт: {total_changed}")
+    if total_skipped:
+        print(f"Не перепроверено из-за таймаутов и падений: {total_skipped}, запустите ещё раз")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,223 @@
+import hashlib
+import json
+import sys
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from sqlalchemy import delete, event, select
+from sqlalchemy.dialects.sqlite import insert
+
+from config import ATTEMPT_OUTPUT_LIMIT, RESULT_CACHE_MB, RESULT_CACHE_PERSIST, RESULT_CACHE_SIZE, RESULT_CACHE_TTL
+from db import engine
+from models import SubmissionResult, Task
+from runner import (
+    CPU_LIMIT_MESSAGE,
+    CRASH_MESSAGE,
+    OVERLOAD_MESSAGE,
+    PROTOCOL_VERSION,
+    TIMEOUT_MESSAGE,
+    RunResult,
+    checker_hash,
+    on_worker_failure,
+    worker_failed,
+)
+
+results = SubmissionResult.__table__
+
+LOAD_DEPENDENT = (TIMEOUT_MESSAGE, CRASH_MESSAGE, CPU_LIMIT_MESSAGE, OVERLOAD_MESSAGE)
+
+
+def load_dependent(result: RunResult) -> bool:
+    # Таймауты, падения и отказ в допуске зависят от нагрузки, а не только
+    # от кода
+    return not result.ok and result.verdict is None and result.stderr.endswith(LOAD_DEPENDENT)
+
+
+def output_size(result: RunResult) -> int:
+    # Сколько памяти кэша занимает результат: его вывод в символах (для
+    # ASCII это байты)
+    return len(result.stdout) + len(result.stderr)
+
+
+def normalize_code(code: str) -> str:
+    # Двойной клик и повторный запуск дают тот же текст; приводим только
+    # переводы строк и хвостовые пробелы в конце файла.
+    return code.replace("\r\n", "\n").replace("\r", "\n").rstrip()
+
+
+def make_key(code: str, checker_code: str | None) -> str:
+    digest = hashlib.sha256()
+    for part in (normalize_code(code), checker_hash(checker_code), sys.version, str(PROTOCOL_VERSION)):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+# LRU-кэш результатов запуска (RunResult) с ограничением по числу
+# записей, суммарному выводу и времени жизни. Результат с выводом длиннее
+# max_output не кэшируется. Ключ включает хэш checker_code, поэтому после
+# изменения проверки старые записи больше не находятся и удаляются.
+# Кэшируются только результаты завершённого запуска в отдельном процессе
+# (RunResult.worker); если воркер потом заменён из-за сбоя, его записи
+# забываются. При persist=True результаты дублируются в таблицу
+# submission_results.
+class ResultCache:
+    def __init__(
+        self,
+        max_entries=RESULT_CACHE_SIZE,
+        ttl=RESULT_CACHE_TTL,
+        persist=RESULT_CACHE_PERSIST,
+        max_bytes=RESULT_CACHE_MB * 1024 * 1024,
+        max_output=ATTEMPT_OUTPUT_LIMIT,
+    ):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_output = max_output
+        self.ttl = ttl
+        self.persist = persist
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: str):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, _, value = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                self._drop(key)
+        value = self._load(key) if self.persist else None
+        with self._lock:
+            if value is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        self._remember(key, value[0], value[1])
+        return value[1]
+
+    def put(self, key: str, checker_digest: str, value: RunResult):
+        if load_dependent(value):
+            return
+        if value.worker is None or worker_failed(value.worker):
+            return
+        if output_size(value) > self.max_output:
+            return
+        self._remember(key, checker_digest, value)
+        if self.persist:
+            self._store(key, checker_digest, value)
+
+    def _remember(self, key, checker_digest, value):
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (time.monotonic() + self.ttl, checker_digest, value)
+            self._bytes += output_size(value)
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _drop(self, key):
+        # Вызывается под self._lock
+        self._bytes -= output_size(self._entries.pop(key)[2])
+
+    def _load(self, key):
+        with engine.connect() as conn:
+            row = conn.execute(
+                select(
+                    results.c.checker_hash,
+                    results.c.ok,
+                    results.c.stdout,
+                    results.c.stderr,
+                    results.c.verdict,
+                    results.c.worker,
+                    results.c.created_at,
+                ).where(results.c.key == key)
+            ).first()
+        if row is None or row.created_at < datetime.utcnow() - timedelta(seconds=self.ttl):
+            return None
+        verdict = json.loads(row.verdict) if row.verdict else None
+        return row.checker_hash, RunResult(row.ok, row.stdout, row.stderr, verdict, None, row.worker)
+
+    def _store(self, key, checker_digest, value):
+        values = {
+            "key": key,
+            "checker_hash": checker_digest,
+            "ok": value.ok,
+            "stdout": value.stdout,
+            "stderr": value.stderr,
+            "verdict": json.dumps(value.verdict, ensure_ascii=False) if value.verdict is not None else None,
+            "worker": value.worker,
+            "created_at": datetime.utcnow(),
+        }
+        stmt = insert(results).values(**values)
+        stmt = stmt.on_conflict_do_update(index_elements=[results.c.key], set_=values)
+        with engine.begin() as conn:
+            conn.execute(stmt)
+
+    def invalidate_checker(self, checker_digest: str):
+        with self._lock:
+            stale = [key for key, entry in self._entries.items() if entry[1] == checker_digest]
+            for key in stale:
+                self._drop(key)
+        if self.persist:
+            with engine.begin() as conn:
+                conn.execute(delete(results).where(results.c.checker_hash == checker_digest))
+
+    def forget_worker(self, worker_id: str):
+        with self._lock:
+            stale = [key for key, entry in self._entries.items() if entry[2].worker == worker_id]
+            for key in stale:
+                self._drop(key)
+        if self.persist:
+            with engine.begin() as conn:
+                conn.execute(delete(results).where(results.c.worker == worker_id))
+
+    def prune(self):
+        if self.persist:
+            cutoff = datetime.utcnow() - timedelta(seconds=self.ttl)
+            with engine.begin() as conn:
+                conn.execute(delete(results).where(results.c.created_at < cutoff))
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_result_cache() -> ResultCache:
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = ResultCache()
+                on_worker_failure(_cache.forget_worker)
+    return _cache
+
+
+# checker_code отложен (deferred): active_history подгружает прежнее значение
+@event.listens_for(Task.checker_code, "set", active_history=True)
+def _on_checker_changed(target, value, oldvalue, initiator):
+    if isinstance(oldvalue, str) and oldvalue != value and _cache is not None:
+        _cache.invalidate_checker(checker_hash(oldvalue))
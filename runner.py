@@ -0,0 +1,541 @@
+import ast
+import atexit
+import base64
+import hashlib
+import itertools
+import json
+import marshal
+import os
+import queue
+import struct
+import subprocess
+import sys
+import threading
+import time
+import traceback
+from collections import OrderedDict, namedtuple
+from functools import lru_cache
+from pathlib import Path
+
+import metrics
+from config import (
+    RUNNER_ADMISSION_TIMEOUT,
+    RUNNER_CASE_TIMEOUT,
+    RUNNER_CONCURRENCY,
+    RUNNER_CPU_LIMIT,
+    RUNNER_FILE_SIZE_LIMIT,
+    RUNNER_MAX_RUNS,
+    RUNNER_MEMORY_LIMIT_MB,
+    RUNNER_NPROC_LIMIT,
+    RUNNER_OUTPUT_INTERVAL_MS,
+    RUNNER_OUTPUT_LIMIT,
+    RUNNER_POOL_SIZE,
+    RUNNER_TIMEOUT,
+    RUNNER_USER,
+)
+from runner_worker import LEGACY_CASE, WORKER_FLAG
+
+if getattr(sys, "frozen", False):
+    BASE_DIR = Path(getattr(sys, "_MEIPASS"))
+else:
+    BASE_DIR = Path(__file__).resolve().parent
+WORKER_SCRIPT = BASE_DIR / "runner_worker.py"
+
+TIMEOUT_MESSAGE = "Превышено время выполнения кода"
+CRASH_MESSAGE = "Процесс выполнения кода аварийно завершился"
+OUTPUT_LIMIT_MESSAGE = "Превышен допустимый объём вывода"
+CPU_LIMIT_MESSAGE = "Превышено процессорное время"
+OVERLOAD_MESSAGE = "Сервер перегружен, попробуйте отправить решение ещё раз"
+
+# Меняется при несовместимых изменениях протокола runner_worker.py
+PROTOCOL_VERSION = 6
+_HEADER = struct.Struct(">I")
+
+# Имена файлов в трассировках, как у runner_worker.py
+FILENAME = "<submission>"
+CHECKER_FILENAME = "<checker>"
+CHECKER_CACHE_SIZE = 512
+# Как часто допуск перепроверяет свободную память, пока запуск ждёт
+ADMISSION_POLL_INTERVAL = 0.05
+# Таймаут запуска соблюдает сам воркер; родитель ждёт на столько дольше и
+# только потом считает воркер зависшим
+WORKER_GRACE = 1.0
+# Код ученика выполняется в отдельном процессе на каждый запуск (см.
+# runner_worker.py); без fork воркер заменяется после каждого запуска
+FORK_PER_RUN = hasattr(os, "fork")
+# Кадры воркера о незавершённом запуске
+_ABORTED = {"timeout": TIMEOUT_MESSAGE, "cpu_limit": CPU_LIMIT_MESSAGE, "crash": CRASH_MESSAGE}
+# Сколько последних сбойных воркеров помнит worker_failed()
+FAILED_WORKERS_KEPT = 1024
+
+# verdict — {"passed": bool, "cases": [...]} от проверки, None без проверки;
+# usage — {"cpu_ms", "peak_rss_kb"} процесса запуска, None, если код не
+# запускался или воркер перестал отвечать; worker — id воркера, в отдельном
+# процессе которого прошёл запуск, None, если запуска не было или он не
+# завершился
+RunResult = namedtuple("RunResult", "ok stdout stderr verdict usage worker", defaults=(None, None))
+# code — marshal скомпилированной проверки в base64 (кадры протокола —
+# JSON), cases — имена test_* функций в порядке объявления
+CompiledChecker = namedtuple("CompiledChecker", "code cases")
+
+
+def _failed(message, stdout="", stderr="", usage=None, worker=None):
+    # Вывод, полученный до таймаута или падения, сохраняется
+    return RunResult(False, stdout, f"{stderr}\n{message}" if stderr else message, None, usage, worker)
+
+
+def format_exception_only(exc) -> str:
+    # Как интерпретатор печатает SyntaxError: с отступами и строкой кода
+    return "".join(traceback.format_exception_only(type(exc), exc))
+
+
+def check_syntax(source: str):
+    # Компиляция кода ученика в этом процессе, без выполнения: исключение
+    # (SyntaxError с позицией) или None, если код компилируется
+    try:
+        compile(source, FILENAME, "exec", dont_inherit=True)
+    except (SyntaxError, ValueError, RecursionError, MemoryError) as exc:
+        return exc
+    return None
+
+
+def _case_names(tree):
+    return [
+        node.name for node in tree.body if isinstance(node, ast.FunctionDef) and node.name.startswith("test_")
+    ]
+
+
+@lru_cache(maxsize=CHECKER_CACHE_SIZE)
+def compile_checker(checker_code: str) -> CompiledChecker:
+    # Проверка разбирается и компилируется один раз на текст (то есть на
+    # checker_hash), а воркер получает готовый код. SyntaxError
+    # пробрасывается.
+    tree = ast.parse(checker_code, CHECKER_FILENAME)
+    code = compile(tree, CHECKER_FILENAME, "exec", dont_inherit=True)
+    cases = list(dict.fromkeys(_case_names(tree)))
+    return CompiledChecker(base64.b64encode(marshal.dumps(code)).decode("ascii"), cases)
+
+
+def checker_problems(checker_code: str) -> list:
+    # Ошибки проверки, которые видны без запуска; для импорта контента
+    try:
+        tree = ast.parse(checker_code, CHECKER_FILENAME)
+        compile(tree, CHECKER_FILENAME, "exec", dont_inherit=True)
+    except (SyntaxError, ValueError, RecursionError) as exc:
+        line = f", строка {exc.lineno}" if getattr(exc, "lineno", None) else ""
+        return [f"ошибка компиляции проверки{line}: {getattr(exc, 'msg', None) or exc}"]
+    problems = []
+    seen = set()
+    for node in tree.body:
+        if not isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)) or not node.name.startswith("test_"):
+            continue
+        if isinstance(node, ast.AsyncFunctionDef):
+            problems.append(f"тест {node.name} объявлен через async def и не будет запущен")
+        elif node.name in seen:
+            problems.append(f"тест {node.name} объявлен дважды, выполнится только последний")
+        args = node.args
+        required = len(args.posonlyargs) + len(args.args) - len(args.defaults)
+        if required > 0 or any(default is None for default in args.kw_defaults):
+            problems.append(f"тест {node.name} требует аргументы, а вызывается без них")
+        seen.add(node.name)
+    return problems
+
+
+def runner_limits() -> dict:
+    # Пределы процесса запуска для runner_worker._apply_limits
+    return {
+        "cpu": RUNNER_CPU_LIMIT,
+        "memory": RUNNER_MEMORY_LIMIT_MB * 1024 * 1024 if RUNNER_MEMORY_LIMIT_MB > 0 else None,
+        "file_size": RUNNER_FILE_SIZE_LIMIT,
+        "processes": RUNNER_NPROC_LIMIT,
+    }
+
+
+@lru_cache(maxsize=1)
+def runner_user() -> dict:
+    # Аргументы Popen для RUNNER_USER: его uid и основная группа, без
+    # дополнительных групп процесса приложения
+    if not RUNNER_USER:
+        return {}
+    import pwd
+
+    entry = pwd.getpwnam(RUNNER_USER)
+    return {"user": entry.pw_uid, "group": entry.pw_gid, "extra_groups": []}
+
+
+def available_memory():
+    # MemAvailable в байтах или None, где /proc/meminfo нет
+    try:
+        with open("/proc/meminfo", "rb") as file:
+            for line in file:
+                if line.startswith(b"MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+
+# Допуск запусков на весь процесс, общий для всех пулов (приложение,
+# regrade.py): одновременно не больше max_running запусков, а новый
+# начинается, только если свободной памяти хватит на запуск с пределом
+# memory_per_run. Память перепроверяется, пока запуск ждёт: она
+# освобождается и другими процессами машины. Один запуск допускается всегда.
+class AdmissionController:
+    def __init__(self, max_running=RUNNER_CONCURRENCY, memory_per_run=RUNNER_MEMORY_LIMIT_MB * 1024 * 1024):
+        self.max_running = max(1, max_running)
+        self.memory_per_run = memory_per_run
+        self.running = 0
+        self._cond = threading.Condition()
+
+    def _has_room(self):
+        if self.running == 0:
+            return True
+        if self.running >= self.max_running:
+            return False
+        if self.memory_per_run <= 0:
+            return True
+        available = available_memory()
+        return available is None or available >= self.memory_per_run
+
+    def acquire(self, timeout=RUNNER_ADMISSION_TIMEOUT) -> bool:
+        deadline = time.monotonic() + timeout
+        with self._cond:
+            while not self._has_room():
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self._cond.wait(min(remaining, ADMISSION_POLL_INTERVAL))
+            self.running += 1
+            return True
+
+    def release(self):
+        with self._cond:
+            self.running -= 1
+            self._cond.notify()
+
+
+_admission = None
+_admission_lock = threading.Lock()
+
+
+def get_admission() -> AdmissionController:
+    global _admission
+    if _admission is None:
+        with _admission_lock:
+            if _admission is None:
+                _admission = AdmissionController()
+    return _admission
+
+
+# Воркеры, заменённые из-за сбоя (упал или перестал отвечать): их прежним
+# результатам нельзя доверять, поэтому слушатели on_worker_failure (кэш
+# результатов) получают id такого воркера и забывают его результаты
+_worker_ids = itertools.count(1)
+_failed_workers = OrderedDict()
+_failure_listeners = []
+_failure_lock = threading.Lock()
+
+
+def on_worker_failure(callback):
+    with _failure_lock:
+        _failure_listeners.append(callback)
+
+
+def worker_failed(worker_id) -> bool:
+    with _failure_lock:
+        return worker_id in _failed_workers
+
+
+def _worker_failed(worker_id):
+    with _failure_lock:
+        _failed_workers[worker_id] = True
+        while len(_failed_workers) > FAILED_WORKERS_KEPT:
+            _failed_workers.popitem(last=False)
+        listeners = list(_failure_listeners)
+    for callback in listeners:
+        try:
+            callback(worker_id)
+        except Exception:
+            traceback.print_exc()
+
+
+def _worker_command(limits):
+    # В собранном приложении sys.executable — Bravelearn.exe, и воркер — он
+    # же с флагом WORKER_FLAG (разбирается в начале app.py)
+    if getattr(sys, "frozen", False):
+        return [sys.executable, WORKER_FLAG, limits]
+    return [sys.executable, "-I", str(WORKER_SCRIPT), limits]
+
+
+class _Worker:
+    def __init__(self, limits):
+        # pid в id различает воркеры разных процессов в общей таблице кэша
+        self.id = f"{os.getpid()}.{next(_worker_ids)}"
+        started = time.perf_counter()
+        self.proc = subprocess.Popen(
+            _worker_command(limits),
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            **runner_user(),
+        )
+        if metrics.ENABLED:
+            metrics.observe("runner_spawn_seconds", time.perf_counter() - started)
+        self.runs = 0
+        self.responses = queue.Queue()
+        self._reader = threading.Thread(target=self._read_loop, daemon=True)
+        self._reader.start()
+
+    def _read_loop(self):
+        stream = self.proc.stdout
+        try:
+            while True:
+                header = stream.read(_HEADER.size)
+                if len(header) < _HEADER.size:
+                    break
+                (size,) = _HEADER.unpack(header)
+                self.responses.put(json.loads(stream.read(size).decode("utf-8")))
+        except (OSError, ValueError):
+            pass
+        self.responses.put(None)
+
+    @property
+    def alive(self):
+        return self.proc.poll() is None
+
+    def send(self, payload):
+        data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.proc.stdin.write(_HEADER.pack(len(data)) + data)
+        self.proc.stdin.flush()
+
+    def kill(self):
+        if self.alive:
+            self.proc.kill()
+        try:
+            self.proc.wait(timeout=1)
+        except subprocess.TimeoutExpired:
+            pass
+        for stream in (self.proc.stdin, self.proc.stdout):
+            try:
+                stream.close()
+            except OSError:
+                pass
+
+
+# Пул заранее запущенных интерпретаторов. Воркер выполняет каждый запуск в
+# своём дочернем процессе и перезапускается после max_runs запусков, а
+# также если сам упал или перестал отвечать (см. on_worker_failure). Запуск сначала получает допуск
+# (AdmissionController), потом интерпретатор.
+class RunnerPool:
+    def __init__(self, size=RUNNER_POOL_SIZE, max_runs=RUNNER_MAX_RUNS, admission=None):
+        self.size = size
+        self.max_runs = max_runs
+        self.admission = admission or get_admission()
+        self._limits = json.dumps(runner_limits())
+        self._idle = []
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(size)
+        self._closed = False
+
+    def start(self):
+        # Прогреваем пул, чтобы первый запуск не ждал старта интерпретатора
+        with self._lock:
+            while len(self._idle) < self.size:
+                self._idle.append(_Worker(self._limits))
+
+    def _acquire(self):
+        if metrics.ENABLED:
+            started = time.perf_counter()
+            self._slots.acquire()
+            metrics.observe("runner_wait_seconds", time.perf_counter() - started)
+        else:
+            self._slots.acquire()
+        with self._lock:
+            while self._idle:
+                worker = self._idle.pop()
+                if worker.alive:
+                    return worker
+                worker.kill()
+        try:
+            return _Worker(self._limits)
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def _release(self, worker, reusable):
+        reason = "max_runs" if reusable else "failure"
+        if reusable and (worker.runs >= self.max_runs or not FORK_PER_RUN):
+            reusable = False
+        try:
+            if not reusable:
+                if metrics.ENABLED:
+                    metrics.inc("runner_restarts_total", reason=reason)
+                worker.kill()
+                if reason == "failure":
+                    _worker_failed(worker.id)
+                # Сразу поднимаем замену, чтобы она успела прогреться
+                worker = _Worker(self._limits)
+            with self._lock:
+                if self._closed:
+                    worker.kill()
+                else:
+                    self._idle.append(worker)
+        finally:
+            self._slots.release()
+
+    def run(
+        self,
+        source: str,
+        timeout: float = RUNNER_TIMEOUT,
+        checker_code: str | None = None,
+        case_timeout: float | None = RUNNER_CASE_TIMEOUT,
+        stop_on_failure: bool = False,
+        on_output=None,
+        output_limit: int | None = RUNNER_OUTPUT_LIMIT,
+    ) -> RunResult:
+        # on_output(stream, data) получает вывод по мере выполнения, в потоке
+        # вызывающего; в результате он тоже есть целиком
+        compiled = None
+        if checker_code:
+            try:
+                compiled = compile_checker(checker_code)
+            except (SyntaxError, ValueError, RecursionError) as exc:
+                # Сломанную проверку незачем запускать вместе с кодом ученика
+                verdict = {"passed": False, "cases": [], "error": format_exception_only(exc).strip()}
+                return RunResult(False, "", "", verdict)
+        if metrics.ENABLED:
+            waited = time.perf_counter()
+        if not self.admission.acquire():
+            if metrics.ENABLED:
+                metrics.inc("runner_admission_rejected_total")
+            return _failed(OVERLOAD_MESSAGE)
+        if metrics.ENABLED:
+            metrics.observe("runner_admission_wait_seconds", time.perf_counter() - waited)
+        try:
+            worker = self._acquire()
+        except BaseException:
+            self.admission.release()
+            raise
+        reusable = False
+        outcome = "crash"
+        started = time.perf_counter()
+        output = {"stdout": [], "stderr": []}
+
+        def failed(message, usage=None, worker_id=None):
+            return _failed(message, "".join(output["stdout"]), "".join(output["stderr"]), usage, worker_id)
+
+        try:
+            try:
+                worker.send(
+                    {
+                        "source": source,
+                        "checker": checker_code,
+                        "checker_code": compiled.code if compiled is not None else None,
+                        "checker_cases": compiled.cases if compiled is not None else None,
+                        "case_timeout": case_timeout,
+                        "stop_on_failure": stop_on_failure,
+                        "output_limit": output_limit,
+                        "output_interval": RUNNER_OUTPUT_INTERVAL_MS / 1000,
+                        "timeout": timeout,
+                    }
+                )
+            except OSError:
+                return failed(CRASH_MESSAGE)
+            worker.runs += 1
+            deadline = time.monotonic() + timeout + (WORKER_GRACE if FORK_PER_RUN else 0)
+            while True:
+                try:
+                    response = worker.responses.get(timeout=max(deadline - time.monotonic(), 0))
+                except queue.Empty:
+                    outcome = "timeout"
+                    return failed(TIMEOUT_MESSAGE)
+                if response is None:
+                    return failed(CRASH_MESSAGE)
+                if "output" in response:
+                    output[response["output"]].append(response["data"])
+                    if on_output is not None:
+                        on_output(response["output"], response["data"])
+                    continue
+                # Запуск закончился, воркер жив и готов к следующему
+                reusable = True
+                usage = response.get("usage")
+                if metrics.ENABLED and usage:
+                    metrics.observe("runner_cpu_seconds", usage["cpu_ms"] / 1000)
+                    if usage["peak_rss_kb"] is not None:
+                        metrics.observe("runner_peak_rss_bytes", usage["peak_rss_kb"] * 1024)
+                if "output_limit" in response:
+                    outcome = "output_limit"
+                    return failed(
+                        f"{OUTPUT_LIMIT_MESSAGE} ({response['output_limit'] // 1024} КБ)", usage, worker.id
+                    )
+                aborted = next((key for key in _ABORTED if key in response), None)
+                if aborted is not None:
+                    outcome = aborted
+                    return failed(_ABORTED[aborted], usage, worker.id)
+                outcome = "ok"
+                return RunResult(
+                    response["ok"],
+                    "".join(output["stdout"]),
+                    "".join(output["stderr"]),
+                    response["verdict"],
+                    usage,
+                    worker.id,
+                )
+        finally:
+            if metrics.ENABLED:
+                metrics.observe("runner_exec_seconds", time.perf_counter() - started, outcome=outcome)
+            try:
+                self._release(worker, reusable)
+            finally:
+                self.admission.release()
+
+    def close(self):
+        with self._lock:
+            self._closed = True
+            idle, self._idle = self._idle, []
+        for worker in idle:
+            worker.kill()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_runner_pool() -> RunnerPool:
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = RunnerPool()
+                atexit.register(_pool.close)
+    return _pool
+
+
+def run_user_code(
+    user_code: str, checker_code: str | None = None, timeout: float = RUNNER_TIMEOUT, pool=None, on_output=None
+):
+    return (pool or get_runner_pool()).run(user_code, timeout=timeout, checker_code=checker_code, on_output=on_output)
+
+
+def checker_hash(checker_code: str | None) -> str:
+    return hashlib.sha256((checker_code or "").encode("utf-8")).hexdigest()
+
+
+def check_passed(result: RunResult, checker_code: str | None) -> bool:
+    # Вердикт выносит только проверка: вывод ученика (например, "OK")
+    # на результат не влияет. Проверка идёт в процессе кода ученика, и он
+    # может подменить вердикт, поэтому засчитываются только все кейсы
+    # проверки по порядку, каждый пройденный.
+    if not checker_code:
+        return result.ok
+    verdict = result.verdict
+    if not isinstance(verdict, dict) or verdict.get("passed") is not True:
+        return False
+    cases = verdict.get("cases")
+    if not isinstance(cases, list) or not all(isinstance(case, dict) for case in cases):
+        return False
+    try:
+        expected = compile_checker(checker_code).cases or [LEGACY_CASE]
+    except (SyntaxError, ValueError, RecursionError):
+        return False
+    return [case.get("name") for case in cases] == expected and all(case.get("passed") is True for case in cases)
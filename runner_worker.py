@@ -0,0 +1,613 @@
+# Рабочий процесс пула runner.py. Запускается как
+# `python -I runner_worker.py '{"cpu": ..., "memory": ..., ...}'`, поэтому не
+# импортирует модули проекта: весь протокол описан здесь. В собранном
+# приложении (PyInstaller) интерпретатора нет, и воркер — это сам
+# Bravelearn.exe с первым аргументом WORKER_FLAG (см. начало app.py).
+#
+# Сам воркер код ученика не выполняет. Каждый запрос получает свой дочерний
+# процесс, порождённый fork-ом с уже загруженным интерпретатором. Процесс
+# для следующего запроса готовится заранее: он закрывает дескрипторы
+# протокола, ставит пределы и ждёт запрос в своём канале, затем выполняет
+# код и проверку и пишет кадры в другой канал. Воркер читает их, проверяет и передаёт родителю, сам
+# следит за таймаутом запуска и объёмом вывода. Что бы ни сделал код ученика
+# с модулями, sys.modules и глобальными переменными, это остаётся в его
+# процессе и не достаётся следующей отправке. Проверка выполняется в том же
+# процессе, что и код ученика (ей нужны его функции), поэтому вердикт из
+# этого процесса не доверенный: runner.check_passed засчитывает его, только
+# если в нём ровно кейсы проверки и все пройдены. Без fork (Windows) код
+# выполняется в самом воркере, и runner.py заменяет воркер после каждого
+# запуска.
+#
+# Аргумент — пределы дочернего процесса (см. _apply_limits). В Linux это
+# rlimit: адресное пространство (нехватка — MemoryError у ученика), размер
+# записываемого файла (OSError), число процессов и процессорное время, по
+# превышении которого ядро завершает процесс сигналом SIGXCPU.
+#
+# Кадр протокола: 4 байта длины (big-endian) + JSON в UTF-8.
+# Запрос:  {"source": "...", "checker": "..." | null,
+#           "checker_code": "..." | null, "checker_cases": [...] | null,
+#           "case_timeout": float | null, "stop_on_failure": bool,
+#           "output_limit": int | null, "output_interval": float,
+#           "timeout": float | null}
+# Вывод:   {"output": "stdout" | "stderr", "data": "..."} — по ходу запуска
+# Ответ:   {"ok": bool, "verdict": {...} | null} — последним кадром; если
+#          запуск не дошёл до конца — {"timeout": true}, {"cpu_limit": true},
+#          {"output_limit": int} или {"crash": true}. В любом из них есть
+#          "usage": {"cpu_ms": int, "peak_rss_kb": int | null}.
+#
+# Вывод не копится до конца запуска: он уходит родителю кадрами по концу
+# строки, но не чаще раза в output_interval секунд (первая строка — сразу),
+# или по OUTPUT_CHUNK символов. Когда вывод превышает output_limit байт,
+# родителю уходит то, что уместилось, и кадр {"output_limit": int}, а
+# дочерний процесс завершается.
+#
+# usage — процессорное время и пик RSS дочернего процесса по wait4: их
+# считает ядро, а не код в этом процессе. Процесс запуска — лидер своей
+# группы процессов, а воркер — subreaper (Linux): после запуска воркер
+# убивает всё, что осталось от кода ученика, включая ушедших в свою
+# сессию потомков, и никто из них не держит канал кадров.
+#
+# Проверку разбирает и компилирует родитель (runner.compile_checker): здесь
+# она приходит marshal-кодом в base64 со списком test_* функций, а текст
+# нужен только для строк в трассировках. Проверка выполняется после кода
+# ученика в отдельном пространстве имён, которое видит всё, что определил
+# ученик. Тест-кейсы — функции test_* уровня модуля проверки в порядке
+# объявления; docstring функции служит её описанием. Модуль проверки может
+# задать STOP_ON_FAILURE и CASE_TIMEOUT (секунды на один кейс). Проверка без
+# test_* функций считается одним кейсом "checker" (старый формат с assert).
+import base64
+import builtins
+import io
+import json
+import linecache
+import marshal
+import os
+import select
+import signal
+import struct
+import sys
+import time
+import traceback
+import types
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+if sys.platform.startswith("linux"):
+    import ctypes
+
+    try:
+        _libc = ctypes.CDLL(None, use_errno=True)
+    except OSError:
+        _libc = None
+else:
+    _libc = None
+
+# Первый аргумент собранного приложения, запускающий воркер вместо окна
+WORKER_FLAG = "--runner-worker"
+FILENAME = "<submission>"
+CHECKER_FILENAME = "<checker>"
+LEGACY_CASE = "checker"
+OUTPUT_CHUNK = 64 * 1024
+OUTPUT_LIMIT_EXIT_CODE = 3
+_HEADER = struct.Struct(">I")
+# Кадр дочернего процесса больше этого считается испорченным протоколом
+MAX_CHILD_FRAME = 16 * 1024 * 1024
+# Как часто воркер, ожидая кадры, проверяет, не завершился ли процесс
+CHILD_POLL_INTERVAL = 0.05
+FORK_PER_RUN = hasattr(os, "fork")
+# Сколько раз добивать потомков кода ученика после запуска
+STRAY_SWEEPS = 10
+PR_SET_PDEATHSIG = 1
+PR_SET_CHILD_SUBREAPER = 36
+# Процесс для следующего запроса готовится, если за это время запрос не
+# пришёл (см. main)
+SPARE_DELAY = 0.002
+# В macOS RLIMIT_AS не соблюдается, поэтому пределы только в Linux
+LIMITS_SUPPORTED = resource is not None and sys.platform.startswith("linux")
+
+
+class CaseTimeout(BaseException):
+    pass
+
+
+def _read_frame(stream):
+    header = stream.read(_HEADER.size)
+    if len(header) < _HEADER.size:
+        return None
+    (size,) = _HEADER.unpack(header)
+    return json.loads(stream.read(size).decode("utf-8"))
+
+
+def _write_frame(stream, payload):
+    data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+    stream.write(_HEADER.pack(len(data)) + data)
+    stream.flush()
+
+
+class _OutputChannel:
+    # Буфер вывода запуска. Байты считаются при отправке, поэтому сверх
+    # output_limit в памяти бывает не больше OUTPUT_CHUNK символов.
+    def __init__(self, stream, limit, interval):
+        self.stream = stream
+        self.limit = limit
+        self.interval = interval
+        self.pending = {"stdout": [], "stderr": []}
+        self.size = 0
+        self.written = 0
+        self.flushed_at = time.monotonic() - interval
+
+    def flush(self):
+        for name, parts in self.pending.items():
+            if not parts:
+                continue
+            data = "".join(parts)
+            parts.clear()
+            if self.limit is not None:
+                encoded = data.encode("utf-8", "surrogatepass")
+                if self.written + len(encoded) > self.limit:
+                    allowed = encoded[: self.limit - self.written].decode("utf-8", "ignore")
+                    self._send({"output": name, "data": allowed})
+                    self._send({"output_limit": self.limit})
+                    os._exit(OUTPUT_LIMIT_EXIT_CODE)
+                self.written += len(encoded)
+            self._send({"output": name, "data": data})
+        self.size = 0
+        self.flushed_at = time.monotonic()
+
+    def _send(self, payload):
+        # Таймер кейса (SIGALRM) не должен оборвать кадр на середине
+        if not hasattr(signal, "pthread_sigmask"):
+            _write_frame(self.stream, payload)
+            return
+        previous = signal.pthread_sigmask(signal.SIG_BLOCK, {signal.SIGALRM})
+        try:
+            _write_frame(self.stream, payload)
+        finally:
+            signal.pthread_sigmask(signal.SIG_SETMASK, previous)
+
+
+class _OutputStream(io.TextIOBase):
+    # sys.stdout/sys.stderr кода ученика; print вызывает write на каждую
+    # часть строки, поэтому здесь только добавление в буфер
+    def __init__(self, channel, name):
+        self.channel = channel
+        self.name = name
+        self.parts = channel.pending[name]
+
+    def writable(self):
+        return True
+
+    def write(self, text):
+        if not isinstance(text, str):
+            raise TypeError(f"write() argument must be str, not {type(text).__name__}")
+        channel = self.channel
+        self.parts.append(text)
+        channel.size += len(text)
+        if channel.size >= OUTPUT_CHUNK or ("\n" in text and time.monotonic() - channel.flushed_at >= channel.interval):
+            channel.flush()
+        return len(text)
+
+
+def _detach_std_streams():
+    # Протокол идёт через копии дескрипторов 0/1, а сами 0/1 указывают на
+    # devnull: запись пользователя мимо sys.stdout (os.write, дочерние
+    # процессы) не может испортить кадры.
+    proto_in = os.fdopen(os.dup(0), "rb")
+    proto_out = os.fdopen(os.dup(1), "wb")
+    devnull = os.open(os.devnull, os.O_RDWR)
+    os.dup2(devnull, 0)
+    os.dup2(devnull, 1)
+    os.close(devnull)
+    return proto_in, proto_out
+
+
+def _raise_case_timeout(signum, frame):
+    raise CaseTimeout()
+
+
+def _set_case_alarm(seconds):
+    # Бюджет на кейс есть только там, где есть setitimer (не Windows);
+    # общий таймаут запуска всё равно соблюдает родительский процесс.
+    if seconds and hasattr(signal, "setitimer"):
+        signal.signal(signal.SIGALRM, _raise_case_timeout)
+        signal.setitimer(signal.ITIMER_REAL, seconds)
+
+
+def _clear_case_alarm():
+    if hasattr(signal, "setitimer"):
+        signal.setitimer(signal.ITIMER_REAL, 0)
+
+
+def _describe_failure(exc):
+    if isinstance(exc, CaseTimeout):
+        return "Превышено время выполнения теста"
+    if isinstance(exc, AssertionError) and not exc.args:
+        for frame in reversed(traceback.extract_tb(exc.__traceback__)):
+            if frame.filename == CHECKER_FILENAME and frame.line:
+                return "AssertionError: " + frame.line
+    return "".join(traceback.format_exception_only(type(exc), exc)).strip()
+
+
+def _run_case(name, fn, budget):
+    started = time.perf_counter()
+    result = {"name": name, "passed": True}
+    doc = getattr(fn, "__doc__", None)
+    if doc:
+        result["title"] = doc.strip()
+    try:
+        _set_case_alarm(budget)
+        try:
+            fn()
+        finally:
+            _clear_case_alarm()
+    except BaseException as exc:
+        result["passed"] = False
+        result["error"] = _describe_failure(exc)
+    result["time_ms"] = round((time.perf_counter() - started) * 1000, 3)
+    return result
+
+
+def _run_checker(checker, compiled, case_names, user_namespace, case_timeout, stop_on_failure):
+    code = marshal.loads(base64.b64decode(compiled))
+    namespace = dict(user_namespace)
+    linecache.cache[CHECKER_FILENAME] = (len(checker), None, checker.splitlines(True), CHECKER_FILENAME)
+    cases = []
+    try:
+        if not case_names:
+            cases.append(_run_case(LEGACY_CASE, lambda: exec(code, namespace), case_timeout))
+        else:
+            exec(code, namespace)
+            budget = namespace.get("CASE_TIMEOUT", case_timeout)
+            stop = namespace.get("STOP_ON_FAILURE", stop_on_failure)
+            for name in case_names:
+                cases.append(_run_case(name, namespace[name], budget))
+                if stop and not cases[-1]["passed"]:
+                    break
+    finally:
+        linecache.cache.pop(CHECKER_FILENAME, None)
+    return {"passed": bool(cases) and all(case["passed"] for case in cases), "cases": cases}
+
+
+def _cap(kind, value):
+    # Жёсткий предел: код ученика не может его поднять
+    soft, hard = resource.getrlimit(kind)
+    if hard != resource.RLIM_INFINITY:
+        value = min(value, hard)
+    resource.setrlimit(kind, (value, value))
+
+
+def _apply_limits(limits):
+    # Ставятся в дочернем процессе перед кодом ученика: его процессорное
+    # время после fork считается с нуля
+    if not LIMITS_SUPPORTED:
+        return
+    # SIGXCPU не должен оставлять core-файлы
+    _cap(resource.RLIMIT_CORE, 0)
+    if limits.get("memory"):
+        _cap(resource.RLIMIT_AS, limits["memory"])
+    if limits.get("file_size") is not None and limits["file_size"] >= 0:
+        _cap(resource.RLIMIT_FSIZE, limits["file_size"])
+        # Запись сверх предела — OSError у ученика, а не SIGXFSZ процессу
+        signal.signal(signal.SIGXFSZ, signal.SIG_IGN)
+    if limits.get("processes") is not None and limits["processes"] >= 0:
+        _cap(resource.RLIMIT_NPROC, limits["processes"])
+    if limits.get("cpu"):
+        # На мягком пределе ядро шлёт SIGXCPU, на жёстком — SIGKILL; по
+        # SIGXCPU воркер отличает превышение от падения
+        soft, hard = resource.getrlimit(resource.RLIMIT_CPU)
+        value = limits["cpu"] if hard == resource.RLIM_INFINITY else min(limits["cpu"], hard - 1)
+        resource.setrlimit(resource.RLIMIT_CPU, (value, value + 1))
+
+
+def _cpu_seconds():
+    times = os.times()
+    return times.user + times.system
+
+
+def _usage(rusage):
+    peak = rusage.ru_maxrss
+    return {
+        "cpu_ms": round((rusage.ru_utime + rusage.ru_stime) * 1000),
+        "peak_rss_kb": peak // 1024 if sys.platform == "darwin" else peak,
+    }
+
+
+def _prctl(option, value):
+    # prctl(2) через ctypes; где его нет, ничего не делает
+    if _libc is not None:
+        _libc.prctl(option, value, 0, 0, 0)
+
+
+def _children():
+    try:
+        with open(f"/proc/self/task/{os.getpid()}/children", "rb") as file:
+            return [int(pid) for pid in file.read().split()]
+    except (OSError, ValueError):
+        return []
+
+
+def _kill_strays(pgid):
+    # Группа процесса запуска, затем осиротевшие потомки, которых ядро
+    # передало воркеру как subreaper; потомки могут успеть породить новых,
+    # поэтому несколько проходов
+    try:
+        os.killpg(pgid, signal.SIGKILL)
+    except (ProcessLookupError, PermissionError):
+        pass
+    for _ in range(STRAY_SWEEPS):
+        pids = _children()
+        if not pids:
+            break
+        for pid in pids:
+            try:
+                os.kill(pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+        for pid in pids:
+            try:
+                os.waitpid(pid, 0)
+            except ChildProcessError:
+                pass
+    # Зомби, если /proc/.../children недоступен
+    while True:
+        try:
+            if os.waitpid(-1, os.WNOHANG)[0] == 0:
+                break
+        except ChildProcessError:
+            break
+
+
+def _execute(request, proto_out, output_limit):
+    source = request["source"]
+    checker = request.get("checker")
+    channel = _OutputChannel(proto_out, output_limit, request.get("output_interval", 0.1))
+    stdout = _OutputStream(channel, "stdout")
+    stderr = _OutputStream(channel, "stderr")
+    # У кода ученика свой модуль __main__: `import __main__` не должен
+    # давать ему функции воркера, а проверка берётся до его запуска
+    module = types.ModuleType("__main__")
+    module.__builtins__ = builtins
+    namespace = module.__dict__
+    run_checker = _run_checker
+    worker_main = sys.modules.get("__main__")
+    linecache.cache[FILENAME] = (len(source), None, source.splitlines(True), FILENAME)
+    ok = True
+    verdict = None
+    sys.stdin, sys.stdout, sys.stderr = io.StringIO(), stdout, stderr
+    sys.modules["__main__"] = module
+    try:
+        try:
+            exec(compile(source, FILENAME, "exec"), namespace)
+        except SystemExit as exc:
+            if exc.code is not None and not isinstance(exc.code, int):
+                print(exc.code, file=stderr)
+            ok = exc.code in (None, 0)
+        except BaseException as exc:
+            ok = False
+            # Пропускаем кадр самого воркера, как это сделал бы интерпретатор
+            traceback.print_exception(type(exc), exc, exc.__traceback__.tb_next, file=stderr)
+        if checker and not ok:
+            verdict = {"passed": False, "cases": [], "error": "Код завершился с ошибкой"}
+        elif checker:
+            try:
+                verdict = run_checker(
+                    checker,
+                    request["checker_code"],
+                    request["checker_cases"],
+                    namespace,
+                    request.get("case_timeout"),
+                    request.get("stop_on_failure", False),
+                )
+            except BaseException as exc:
+                verdict = {"passed": False, "cases": [], "error": _describe_failure(exc)}
+    finally:
+        sys.stdin, sys.stdout, sys.stderr = sys.__stdin__, sys.__stdout__, sys.__stderr__
+        sys.modules["__main__"] = worker_main
+        linecache.cache.pop(FILENAME, None)
+    channel.flush()
+    return {"ok": ok, "verdict": verdict}
+
+
+def _child(limits, proto_in, proto_out, request_fd, result_fd):
+    # Дочерний процесс: без дескрипторов протокола воркера, с пределами
+    # ждёт свой единственный запрос; из этой функции он не возвращается
+    code = 1
+    try:
+        os.setpgid(0, 0)
+        # Воркер убит родителем (завис) — процесс запуска не переживёт его
+        _prctl(PR_SET_PDEATHSIG, signal.SIGKILL)
+        proto_in.close()
+        proto_out.close()
+        _apply_limits(limits)
+        with os.fdopen(request_fd, "rb") as stream:
+            request = _read_frame(stream)
+        if request is not None:
+            with os.fdopen(result_fd, "wb") as out:
+                _write_frame(out, _execute(request, out, None))
+            code = 0
+    finally:
+        os._exit(code)
+
+
+def _spawn_child(limits, proto_in, proto_out):
+    # Процесс готовится заранее, пока воркер ждёт запрос: fork и пределы
+    # не входят во время запуска. Возвращает (pid, запрос ->, <- кадры).
+    request_r, request_w = os.pipe()
+    result_r, result_w = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        os.close(request_w)
+        os.close(result_r)
+        _child(limits, proto_in, proto_out, request_r, result_w)
+    os.close(request_r)
+    os.close(result_w)
+    return pid, request_w, result_r
+
+
+def _valid_frame(frame):
+    if not isinstance(frame, dict):
+        return False
+    if "output" in frame:
+        return frame["output"] in ("stdout", "stderr") and isinstance(frame.get("data"), str)
+    return isinstance(frame.get("ok"), bool)
+
+
+class _Relay:
+    # Кадры дочернего процесса -> родителю, с пределом вывода
+    def __init__(self, proto_out, limit):
+        self.proto_out = proto_out
+        self.limit = limit
+        self.written = 0
+        self.buffer = bytearray()
+        self.result = None
+
+    def feed(self, data):
+        # False — протокол нарушен или вывод превысил предел
+        self.buffer += data
+        while len(self.buffer) >= _HEADER.size:
+            (size,) = _HEADER.unpack_from(self.buffer)
+            if size > MAX_CHILD_FRAME:
+                return False
+            if len(self.buffer) < _HEADER.size + size:
+                break
+            raw = bytes(self.buffer[_HEADER.size : _HEADER.size + size])
+            del self.buffer[: _HEADER.size + size]
+            try:
+                frame = json.loads(raw.decode("utf-8"))
+            except ValueError:
+                return False
+            if not _valid_frame(frame) or self.result is not None:
+                return False
+            if "output" not in frame:
+                self.result = {"ok": frame["ok"], "verdict": frame.get("verdict")}
+                continue
+            if self.limit is not None:
+                encoded = frame["data"].encode("utf-8", "surrogatepass")
+                if self.written + len(encoded) > self.limit:
+                    allowed = encoded[: self.limit - self.written].decode("utf-8", "ignore")
+                    _write_frame(self.proto_out, {"output": frame["output"], "data": allowed})
+                    self.result = {"output_limit": self.limit}
+                    return False
+                self.written += len(encoded)
+            _write_frame(self.proto_out, frame)
+        return True
+
+
+def _drain(fd, relay):
+    # Дочитываем то, что процесс успел записать перед завершением
+    while relay.result is None and select.select([fd], [], [], 0)[0]:
+        data = os.read(fd, OUTPUT_CHUNK)
+        if not data or not relay.feed(data):
+            return
+
+
+def _send_request(child, request):
+    pid, request_fd, read_fd = child
+    try:
+        with os.fdopen(request_fd, "wb") as stream:
+            _write_frame(stream, request)
+        return True
+    except OSError:
+        # Заготовленный процесс успел завершиться (например, его убил OOM)
+        os.close(read_fd)
+        try:
+            os.kill(pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+        os.waitpid(pid, 0)
+        return False
+
+
+def _run_forked(child, request, limits, proto_in, proto_out):
+    if not _send_request(child, request):
+        child = _spawn_child(limits, proto_in, proto_out)
+        if not _send_request(child, request):
+            return {"crash": True}
+    pid, _, read_fd = child
+    relay = _Relay(proto_out, request.get("output_limit"))
+    timeout = request.get("timeout")
+    deadline = time.monotonic() + timeout if timeout else None
+    status = None
+    timed_out = False
+    try:
+        while True:
+            wait = CHILD_POLL_INTERVAL
+            if deadline is not None:
+                wait = min(wait, deadline - time.monotonic())
+                if wait <= 0:
+                    timed_out = True
+                    break
+            if select.select([read_fd], [], [], wait)[0]:
+                data = os.read(read_fd, OUTPUT_CHUNK)
+                if not data or not relay.feed(data) or relay.result is not None:
+                    break
+            else:
+                # Процесс мог завершиться, оставив канал открытым у потомков
+                finished, status, rusage = os.wait4(pid, os.WNOHANG)
+                if finished:
+                    _drain(read_fd, relay)
+                    break
+                status = None
+    finally:
+        os.close(read_fd)
+    if relay.result is None or "output_limit" in relay.result or timed_out:
+        try:
+            os.kill(pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+    if status is None:
+        _, status, rusage = os.wait4(pid, 0)
+    _kill_strays(pid)
+    if timed_out:
+        result = {"timeout": True}
+    elif relay.result is not None:
+        result = relay.result
+    elif os.WIFSIGNALED(status) and os.WTERMSIG(status) == getattr(signal, "SIGXCPU", None):
+        result = {"cpu_limit": True}
+    else:
+        result = {"crash": True}
+    return {**result, "usage": _usage(rusage)}
+
+
+def _warm_up():
+    # Первая компиляция в процессе на порядок дольше следующих: пусть её
+    # один раз оплатит воркер, а не каждый дочерний процесс
+    code = compile("def test_warm_up():\n    assert [x for x in range(3)] == [0, 1, 2]\n", CHECKER_FILENAME, "exec")
+    namespace = {}
+    exec(marshal.loads(marshal.dumps(code)), namespace)
+    namespace["test_warm_up"]()
+
+
+def main():
+    limits = json.loads(sys.argv[1]) if len(sys.argv) > 1 else {}
+    proto_in, proto_out = _detach_std_streams()
+    if not FORK_PER_RUN:
+        _apply_limits(limits)
+    if FORK_PER_RUN:
+        _prctl(PR_SET_CHILD_SUBREAPER, 1)
+        _warm_up()
+    child = _spawn_child(limits, proto_in, proto_out) if FORK_PER_RUN else None
+    while True:
+        if FORK_PER_RUN and child is None:
+            # Следующий процесс готовим, когда родитель уже забрал ответ: на
+            # одном ядре fork сразу после ответа задержал бы его получение
+            select.select([proto_in], [], [], SPARE_DELAY)
+            child = _spawn_child(limits, proto_in, proto_out)
+        request = _read_frame(proto_in)
+        if request is None:
+            return
+        if FORK_PER_RUN:
+            _write_frame(proto_out, _run_forked(child, request, limits, proto_in, proto_out))
+            child = None
+        else:
+            cpu_started = _cpu_seconds()
+            result = _execute(request, proto_out, request.get("output_limit"))
+            result["usage"] = {"cpu_ms": round((_cpu_seconds() - cpu_started) * 1000), "peak_rss_kb": None}
+            _write_frame(proto_out, result)
+
+
+if __name__ == "__main__":
+    main()
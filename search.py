@@ -0,0 +1,166 @@
+import html
+import re
+
+from sqlalchemy import select, text
+
+from content_cache import get_content_version
+from db import CONTENT_SCHEMA, content_attached, engine
+from models import Course, CourseModule, Lesson
+
+# unicode61 приводит регистр и кириллицы; «ё» дополнительно сводим к «е»
+# и в индексе, и в запросах. prefix='2 3' ускоряет запросы вида «функци*».
+CREATE_INDEX_SQL = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING fts5("
+    "kind UNINDEXED, ref_id UNINDEXED, course_id UNINDEXED, title, body, "
+    "tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3')"
+)
+
+# Маркеры подсветки: экранируем текст целиком и только потом ставим <mark>
+_MARK_OPEN = "\x02"
+_MARK_CLOSE = "\x03"
+_TAG_RE = re.compile(r"<[^>]+>")
+_SPACE_RE = re.compile(r"\s+")
+_WORD_RE = re.compile(r"\w+")
+
+courses = Course.__table__
+modules = CourseModule.__table__
+lessons = Lesson.__table__
+
+_indexed_version = None
+
+
+def fts5_available(conn) -> bool:
+    options = {row[0] for row in conn.exec_driver_sql("PRAGMA compile_options")}
+    return "ENABLE_FTS5" in options
+
+
+def normalize_text(value: str) -> str:
+    return value.replace("ё", "е").replace("Ё", "Е")
+
+
+def strip_html(value: str | None) -> str:
+    if not value:
+        return ""
+    return normalize_text(_SPACE_RE.sub(" ", html.unescape(_TAG_RE.sub(" ", value))).strip())
+
+
+def build_match_query(query: str) -> str | None:
+    # Каждое слово — префиксный поиск, слова объединяются через AND.
+    # Кавычки убирают спецсинтаксис FTS5 из пользовательского ввода.
+    words = _WORD_RE.findall(normalize_text(query or ""))
+    if not words:
+        return None
+    return " ".join(f'"{word}"*' for word in words)
+
+
+def _index_rows(conn):
+    for row in conn.execute(
+        select(courses.c.id, courses.c.title, courses.c.description, courses.c.long_description)
+    ):
+        body = " ".join(part for part in (row.description, row.long_description) if part)
+        yield {"kind": "course", "ref_id": row.id, "course_id": row.id, "title": row.title, "body": body}
+    for row in conn.execute(select(modules.c.id, modules.c.course_id, modules.c.title)):
+        yield {"kind": "module", "ref_id": row.id, "course_id": row.course_id, "title": row.title, "body": ""}
+    lesson_rows = conn.execute(
+        select(lessons.c.id, modules.c.course_id, lessons.c.title, lessons.c.content).join(
+            modules, modules.c.id == lessons.c.module_id
+        )
+    )
+    for row in lesson_rows:
+        yield {
+            "kind": "lesson",
+            "ref_id": row.id,
+            "course_id": row.course_id,
+            "title": row.title,
+            "body": strip_html(row.content),
+        }
+
+
+def rebuild_index(conn):
+    # Индекс собирается в БД контента при публикации (content_pack.build_content)
+    conn.exec_driver_sql(CREATE_INDEX_SQL)
+    conn.exec_driver_sql("DELETE FROM search_index")
+    batch = []
+    insert_sql = text(
+        "INSERT INTO search_index (kind, ref_id, course_id, title, body) "
+        "VALUES (:kind, :ref_id, :course_id, :title, :body)"
+    )
+    for row in _index_rows(conn):
+        row["title"] = normalize_text(row["title"])
+        row["body"] = normalize_text(row["body"])
+        batch.append(row)
+        if len(batch) >= 1000:
+            conn.execute(insert_sql, batch)
+            batch = []
+    if batch:
+        conn.execute(insert_sql, batch)
+    conn.exec_driver_sql("INSERT INTO search_index(search_index) VALUES ('optimize')")
+
+
+def sync_index(bind=engine) -> bool:
+    # Индекс входит в БД контента и меняется только вместе с ней; здесь
+    # запоминается, есть ли он в подключённой версии
+    global _indexed_version
+    with bind.connect() as conn:
+        if not content_attached(conn):
+            return False
+        version = get_content_version(conn)
+        has_index = conn.exec_driver_sql(
+            f"SELECT 1 FROM {CONTENT_SCHEMA}.sqlite_master WHERE type = 'table' AND name = 'search_index'"
+        ).first()
+    _indexed_version = version if has_index is not None else None
+    return has_index is not None
+
+
+def ensure_index(content_version: int) -> bool:
+    # Быстрая проверка по версии из кэша контента, без обращения к БД
+    if _indexed_version == content_version:
+        return True
+    return sync_index()
+
+
+def _render_highlight(value: str) -> str:
+    return html.escape(value).replace(_MARK_OPEN, "<mark>").replace(_MARK_CLOSE, "</mark>")
+
+
+# Сначала ранжируются только rowid, highlight/snippet считаются для
+# первых limit строк: иначе они вычисляются для каждого совпадения до сортировки.
+_search_sql = text(
+    f"""
+    WITH top AS (
+        SELECT rowid AS hit_id, bm25(search_index, 0.0, 0.0, 0.0, 5.0, 1.0) AS score
+        FROM search_index
+        WHERE search_index MATCH :query
+        ORDER BY score
+        LIMIT :limit
+    )
+    SELECT s.kind, s.ref_id, s.course_id, c.title AS course_title,
+           highlight(search_index, 3, '{_MARK_OPEN}', '{_MARK_CLOSE}') AS title,
+           snippet(search_index, 4, '{_MARK_OPEN}', '{_MARK_CLOSE}', '…', 12) AS snippet,
+           top.score AS rank
+    FROM top
+    JOIN search_index AS s ON s.rowid = top.hit_id
+    JOIN courses AS c ON c.id = s.course_id
+    WHERE search_index MATCH :query
+    ORDER BY top.score
+    """
+)
+
+
+def search(conn, query: str, limit: int = 20):
+    match = build_match_query(query)
+    if match is None:
+        return []
+    rows = conn.execute(_search_sql, {"query": match, "limit": max(1, min(int(limit), 100))})
+    return [
+        {
+            "kind": row.kind,
+            "id": row.ref_id,
+            "course_id": row.course_id,
+            "course_title": row.course_title,
+            "title_html": _render_highlight(row.title),
+            "snippet_html": _render_highlight(row.snippet),
+            "rank": round(row.rank, 4),
+        }
+        for row in rows
+    ]
@@ -0,0 +1,395 @@
+# Серверный режим: API приложения по HTTP для многих браузеров сразу.
+#
+#   python server.py                           # 127.0.0.1:8000, процессов по числу ядер
+#   python server.py --port 8080 --workers 4 --threads 8
+#   BRAVELEARN_RUNNER_USER=nobody python server.py --host 0.0.0.0
+#
+# Страницы те же, что и в окне, но вместо /eel.js отдаётся static/eel_http.js:
+# вызовы eel.api_*(...)() из static/app.js уходят POST-запросами на
+# /api/<имя>. Ученик определяется по cookie сессии (sessions.py), которую
+# сервер ставит при api_login; каждый запрос выполняется со своим
+# app.RequestUser и своими соединениями и сессиями БД. По HTTP доступны
+# только эндпоинты из HTTP_API, api_run_python — только после входа.
+#
+# Безопасность. Код учеников выполняется в интерпретаторах того же
+# пользователя ОС, что и сервер, если не задан BRAVELEARN_RUNNER_USER
+# (config.RUNNER_USER): тогда код может прочитать app.db, включая пароли и
+# проверки заданий. Поэтому без него сервер слушает только loopback и
+# отказывается запускаться на другом адресе. С ним сервер запускается от
+# root, интерпретаторы — от этого пользователя; интерпретатор Python и
+# каталог приложения должны быть ему доступны на чтение, а файлы БД сервер
+# создаёт и оставляет доступными только себе (umask 077, chmod 600).
+#
+# Главный процесс готовит БД (миграции, пакет контента, поисковый индекс) и
+# запускает --workers процессов. Они слушают один порт через SO_REUSEPORT
+# (ядро Linux распределяет соединения между ними) и работают с одной БД:
+# в режиме WAL читатели не ждут друг друга и писателя. В процессе соединения
+# обслуживают гринлеты gevent, а эндпоинты выполняются в пуле из --threads
+# потоков: sqlite3 отпускает GIL на время запроса. Пул интерпретаторов
+# проверки делится между процессами поровну.
+#
+# api_run_python отвечает готовым результатом: задание проверки живёт в
+# очереди своего процесса, а следующий запрос api_get_job мог бы попасть
+# в другой.
+#
+# С BRAVELEARN_METRICS GET /metrics отдаёт метрики (metrics.py) в формате
+# Prometheus, только на запросы с loopback. Они свои у каждого процесса, поэтому у строк есть метка
+# worker (pid), а снимок при выходе пишется в файл с pid в имени.
+import argparse
+import ipaddress
+import json
+import mimetypes
+import os
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+import traceback
+from http.cookies import SimpleCookie
+from pathlib import Path
+
+import metrics
+from config import (
+    RUNNER_CONCURRENCY,
+    RUNNER_POOL_SIZE,
+    RUNNER_USER,
+    SERVER_MAX_CONNECTIONS,
+    SERVER_THREADS,
+    SERVER_WORKERS,
+)
+
+SESSION_COOKIE = "bravelearn_session"
+# Что из каталога приложения отдаётся браузеру, кроме страниц *.html
+STATIC_PREFIXES = ("static/", "styles/")
+JOB_POLL_INTERVAL = 0.005
+RESTART_DELAY = 1.0
+# Эндпоинты app.API, доступные по HTTP. Не входят: api_import_progress
+# (прогресс других учеников), api_get_metrics и api_get_result_cache_stats
+# (состояние сервера; метрики — GET /metrics с loopback), api_get_job
+# (результат приходит в ответе api_run_python, а задания — чужие).
+HTTP_API = frozenset(
+    {
+        "api_login",
+        "api_get_current_user",
+        "api_get_courses",
+        "api_query_catalog",
+        "api_search",
+        "api_toggle_favorite",
+        "api_get_course",
+        "api_get_course_structure",
+        "api_get_lesson",
+        "api_get_course_page",
+        "api_batch",
+        "api_mark_lesson_completed",
+        "api_mark_lessons_completed",
+        "api_get_task",
+        "api_run_python",
+    }
+)
+# Только для вошедшего ученика
+HTTP_LOGIN_REQUIRED = frozenset({"api_run_python"})
+# Что можно вызвать внутри api_batch: запуск кода ждёт задание, пакет — нет
+HTTP_BATCH_API = HTTP_API - {"api_batch"} - HTTP_LOGIN_REQUIRED
+
+
+def _is_loopback(host):
+    if host == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+def _restrict_db_files():
+    # Файлы БД (с -wal и -shm) доступны только пользователю сервера
+    from db import CONTENT_DB_PATH, DB_PATH
+
+    for path in (DB_PATH, CONTENT_DB_PATH):
+        for file in (path, path.with_name(path.name + "-wal"), path.with_name(path.name + "-shm")):
+            if file.exists():
+                os.chmod(file, 0o600)
+
+
+def _listener(host, port, reuse_port):
+    from gevent import socket as gsocket
+
+    sock = gsocket.socket(gsocket.AF_INET, gsocket.SOCK_STREAM)
+    sock.setsockopt(gsocket.SOL_SOCKET, gsocket.SO_REUSEADDR, 1)
+    if reuse_port:
+        sock.setsockopt(gsocket.SOL_SOCKET, gsocket.SO_REUSEPORT, 1)
+    sock.bind((host, port))
+    sock.listen(1024)
+    return sock
+
+
+def _call(name, args, token):
+    # Выполняется в потоке пула: сессия по токену, вызов от имени её ученика
+    # и новая сессия, если вызов сменил ученика (api_login)
+    import app
+    from db import engine
+    from sessions import create_session, delete_session, resolve_session
+
+    with engine.begin() as conn:
+        user_id = resolve_session(conn, token)
+    if user_id is None and name in HTTP_LOGIN_REQUIRED:
+        return {"ok": False, "error": "Необходима авторизация"}, None, None
+    endpoint = app.API[name]
+    user = app.RequestUser(user_id)
+    result = app.call_as(user, endpoint, *args)
+    new_token = None
+    if user.user_id != user_id:
+        with engine.begin() as conn:
+            delete_session(conn, token)
+            if user.user_id is not None:
+                new_token = create_session(conn, user.user_id)
+    return result, user.user_id, new_token
+
+
+def _wait_job(job_id):
+    import gevent
+
+    import app
+    from jobs import STATUS_DONE, STATUS_FAILED
+
+    queue = app.get_job_queue()
+    while True:
+        job = queue.get(job_id)
+        if job is None:
+            return {"ok": False, "error": "Задание на проверку не найдено"}
+        if job["status"] in (STATUS_DONE, STATUS_FAILED):
+            return {"ok": True, **job}
+        gevent.sleep(JOB_POLL_INTERVAL)
+
+
+def _response(start_response, status, body, content_type, headers=()):
+    start_response(status, [("Content-Type", content_type), ("Content-Length", str(len(body))), *headers])
+    return [body]
+
+
+def _static(start_response, root, path):
+    # Только страницы и статика: файлы БД и исходники не отдаются
+    allowed = path.startswith(STATIC_PREFIXES) or ("/" not in path and path.endswith(".html"))
+    file = (root / path).resolve()
+    if not allowed or root not in file.parents or not file.is_file():
+        return _response(start_response, "404 Not Found", b"", "text/plain")
+    content_type = mimetypes.guess_type(file.name)[0] or "application/octet-stream"
+    if content_type.startswith("text/") or content_type == "application/javascript":
+        content_type += "; charset=utf-8"
+    return _response(start_response, "200 OK", file.read_bytes(), content_type, [("Cache-Control", "no-cache")])
+
+
+def make_app(pool):
+    # Обычное WSGI-приложение без bottle: request/response bottle хранятся в
+    # threading.local, а гринлеты процесса работают в одном потоке и
+    # перезаписывали бы их друг у друга
+    import app
+    from sessions import SESSION_TTL
+
+    root = Path(app.WEB_DIR).resolve()
+    max_age = int(SESSION_TTL.total_seconds())
+
+    def reply(start_response, data, status="200 OK", headers=()):
+        # Как eel: то, что не сериализуется в JSON, уходит как null
+        body = json.dumps(data, ensure_ascii=False, default=lambda o: None).encode("utf-8")
+        return _response(start_response, status, body, "application/json; charset=utf-8", headers)
+
+    def unknown(start_response, name):
+        return reply(start_response, {"ok": False, "error": f"Неизвестный вызов: {name}"}, "404 Not Found")
+
+    def call_api(environ, start_response, name):
+        if name not in HTTP_API or name not in app.API:
+            return unknown(start_response, name)
+        try:
+            body = environ["wsgi.input"].read(int(environ.get("CONTENT_LENGTH") or 0))
+            args = json.loads(body or b"[]")
+        except ValueError:
+            args = None
+        if not isinstance(args, list):
+            return reply(start_response, {"ok": False, "error": "Некорректный запрос"}, "400 Bad Request")
+        if name == "api_batch":
+            calls = args[0] if args else None
+            if calls is not None and not (isinstance(calls, list) and all(isinstance(c, dict) for c in calls)):
+                return reply(start_response, {"ok": False, "error": "Некорректный запрос"}, "400 Bad Request")
+            for call in calls or []:
+                if call.get("name") not in HTTP_BATCH_API:
+                    return unknown(start_response, call.get("name"))
+
+        cookie = SimpleCookie(environ.get("HTTP_COOKIE", ""))
+        token = cookie[SESSION_COOKIE].value if SESSION_COOKIE in cookie else None
+        try:
+            result, user_id, new_token = pool.apply(_call, (name, args, token))
+        except Exception:
+            traceback.print_exc()
+            return reply(
+                start_response, {"ok": False, "error": "Внутренняя ошибка сервера"}, "500 Internal Server Error"
+            )
+        headers = []
+        if new_token is not None:
+            headers.append(
+                ("Set-Cookie", f"{SESSION_COOKIE}={new_token}; Path=/; Max-Age={max_age}; HttpOnly; SameSite=Lax")
+            )
+        elif token and user_id is None:
+            headers.append(("Set-Cookie", f"{SESSION_COOKIE}=; Path=/; Max-Age=0"))
+        if name == "api_run_python" and isinstance(result, dict) and result.get("job_id"):
+            # Ждём в гринлете, поток пула уже свободен
+            result = _wait_job(result["job_id"])
+        return reply(start_response, result, headers=headers)
+
+    def application(environ, start_response):
+        method = environ["REQUEST_METHOD"]
+        path = environ.get("PATH_INFO", "/").lstrip("/")
+        if path.startswith("api/"):
+            if method != "POST":
+                return _response(start_response, "405 Method Not Allowed", b"", "text/plain", [("Allow", "POST")])
+            return call_api(environ, start_response, path[len("api/") :])
+        if method not in ("GET", "HEAD"):
+            return _response(start_response, "405 Method Not Allowed", b"", "text/plain", [("Allow", "GET")])
+        if path == "":
+            return _response(start_response, "302 Found", b"", "text/plain", [("Location", "/index.html")])
+        if path == "metrics" and metrics.ENABLED and _is_loopback(environ.get("REMOTE_ADDR", "")):
+            body = metrics.prometheus_text(worker=os.getpid()).encode("utf-8")
+            return _response(start_response, "200 OK", body, "text/plain; version=0.0.4; charset=utf-8")
+        if path == "eel.js":
+            path = "static/eel_http.js"
+        return _static(start_response, root, path)
+
+    return application
+
+
+def serve(host, port, threads, reuse_port):
+    import gevent
+    from gevent.pool import Pool
+    from gevent.pywsgi import WSGIServer
+    from gevent.threadpool import ThreadPool
+
+    import app
+    from attempt_storage import get_attempt_writer
+    from runner import get_runner_pool
+
+    app.init_backend()
+    get_runner_pool().start()
+    get_attempt_writer().start()
+
+    pool = ThreadPool(threads)
+    server = WSGIServer(
+        _listener(host, port, reuse_port), make_app(pool), spawn=Pool(SERVER_MAX_CONNECTIONS), log=None
+    )
+    if sys.platform != "win32":
+        gevent.signal_handler(signal.SIGTERM, server.stop)
+        gevent.signal_handler(signal.SIGINT, server.stop)
+    try:
+        server.serve_forever()
+    finally:
+        app.get_job_queue().shutdown(wait=True)
+        get_attempt_writer().close()
+        metrics.dump(f".{os.getpid()}")
+
+
+def prepare():
+    # Подготовка БД один раз до запуска процессов, чтобы они не выполняли
+    # миграции и импорт контента наперегонки
+    import app
+    from attempt_storage import compact_if_due
+    from db import engine
+    from result_cache import get_result_cache
+    from sessions import prune_sessions
+
+    app.init_backend()
+    _restrict_db_files()
+    with engine.begin() as conn:
+        prune_sessions(conn)
+    get_result_cache().prune()
+    # Уплотнение попыток в фоне, как при запуске окна
+    threading.Thread(target=compact_if_due, args=(engine,), name="attempt-compaction", daemon=True).start()
+
+
+def worker_env(workers, threads):
+    # Пул интерпретаторов и допуск запусков по ядрам делятся между
+    # процессами (по свободной памяти процессы сверяются сами: она общая);
+    # пул соединений БД — под потоки эндпоинтов и проверок процесса. Явные
+    # настройки не трогаем.
+    env = dict(os.environ)
+    runners = max(1, RUNNER_POOL_SIZE // workers)
+    env.setdefault("BRAVELEARN_RUNNER_POOL_SIZE", str(runners))
+    env.setdefault("BRAVELEARN_RUNNER_CONCURRENCY", str(max(1, RUNNER_CONCURRENCY // workers)))
+    env.setdefault("BRAVELEARN_DB_POOL_SIZE", str(threads + runners + 2))
+    return env
+
+
+def supervise(command, env, count):
+    # Упавший процесс перезапускается; SIGTERM/SIGINT завершают все
+    stopping = threading.Event()
+
+    def stop(signum, frame):
+        stopping.set()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    procs = [subprocess.Popen(command, env=env) for _ in range(count)]
+    while not stopping.wait(RESTART_DELAY):
+        for i, proc in enumerate(procs):
+            if proc.poll() is not None:
+                print(f"Процесс {proc.pid} завершился с кодом {proc.returncode}, перезапуск", file=sys.stderr)
+                procs[i] = subprocess.Popen(command, env=env)
+    for proc in procs:
+        if proc.poll() is None:
+            proc.terminate()
+    for proc in procs:
+        proc.wait()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Серверный режим: API по HTTP для многих учеников")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=SERVER_WORKERS, help="процессов-обработчиков")
+    parser.add_argument("--threads", type=int, default=SERVER_THREADS, help="потоков эндпоинтов в процессе")
+    parser.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    reuse_port = hasattr(socket, "SO_REUSEPORT")
+    if args.worker:
+        serve(args.host, args.port, args.threads, reuse_port)
+        return
+
+    if not _is_loopback(args.host) and not RUNNER_USER:
+        parser.error(
+            "код учеников выполняется от пользователя сервера и может читать БД: "
+            "задайте BRAVELEARN_RUNNER_USER или слушайте loopback (--host 127.0.0.1)"
+        )
+    # Новые файлы БД (app.db, -wal, -shm, пакеты контента) — только для
+    # пользователя сервера; процессы-обработчики наследуют umask
+    os.umask(0o077)
+
+    workers = max(1, args.workers)
+    if workers > 1 and not reuse_port:
+        print("SO_REUSEPORT недоступен: запускается один процесс", file=sys.stderr)
+        workers = 1
+    started = time.perf_counter()
+    prepare()
+    print(f"БД готова за {time.perf_counter() - started:.2f} с", file=sys.stderr)
+    command = [
+        sys.executable,
+        os.path.abspath(__file__),
+        "--worker",
+        "--host",
+        args.host,
+        "--port",
+        str(args.port),
+        "--threads",
+        str(args.threads),
+    ]
+    print(f"http://{args.host}:{args.port}/ — процессов {workers}, потоков в каждом {args.threads}", file=sys.stderr)
+    try:
+        supervise(command, worker_env(workers, args.threads), workers)
+    finally:
+        from db import checkpoint
+
+        checkpoint()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,66 @@
+# Сессии учеников серверного режима (server.py).
+#
+# Браузер хранит случайный токен в cookie, БД — только его sha256 и срок
+# действия. Таблица общая для всех процессов сервера, поэтому запрос может
+# попасть в любой из них. Срок продлевается не на каждом запросе, а когда
+# прошла половина TTL: иначе каждый запрос был бы записью в БД.
+import hashlib
+import secrets
+from datetime import datetime, timedelta
+
+from sqlalchemy import bindparam, delete, insert, select, update
+
+from config import SESSION_TTL_HOURS
+from models import UserSession
+
+user_sessions = UserSession.__table__
+
+SESSION_TTL = timedelta(hours=SESSION_TTL_HOURS)
+
+_lookup = select(user_sessions.c.user_id, user_sessions.c.expires_at).where(
+    user_sessions.c.token_hash == bindparam("token_hash")
+)
+
+
+def _token_hash(token: str) -> str:
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+def create_session(conn, user_id: int) -> str:
+    token = secrets.token_urlsafe(32)
+    now = datetime.utcnow()
+    conn.execute(
+        insert(user_sessions).values(
+            token_hash=_token_hash(token), user_id=user_id, created_at=now, expires_at=now + SESSION_TTL
+        )
+    )
+    return token
+
+
+def resolve_session(conn, token: str | None):
+    # id пользователя сессии или None для неизвестного и истёкшего токена
+    if not token:
+        return None
+    token_hash = _token_hash(token)
+    row = conn.execute(_lookup, {"token_hash": token_hash}).first()
+    if row is None:
+        return None
+    now = datetime.utcnow()
+    if row.expires_at <= now:
+        return None
+    if row.expires_at - now < SESSION_TTL / 2:
+        conn.execute(
+            update(user_sessions)
+            .where(user_sessions.c.token_hash == token_hash)
+            .values(expires_at=now + SESSION_TTL)
+        )
+    return row.user_id
+
+
+def delete_session(conn, token: str | None):
+    if token:
+        conn.execute(delete(user_sessions).where(user_sessions.c.token_hash == _token_hash(token)))
+
+
+def prune_sessions(conn) -> int:
+    return conn.execute(delete(user_sessions).where(user_sessions.c.expires_at <= datetime.utcnow())).rowcount
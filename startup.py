@@ -0,0 +1,91 @@
+# Замеры фаз запуска приложения.
+#
+#   BRAVELEARN_STARTUP_REPORT=1 python app.py             # отчёт в stderr
+#   BRAVELEARN_STARTUP_REPORT=startup.log python app.py   # отчёт в файл
+#
+# Формат как у python -X importtime: длительность фазы и время от запуска
+# процесса до её конца, в миллисекундах. Фазы идут в двух потоках: главный
+# открывает окно, backend-startup импортирует SQLAlchemy и готовит БД.
+# Отчёт печатается один раз, когда окно отрисовано и БД готова.
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+from config import STARTUP_REPORT
+
+_started = time.perf_counter()
+_phases = []
+_lock = threading.Lock()
+_reported = False
+
+
+def _process_age() -> float:
+    # Сколько процесс прожил до импорта этого модуля: запуск интерпретатора
+    # и распаковка сборки PyInstaller. Только Linux, точность 10 мс.
+    try:
+        with open("/proc/self/stat") as f:
+            started_ticks = int(f.read().rsplit(")", 1)[1].split()[19])
+        with open("/proc/uptime") as f:
+            uptime = float(f.read().split()[0])
+    except (OSError, ValueError, IndexError):
+        return 0.0
+    return max(uptime - started_ticks / os.sysconf("SC_CLK_TCK"), 0.0)
+
+
+_offset = _process_age()
+
+
+def _now() -> float:
+    return _offset + time.perf_counter() - _started
+
+
+@contextmanager
+def phase(name: str):
+    begin = _now()
+    try:
+        yield
+    finally:
+        end = _now()
+        with _lock:
+            _phases.append((threading.current_thread().name, name, end - begin, end))
+
+
+def mark(name: str):
+    # Событие без длительности: «окно отрисовано», «БД готова»
+    end = _now()
+    with _lock:
+        _phases.append((threading.current_thread().name, name, 0.0, end))
+
+
+def format_report() -> str:
+    with _lock:
+        phases = sorted(_phases, key=lambda row: row[3])
+    lines = [f"startup: {'поток':<16} | {'фаза, мс':>9} | {'с запуска, мс':>13} | фаза"]
+    if _offset:
+        lines.append(f"startup: {'process':<16} | {_offset * 1000:>9.1f} | {_offset * 1000:>13.1f} | интерпретатор")
+    for thread, name, duration, end in phases:
+        lines.append(f"startup: {thread:<16} | {duration * 1000:>9.1f} | {end * 1000:>13.1f} | {name}")
+    return "\n".join(lines)
+
+
+def report(force: bool = False):
+    # force — печать при выходе, даже если окно так и не отрисовалось
+    global _reported
+    if not STARTUP_REPORT:
+        return
+    with _lock:
+        if _reported:
+            return
+        names = {name for _, name, _, _ in _phases}
+        if not force and not {"first paint", "backend ready"} <= names:
+            return
+        _reported = True
+    text = format_report()
+    if STARTUP_REPORT == "1":
+        if sys.stderr is not None:
+            print(text, file=sys.stderr)
+    else:
+        with open(STARTUP_REPORT, "a", encoding="utf-8") as f:
+            f.write(text + "\n")
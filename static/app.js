@@ -23,12 +23,101 @@ async function apiGetLesson(lessonId) {
   return await eel.api_get_lesson(lessonId)();
 }
 
+async function apiGetCoursePage(courseId, lessonId = null) {
+  return await eel.api_get_course_page(courseId, lessonId)();
+}
+
+// Несколько вызовов api_* за один обмен: [['api_get_course', [1]], ...]
+async function apiBatch(calls) {
+  const res = await eel.api_batch(calls.map(([name, args]) => ({ name, args: args || [] })))();
+  return res && res.ok ? res.results.map((r) => (r.ok ? r.result : null)) : null;
+}
+
 async function apiMarkLessonCompleted(lessonId) {
   return await eel.api_mark_lesson_completed(lessonId)();
 }
 
-async function apiRunPython(code, taskId = null) {
-  return await eel.api_run_python(code, taskId)();
+// onOutput({stream, data}) получает вывод по частям, пока код выполняется
+async function apiRunPython(code, taskId = null, onOutput = null) {
+  const job = await eel.api_run_python(code, taskId)();
+  if (!job || !job.ok) return job;
+  // server.py отвечает сразу готовым результатом
+  if (job.status === 'done' || job.status === 'failed') return job.result;
+  if (onOutput) followJobOutput(job.job_id, onOutput);
+  return await waitForJob(job.job_id);
+}
+
+async function apiGetJob(jobId) {
+  return await eel.api_get_job(jobId)();
+}
+
+// Проверка решения выполняется в очереди на стороне Python: результат
+// приходит через onJobFinished, а опрос api_get_job страхует от потери push.
+const pendingJobs = new Map();
+const JOB_POLL_INTERVAL = 1000;
+
+// Вывод запуска приходит через onJobOutput раньше onJobFinished. Push может
+// опередить ответ api_run_python с job_id, поэтому части до подписки копятся.
+const jobOutputs = new Map();
+
+function jobOutput(jobId) {
+  if (!jobOutputs.has(jobId)) jobOutputs.set(jobId, { chunks: [], listener: null });
+  return jobOutputs.get(jobId);
+}
+
+function onJobOutput(chunk) {
+  const entry = jobOutput(chunk.job_id);
+  if (entry.listener) entry.listener(chunk);
+  else entry.chunks.push(chunk);
+}
+
+eel.expose(onJobOutput, 'on_job_output');
+
+function followJobOutput(jobId, listener) {
+  const entry = jobOutput(jobId);
+  entry.chunks.forEach(listener);
+  entry.chunks = [];
+  entry.listener = listener;
+}
+
+function onJobFinished(job) {
+  jobOutputs.delete(job.job_id);
+  const resolve = pendingJobs.get(job.job_id);
+  if (!resolve) return;
+  pendingJobs.delete(job.job_id);
+  resolve(job.result);
+}
+
+eel.expose(onJobFinished, 'on_job_finished');
+
+function waitForJob(jobId) {
+  return new Promise((resolve) => {
+    pendingJobs.set(jobId, resolve);
+    const poll = async () => {
+      if (!pendingJobs.has(jobId)) return;
+      const job = await apiGetJob(jobId);
+      if (job && job.ok && (job.status === 'done' || job.status === 'failed')) {
+        onJobFinished(job);
+        return;
+      }
+      if (!job || !job.ok) {
+        pendingJobs.delete(jobId);
+        jobOutputs.delete(jobId);
+        resolve(job);
+        return;
+      }
+      setTimeout(poll, JOB_POLL_INTERVAL);
+    };
+    setTimeout(poll, JOB_POLL_INTERVAL);
+  });
+}
+
+async function apiQueryCatalog(params) {
+  return await eel.api_query_catalog(params)();
+}
+
+async function apiSearch(query, limit = 20) {
+  return await eel.api_search(query, limit)();
 }
 
 async function apiToggleFavorite(courseId) {
@@ -86,43 +175,137 @@ function renderCatalogCourses(courses) {
               </div>
           </div>
     `;
+    renderFavoriteState(article.querySelector('.course-card__fav'), c.is_favorite);
     grid.appendChild(article);
   });
 
   attachFavoriteHandlers();
-  initFavoritesForCards();
   attachDetailsHandlers();
 }
 
-function applyCatalogFilters() {
-  if (!catalogCourses.length) return;
-  let filtered = [...catalogCourses];
+// Каталог фильтруется и листается на стороне Python (api_query_catalog):
+// в браузер попадает только текущая страница и счётчики по фильтрам.
+let catalogCursor = null;
 
+function getCatalogFilters() {
+  const filters = {};
   const activeChip = document.querySelector('.catalog__chips .chip.chip--active');
-  if (activeChip) {
-    const chipText = activeChip.textContent.trim();
-    if (chipText !== 'Все направления') {
-      filtered = filtered.filter((c) => c.category === chipText);
-    }
+  if (activeChip && activeChip.dataset.category) {
+    filters.category = activeChip.dataset.category;
   }
-
   const levelSelect = document.querySelector('.catalog__selects select:nth-of-type(1)');
   if (levelSelect) {
     const value = levelSelect.value.trim();
     if (!value.startsWith('Уровень: любой')) {
-      const level = value.replace('Уровень:', '').trim();
-      filtered = filtered.filter((c) => c.level === level);
+      filters.level = value.replace('Уровень:', '').trim();
     }
   }
+  return filters;
+}
 
-  renderCatalogCourses(filtered);
+function renderCatalogFacets(facets) {
+  document.querySelectorAll('.catalog__chips .chip').forEach((chip) => {
+    if (!chip.dataset.label) chip.dataset.label = chip.textContent.trim();
+    const category = chip.dataset.category;
+    if (!category) return;
+    const count = (facets.category || {})[category] || 0;
+    chip.textContent = `${chip.dataset.label} (${count})`;
+  });
+}
+
+function renderCatalogMoreButton(hasMore) {
+  const list = document.querySelector('.catalog__list');
+  if (!list) return;
+  let moreBtn = list.querySelector('.catalog__more');
+  if (!moreBtn) {
+    moreBtn = document.createElement('button');
+    moreBtn.type = 'button';
+    moreBtn.className = 'btn btn--secondary catalog__more';
+    moreBtn.textContent = 'Показать ещё';
+    moreBtn.addEventListener('click', () => loadCatalogPage(false));
+    list.appendChild(moreBtn);
+  }
+  moreBtn.style.display = hasMore ? 'block' : 'none';
+}
+
+async function loadCatalogPage(reset) {
+  if (reset) {
+    catalogCourses = [];
+    catalogCursor = null;
+  }
+  const res = await apiQueryCatalog({ ...getCatalogFilters(), cursor: catalogCursor });
+  if (!res || !res.ok) return;
+  catalogCourses = catalogCourses.concat(res.courses);
+  catalogCursor = res.next_cursor;
+  renderCatalogCourses(catalogCourses);
+  renderCatalogFacets(res.facets);
+  renderCatalogMoreButton(Boolean(res.next_cursor));
+}
+
+function applyCatalogFilters() {
+  loadCatalogPage(true);
+}
+
+const SEARCH_KIND_LABELS = { course: 'Курс', module: 'Модуль', lesson: 'Урок' };
+let searchTimer = null;
+let searchSeq = 0;
+
+// Подсветка приходит с сервера уже экранированной, кроме тегов <mark>
+function renderSearchResults(container, hits) {
+  container.innerHTML = '';
+  container.hidden = hits === null;
+  if (hits === null) return;
+  if (!hits.length) {
+    container.textContent = 'Ничего не найдено';
+    return;
+  }
+  hits.forEach((hit) => {
+    const item = document.createElement('a');
+    item.className = 'catalog__search-hit';
+    item.href = `course.html?id=${hit.course_id}` + (hit.kind === 'lesson' ? `&lesson=${hit.id}` : '');
+    const kind = document.createElement('span');
+    kind.className = 'catalog__search-kind';
+    kind.textContent = (SEARCH_KIND_LABELS[hit.kind] || '') + (hit.kind === 'course' ? '' : ` · ${hit.course_title}`);
+    const title = document.createElement('strong');
+    title.innerHTML = hit.title_html;
+    item.append(kind, title);
+    if (hit.snippet_html) {
+      const snippet = document.createElement('span');
+      snippet.innerHTML = hit.snippet_html;
+      item.appendChild(snippet);
+    }
+    container.appendChild(item);
+  });
+}
+
+function initCatalogSearch() {
+  const input = document.querySelector('.catalog__search');
+  const container = document.querySelector('.catalog__search-results');
+  if (!input || !container) return;
+  input.addEventListener('input', () => {
+    clearTimeout(searchTimer);
+    const query = input.value.trim();
+    if (!query) {
+      renderSearchResults(container, null);
+      return;
+    }
+    searchTimer = setTimeout(async () => {
+      const seq = ++searchSeq;
+      const res = await apiSearch(query);
+      // Ответ на устаревший запрос не должен перезаписать свежий
+      if (seq !== searchSeq || !res || !res.ok) return;
+      renderSearchResults(container, res.hits);
+    }, 200);
+  });
 }
 
 async function initCatalogPage() {
-  catalogCourses = await apiGetCourses();
+  if (!document.querySelector('.courses-grid--catalog')) return;
 
   const chips = document.querySelectorAll('.catalog__chips .chip');
   chips.forEach((chip) => {
+    const chipText = chip.textContent.trim();
+    if (chipText !== 'Все направления') chip.dataset.category = chipText;
     chip.addEventListener('click', () => {
       chips.forEach((c) => c.classList.remove('chip--active'));
       chip.classList.add('chip--active');
@@ -135,6 +318,7 @@ async function initCatalogPage() {
     levelSelect.addEventListener('change', applyCatalogFilters);
   }
 
+  initCatalogSearch();
   applyCatalogFilters();
 }
 
@@ -211,23 +395,7 @@ async function initProfilePage() {
   if (dataBlock) dataBlock.style.display = 'block';
 
   const usernameEl = document.querySelector('#profile-username');
-  const passwordInput = document.querySelector('#profile-password');
   if (usernameEl) usernameEl.textContent = user.username;
-  if (passwordInput) passwordInput.value = user.password;
-
-  const toggleBtn = document.querySelector('#toggle-password-visibility');
-  if (toggleBtn && passwordInput) {
-    passwordInput.type = 'password';
-    toggleBtn.addEventListener('click', () => {
-      if (passwordInput.type === 'password') {
-        passwordInput.type = 'text';
-        toggleBtn.textContent = 'Скрыть';
-      } else {
-        passwordInput.type = 'password';
-        toggleBtn.textContent = 'Посмотреть';
-      }
-    });
-  }
 
   const favoritesContainer = document.querySelector('#profile-favorites');
   if (favoritesContainer) {
@@ -288,8 +456,10 @@ async function initCoursePage() {
   const params = new URLSearchParams(window.location.search);
   const id = parseInt(params.get('id'), 10);
   if (!id) return;
-  const data = await apiGetCourse(id);
-  if (!data) return;
+  const lessonParam = parseInt(params.get('lesson'), 10) || null;
+  const page = await apiGetCoursePage(id, lessonParam);
+  if (!page || !page.ok) return;
+  const data = page.course;
 
   const titleEl = document.querySelector('#course-title');
   const descEl = document.querySelector('#course-description');
@@ -313,7 +483,7 @@ async function initCoursePage() {
     downloadBtn.download = '';
   }
 
-  courseStructure = await apiGetCourseStructure(id);
+  courseStructure = page.structure;
   if (!courseStructure || !courseStructure.modules) return;
 
   const lessonsContainer = document.querySelector('#course-lessons-list');
@@ -364,18 +534,9 @@ async function initCoursePage() {
     });
   }
 
-  let firstLessonId = null;
-  let firstUncompletedId = null;
-  courseStructure.modules.forEach((mod) => {
-    (mod.lessons || []).forEach((lesson) => {
-      if (!firstLessonId) firstLessonId = lesson.id;
-      if (!lesson.is_completed && !firstUncompletedId) firstUncompletedId = lesson.id;
-    });
-  });
-
-  const startLessonId = firstUncompletedId || firstLessonId;
-  if (startLessonId) {
-    await loadLesson(startLessonId);
+  // Стартовый урок (первый непройденный) сервер уже выбрал и вернул
+  if (page.lesson) {
+    renderLesson(page.lesson);
   }
 
   const prevBtn = document.querySelector('#lesson-prev');
@@ -407,7 +568,11 @@ async function initCoursePage() {
       if (!currentLessonId) return;
       const statusEl = document.querySelector('#lesson-status');
       if (statusEl) statusEl.textContent = 'Сохраняем прогресс...';
-      const res = await apiMarkLessonCompleted(currentLessonId);
+      const results = await apiBatch([
+        ['api_mark_lesson_completed', [currentLessonId]],
+        ['api_get_course_structure', [id]],
+      ]);
+      const res = results && results[0];
       if (!res || !res.ok) {
         if (statusEl) statusEl.textContent = res && res.error ? res.error : 'Не удалось сохранить прогресс';
         return;
@@ -429,7 +594,7 @@ async function initCoursePage() {
         }
       }
 
-      courseStructure = await apiGetCourseStructure(id);
+      courseStructure = results[1];
       if (courseStructure && typeof courseStructure.progress_percent === 'number') {
         if (progressFill) progressFill.style.width = `${courseStructure.progress_percent}%`;
         if (progressText) progressText.textContent = `${courseStructure.progress_percent}%`;
@@ -441,6 +606,11 @@ async function initCoursePage() {
 async function loadLesson(lessonId) {
   const data = await apiGetLesson(lessonId);
   if (!data) return;
+  renderLesson(data);
+}
+
+function renderLesson(data) {
+  const lessonId = data.id;
   currentLessonId = lessonId;
 
   const titleEl = document.querySelector('#lesson-title');
@@ -508,22 +678,50 @@ async function loadLesson(lessonId) {
       const code = taskEditor ? taskEditor.getValue() : taskCodeEl.value;
       if (!code.trim()) return;
       if (taskStatusEl) taskStatusEl.textContent = 'Запускаем код...';
-      const res = await apiRunPython(code, currentTaskId);
+      if (taskOutputEl) taskOutputEl.textContent = '';
+      const res = await apiRunPython(code, currentTaskId, (chunk) => {
+        if (taskOutputEl) taskOutputEl.textContent += chunk.data;
+      });
       if (!res || !res.ok) {
         if (taskStatusEl) taskStatusEl.textContent = res && res.error ? res.error : 'Ошибка при выполнении кода';
         return;
       }
       if (taskOutputEl) {
         const out = `${res.stdout || ''}${res.stderr ? `\n[stderr]\n${res.stderr}` : ''}`.trim();
-        taskOutputEl.textContent = out || '(нет вывода)';
+        const cases = formatTaskCases(res.cases);
+        taskOutputEl.textContent = [out || '(нет вывода)', cases].filter(Boolean).join('\n\n');
+      }
+      if (res.syntax_error && res.syntax_error.line && taskEditor) {
+        // Курсор на место ошибки: column в SyntaxError считается с 1
+        taskEditor.setCursor({ line: res.syntax_error.line - 1, ch: Math.max((res.syntax_error.column || 1) - 1, 0) });
+        taskEditor.focus();
       }
       if (taskStatusEl) {
-        taskStatusEl.textContent = res.is_passed ? 'Тесты пройдены 🎉' : 'Тесты не пройдены, попробуйте ещё раз';
+        const failed = (res.cases || []).find((c) => !c.passed);
+        if (res.syntax_error) {
+          const line = res.syntax_error.line ? ` в строке ${res.syntax_error.line}` : '';
+          taskStatusEl.textContent = `Синтаксическая ошибка${line}, код не запускался`;
+        } else if (res.is_passed) {
+          taskStatusEl.textContent = 'Тесты пройдены 🎉';
+        } else if (failed) {
+          taskStatusEl.textContent = `Не пройден тест «${failed.title || failed.name}», попробуйте ещё раз`;
+        } else {
+          taskStatusEl.textContent = 'Тесты не пройдены, попробуйте ещё раз';
+        }
       }
     };
   }
 }
 
+function formatTaskCases(cases) {
+  if (!cases || !cases.length) return '';
+  const lines = cases.map((c) => {
+    const title = c.title || c.name;
+    return c.passed ? `✔ ${title}` : `✘ ${title}${c.error ? ` — ${c.error}` : ''}`;
+  });
+  return `[тесты]\n${lines.join('\n')}`;
+}
+
 function initPage() {
   if (document.body.classList.contains('catalog-body')) {
     initCatalogPage();
@@ -542,6 +740,9 @@ function initPage() {
 }
 
 document.addEventListener('DOMContentLoaded', () => {
+  // Для отчёта о запуске (startup.py): окно отрисовано
+  requestAnimationFrame(() => eel.api_mark_first_paint());
+
   // Показать загрузочную заставку при старте и плавно скрыть её
   showPageTransition(500, () => {
     hidePageTransition(600);
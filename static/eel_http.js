@@ -0,0 +1,19 @@
+// /eel.js серверного режима (server.py): вызовы eel.api_*(...)() из app.js
+// уходят POST-запросами на /api/<имя> с аргументами JSON-массивом. Ученика
+// сервер определяет по cookie сессии, которую ставит при входе; push из
+// Python здесь нет, поэтому регистрация функций для Python ничего не делает.
+window.eel = new Proxy(
+  { expose() {} },
+  {
+    get(target, name) {
+      if (name in target) return target[name];
+      return (...args) => () =>
+        fetch(`/api/${String(name)}`, {
+          method: 'POST',
+          credentials: 'same-origin',
+          headers: { 'Content-Type': 'application/json' },
+          body: JSON.stringify(args),
+        }).then((res) => res.json());
+    },
+  },
+);
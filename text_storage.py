@@ -0,0 +1,112 @@
+# Прозрачное сжатие больших текстовых столбцов.
+#
+#   python text_storage.py            # пережать существующие строки по текущей настройке
+#   python text_storage.py --vacuum   # и затем уменьшить файл БД (VACUUM)
+#
+# Сжатое значение хранится как BLOB с префиксом MAGIC в столбце TEXT
+# (SQLite не приводит BLOB к тексту). Строки без префикса — обычный текст
+# из старых версий или короче порога; они читаются как есть.
+import argparse
+import zlib
+
+from sqlalchemy import Text
+from sqlalchemy.types import TypeDecorator
+
+from config import TEXT_COMPRESSION, TEXT_COMPRESSION_MIN_SIZE
+
+MAGIC = b"\x00zl1"
+
+
+def compress_text(value: str, min_size: int = TEXT_COMPRESSION_MIN_SIZE):
+    raw = value.encode("utf-8")
+    if len(raw) < min_size:
+        return value
+    packed = MAGIC + zlib.compress(raw, 6)
+    # Несжимаемые данные (уже сжатые, случайные) оставляем текстом
+    return packed if len(packed) < len(raw) else value
+
+
+def decompress_text(value):
+    if isinstance(value, bytes):
+        if value.startswith(MAGIC):
+            return zlib.decompress(value[len(MAGIC):]).decode("utf-8")
+        return value.decode("utf-8")
+    return value
+
+
+class CompressedText(TypeDecorator):
+    impl = Text
+    cache_ok = True
+
+    def __init__(self, *args, compress=TEXT_COMPRESSION, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.compress = compress
+
+    def process_bind_param(self, value, dialect):
+        if value is None or not self.compress:
+            return value
+        return compress_text(value)
+
+    def process_result_value(self, value, dialect):
+        return decompress_text(value)
+
+
+def _compressed_columns():
+    # Класс из модуля text_storage, как у моделей: при запуске
+    # python text_storage.py этот файл — __main__ со своим CompressedText.
+    # Таблицы контента не трогаем: их БД только для чтения и собирается
+    # content_pack.py с тем же типом столбцов.
+    from models import CONTENT_TABLES, Base
+    from text_storage import CompressedText as compressed_type
+
+    content = {table.name for table in CONTENT_TABLES}
+    for table in Base.metadata.sorted_tables:
+        if table.name in content:
+            continue
+        for column in table.columns:
+            if isinstance(column.type, compressed_type):
+                yield table, column
+
+
+def rewrite_all(bind, batch_size=500):
+    # Перезаписывает значения через тип столбца: после включения сжатия
+    # старые строки сжимаются, после выключения — разжимаются.
+    from sqlalchemy import bindparam, select, update
+
+    stats = {}
+    for table, column in _compressed_columns():
+        pk = table.primary_key.columns.values()[0]
+        stmt = update(table).where(pk == bindparam("row_id")).values({column.name: bindparam("value")})
+        last_id = 0
+        rewritten = 0
+        while True:
+            with bind.begin() as conn:
+                rows = conn.execute(
+                    select(pk, column).where(pk > last_id, column.is_not(None)).order_by(pk).limit(batch_size)
+                ).all()
+                if not rows:
+                    break
+                conn.execute(stmt, [{"row_id": row[0], "value": row[1]} for row in rows])
+            last_id = rows[-1][0]
+            rewritten += len(rows)
+        stats[f"{table.name}.{column.name}"] = rewritten
+    return stats
+
+
+def main(argv=None):
+    from db import engine
+
+    parser = argparse.ArgumentParser(description="Пересжатие больших текстовых столбцов")
+    parser.add_argument("--vacuum", action="store_true", help="после перезаписи выполнить VACUUM")
+    args = parser.parse_args(argv)
+
+    for name, count in rewrite_all(engine).items():
+        print(f"{name}: {count} строк")
+    if args.vacuum:
+        with engine.connect() as conn:
+            conn.exec_driver_sql("VACUUM")
+        print("VACUUM выполнен")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,150 @@
+# Запись прогресса и избранного без чтения перед записью.
+#
+#   python user_state.py import progress.csv   # импорт прогресса группы
+#
+# Каждая операция — один INSERT ... ON CONFLICT по уникальным индексам
+# (user_id, lesson_id) и (user_id, course_id). Вставка идёт через SELECT из
+# lessons/courses/users, поэтому несуществующие уроки, курсы и пользователи
+# просто не дают строк, без отдельной проверки.
+import argparse
+import csv
+import sys
+import time
+from datetime import datetime
+
+from sqlalchemy import DateTime, Integer, bindparam, delete, select, true
+from sqlalchemy.dialects.sqlite import insert
+
+from models import Course, FavoriteCourse, Lesson, LessonProgress, User
+
+progress = LessonProgress.__table__
+favorites = FavoriteCourse.__table__
+lessons = Lesson.__table__
+courses = Course.__table__
+users = User.__table__
+
+# Строк в одном executemany при импорте
+IMPORT_CHUNK = 5000
+
+_user_id = bindparam("user_id", type_=Integer)
+_completed_at = bindparam("completed_at", type_=DateTime)
+
+_insert_progress = insert(progress).from_select(
+    ["user_id", "lesson_id", "is_completed", "completed_at"],
+    select(_user_id, lessons.c.id, true(), _completed_at).where(lessons.c.id == bindparam("lesson_id")),
+)
+_upsert_progress = _insert_progress.on_conflict_do_update(
+    index_elements=[progress.c.user_id, progress.c.lesson_id],
+    set_={"is_completed": True, "completed_at": _insert_progress.excluded.completed_at},
+)
+
+# Импорт дополнительно проверяет пользователя; более ранняя отметка
+# о прохождении не перезаписывается более поздней
+_import_select = (
+    select(users.c.id, lessons.c.id, true(), _completed_at)
+    .select_from(users.join(lessons, lessons.c.id == bindparam("lesson_id")))
+    .where(users.c.id == _user_id)
+)
+_insert_import = insert(progress).from_select(
+    ["user_id", "lesson_id", "is_completed", "completed_at"], _import_select
+)
+_upsert_import = _insert_import.on_conflict_do_update(
+    index_elements=[progress.c.user_id, progress.c.lesson_id],
+    set_={
+        "is_completed": True,
+        "completed_at": _insert_import.excluded.completed_at,
+    },
+    where=(progress.c.is_completed.is_(False)) | (progress.c.completed_at > _insert_import.excluded.completed_at),
+)
+
+_delete_favorite = delete(favorites).where(
+    favorites.c.user_id == bindparam("user_id"), favorites.c.course_id == bindparam("course_id")
+)
+_insert_favorite = (
+    insert(favorites)
+    .from_select(
+        ["user_id", "course_id"],
+        select(_user_id, courses.c.id).where(courses.c.id == bindparam("course_id")),
+    )
+    .on_conflict_do_nothing(index_elements=[favorites.c.user_id, favorites.c.course_id])
+)
+
+
+def mark_lessons_completed(conn, user_id: int, lesson_ids, completed_at=None) -> int:
+    # Возвращает число отмеченных уроков (несуществующие id пропускаются)
+    completed_at = completed_at or datetime.utcnow()
+    params = [
+        {"user_id": user_id, "lesson_id": lesson_id, "completed_at": completed_at}
+        for lesson_id in dict.fromkeys(lesson_ids)
+    ]
+    if not params:
+        return 0
+    return conn.execute(_upsert_progress, params).rowcount
+
+
+def import_progress(conn, records) -> int:
+    # records: итерируемое из словарей user_id, lesson_id, completed_at.
+    # Вставка идёт пачками по IMPORT_CHUNK в транзакции вызывающего кода.
+    now = datetime.utcnow()
+    imported = 0
+    batch = []
+    for record in records:
+        batch.append(
+            {
+                "user_id": int(record["user_id"]),
+                "lesson_id": int(record["lesson_id"]),
+                "completed_at": record.get("completed_at") or now,
+            }
+        )
+        if len(batch) >= IMPORT_CHUNK:
+            imported += conn.execute(_upsert_import, batch).rowcount
+            batch = []
+    if batch:
+        imported += conn.execute(_upsert_import, batch).rowcount
+    return imported
+
+
+def toggle_favorite(conn, user_id: int, course_id: int):
+    # Удаление и вставка в одной транзакции: True/False — новое состояние,
+    # None — курса нет. Одновременные переключения сериализуются блокировкой
+    # записи SQLite, которую берёт первый же DELETE.
+    params = {"user_id": user_id, "course_id": course_id}
+    if conn.execute(_delete_favorite, params).rowcount:
+        return False
+    if conn.execute(_insert_favorite, params).rowcount:
+        return True
+    return None
+
+
+def _read_csv(path):
+    # Столбцы: user_id, lesson_id и необязательный completed_at (ISO 8601)
+    with open(path, newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            completed_at = (row.get("completed_at") or "").strip()
+            yield {
+                "user_id": row["user_id"],
+                "lesson_id": row["lesson_id"],
+                "completed_at": datetime.fromisoformat(completed_at) if completed_at else None,
+            }
+
+
+def main(argv=None):
+    from db import engine
+    from migrations import upgrade
+
+    parser = argparse.ArgumentParser(description="Импорт прогресса учеников")
+    sub = parser.add_subparsers(dest="command", required=True)
+    import_parser = sub.add_parser("import", help="импорт из CSV (user_id,lesson_id[,completed_at])")
+    import_parser.add_argument("path")
+    args = parser.parse_args(argv)
+
+    # ON CONFLICT опирается на уникальные индексы из миграций
+    upgrade(engine)
+    started = time.perf_counter()
+    with engine.begin() as conn:
+        imported = import_progress(conn, _read_csv(args.path))
+    print(f"Импортировано записей: {imported} за {time.perf_counter() - started:.2f} с", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
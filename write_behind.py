@@ -0,0 +1,227 @@
+import json
+import queue
+import sqlite3
+import sys
+import threading
+import time
+import traceback
+
+from config import (
+    WRITE_BEHIND,
+    WRITE_BEHIND_BATCH,
+    WRITE_BEHIND_CLOSE_TIMEOUT,
+    WRITE_BEHIND_INTERVAL_MS,
+    WRITE_BEHIND_QUEUE,
+    WRITE_BEHIND_RETRIES,
+    WRITE_BEHIND_SUBMIT_TIMEOUT,
+)
+
+_STOP = object()
+# Пауза между повторами при занятой БД: удваивается до MAX_RETRY_DELAY
+RETRY_DELAY = 0.05
+MAX_RETRY_DELAY = 2.0
+
+
+def is_busy(exc) -> bool:
+    # Временная блокировка SQLite (database is locked, SQLITE_BUSY), в том
+    # числе обёрнутая в OperationalError SQLAlchemy
+    error = getattr(exc, "orig", None) or exc
+    if not isinstance(error, sqlite3.OperationalError):
+        return False
+    message = str(error).lower()
+    return "locked" in message or "busy" in message
+
+
+def read_dead_letter(path) -> list:
+    # Записи из файла отказов (по одной JSON-строке)
+    with open(path, encoding="utf-8") as file:
+        return [json.loads(line) for line in file if line.strip()]
+
+
+# Отложенная запись: submit() кладёт запись в ограниченную очередь и
+# возвращается, фоновый поток собирает пачку до max_batch записей или до
+# истечения max_delay с первой записи и передаёт её в flush одной
+# транзакцией. Занятая БД повторяется до retries раз; другие ошибки и
+# исчерпанные повторы пишутся в stderr, а записи — в файл dead_letter
+# (JSON-строки). Заполненная очередь притормаживает submit() до
+# submit_timeout секунд, и только потом запись уходит в файл отказов.
+# close() ждёт записи не дольше close_timeout.
+# При enabled=False запись выполняется сразу в вызывающем потоке.
+class WriteBehindWriter:
+    def __init__(
+        self,
+        flush,
+        name="write-behind",
+        enabled=WRITE_BEHIND,
+        max_batch=WRITE_BEHIND_BATCH,
+        max_delay=WRITE_BEHIND_INTERVAL_MS / 1000,
+        max_pending=WRITE_BEHIND_QUEUE,
+        retries=WRITE_BEHIND_RETRIES,
+        dead_letter=None,
+        close_timeout=WRITE_BEHIND_CLOSE_TIMEOUT,
+        submit_timeout=WRITE_BEHIND_SUBMIT_TIMEOUT,
+    ):
+        self.flush = flush
+        self.name = name
+        self.enabled = enabled
+        self.max_batch = max_batch
+        self.max_delay = max_delay
+        self.retries = retries
+        self.dead_letter = dead_letter
+        self.close_timeout = close_timeout
+        self.submit_timeout = submit_timeout
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._thread = None
+        self._closed = False
+        self._lock = threading.Lock()
+        self._dead_lock = threading.Lock()
+        # dead — записи в файле отказов, из них dropped — очередь не
+        # освободилась за submit_timeout
+        self._stats = {"written": 0, "batches": 0, "errors": 0, "dead": 0, "dropped": 0}
+
+    def start(self):
+        with self._lock:
+            if self.enabled and self._thread is None and not self._closed:
+                self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._thread.start()
+
+    def submit(self, record):
+        if not self.enabled or self._closed:
+            self.flush([record])
+            return
+        if self._thread is None:
+            self.start()
+        try:
+            self._queue.put(record, timeout=self.submit_timeout)
+        except queue.Full:
+            with self._lock:
+                self._stats["dropped"] += 1
+            self._reject([record], "очередь заполнена")
+
+    def _collect(self, first):
+        batch = [first]
+        deadline = time.monotonic() + self.max_delay
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if item is _STOP:
+                # Остановка: дописываем остаток очереди одной пачкой
+                self._queue.task_done()
+                return batch, True
+            batch.append(item)
+        return batch, False
+
+    def _flush_retrying(self, batch):
+        delay = RETRY_DELAY
+        for attempt in range(self.retries + 1):
+            try:
+                self.flush(batch)
+            except Exception as exc:
+                with self._lock:
+                    self._stats["errors"] += 1
+                if not is_busy(exc) or attempt == self.retries:
+                    raise
+                time.sleep(delay)
+                delay = min(delay * 2, MAX_RETRY_DELAY)
+            else:
+                with self._lock:
+                    self._stats["written"] += len(batch)
+                    self._stats["batches"] += 1
+                return
+
+    def _write(self, batch):
+        try:
+            self._flush_retrying(batch)
+        except Exception as exc:
+            print(f"{self.name}: ошибка записи пачки из {len(batch)}", file=sys.stderr)
+            traceback.print_exc()
+            if is_busy(exc) or len(batch) == 1:
+                self._reject(batch, "ошибка записи")
+            else:
+                # Одна некорректная запись не должна терять всю пачку
+                for record in batch:
+                    try:
+                        self._flush_retrying([record])
+                    except Exception:
+                        traceback.print_exc()
+                        self._reject([record], "ошибка записи")
+        for _ in batch:
+            self._queue.task_done()
+
+    def _reject(self, records, reason):
+        with self._lock:
+            self._stats["dead"] += len(records)
+        if self.dead_letter is None:
+            print(f"{self.name}: {reason}, потеряно записей: {len(records)}", file=sys.stderr)
+            return
+        lines = "".join(json.dumps(record, ensure_ascii=False, default=str) + "\n" for record in records)
+        try:
+            with self._dead_lock, open(self.dead_letter, "a", encoding="utf-8") as file:
+                file.write(lines)
+        except OSError:
+            print(f"{self.name}: {reason}, потеряно записей: {len(records)}", file=sys.stderr)
+            traceback.print_exc()
+            return
+        print(f"{self.name}: {reason}, записей в {self.dead_letter}: {len(records)}", file=sys.stderr)
+
+    def _run(self):
+        while True:
+            first = self._queue.get()
+            if first is _STOP:
+                self._queue.task_done()
+                return
+            batch, stop = self._collect(first)
+            self._write(batch)
+            if stop:
+                return
+
+    def join(self):
+        # Дождаться записи всего, что уже отправлено
+        if self._thread is not None:
+            self._queue.join()
+
+    def close(self):
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            thread = self._thread
+        if thread is None:
+            return
+        deadline = time.monotonic() + self.close_timeout
+        try:
+            self._queue.put(_STOP, timeout=self.close_timeout)
+        except queue.Full:
+            pass
+        thread.join(max(deadline - time.monotonic(), 0))
+        if thread.is_alive():
+            print(f"{self.name}: запись не завершилась за {self.close_timeout} с", file=sys.stderr)
+        # Записи, отправленные одновременно с остановкой; если поток записи
+        # не успел (БД недоступна), остаток очереди — в файл отказов
+        rest = []
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is _STOP:
+                self._queue.task_done()
+            else:
+                rest.append(item)
+        if not rest:
+            return
+        if thread.is_alive():
+            self._reject(rest, "остановка")
+            for _ in rest:
+                self._queue.task_done()
+        else:
+            self._write(rest)
+
+    def stats(self):
+        with self._lock:
+            return {**self._stats, "pending": self._queue.qsize(), "enabled": self.enabled}